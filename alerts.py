@@ -0,0 +1,213 @@
+"""
+Price-drop alerts
+
+Users ask to be told when a product's price on a platform falls to their
+target.  Alerts for each (product, platform) are kept sorted by target
+price, so when the catalog reports new prices only the alerts whose target
+was crossed are looked at, never the whole list.  Triggered alerts are sent
+by a small pool of workers through the outbound scheduler at NOTIFICATION
+priority, so a big drop on a popular product is paced by the rate limiter
+and never delays interactive replies.
+"""
+import asyncio
+import bisect
+import logging
+
+from telegram.constants import ParseMode
+from telegram.error import Forbidden
+
+from catalog import add_change_listener, get_catalog
+from config import ALERT_FANOUT_WORKERS
+from live_stats import LIVE_STATS
+from outbound import NOTIFICATION, get_scheduler
+from persistence import owns_chat
+from utils import format_price_alert, create_product_link_keyboard
+
+logger = logging.getLogger(__name__)
+
+# Hash in the shared state store; fields are "chat_id:product_id:platform"
+STORE_KEY = "shopsavvy:price_alerts"
+
+class PriceAlertIndex:
+    """Alerts sorted by target price for every (product_id, platform)"""
+
+    def __init__(self):
+        self.by_product = {}  # (product_id, platform) -> sorted [(target, chat_id)]
+        self.by_chat = {}     # chat_id -> {(product_id, platform): target}
+
+    def __len__(self):
+        return sum(len(alerts) for alerts in self.by_chat.values())
+
+    def add(self, chat_id, product_id, platform, target):
+        """Add an alert, replacing the chat's previous target for the same deal"""
+        self.remove(chat_id, product_id, platform)
+        bisect.insort(self.by_product.setdefault((product_id, platform), []), (target, chat_id))
+        self.by_chat.setdefault(chat_id, {})[(product_id, platform)] = target
+
+    def remove(self, chat_id, product_id, platform):
+        """Remove an alert, returning whether it existed"""
+        alerts = self.by_chat.get(chat_id, {})
+        target = alerts.pop((product_id, platform), None)
+        if target is None:
+            return False
+        if not alerts:
+            del self.by_chat[chat_id]
+
+        entries = self.by_product[(product_id, platform)]
+        del entries[bisect.bisect_left(entries, (target, chat_id))]
+        if not entries:
+            del self.by_product[(product_id, platform)]
+        return True
+
+    def crossed(self, product_id, platform, price):
+        """Remove and return [(chat_id, target)] for alerts with target >= price"""
+        entries = self.by_product.get((product_id, platform))
+        if not entries:
+            return []
+
+        start = bisect.bisect_left(entries, (price,))
+        hits = [(chat_id, target) for target, chat_id in entries[start:]]
+        del entries[start:]
+        if not entries:
+            del self.by_product[(product_id, platform)]
+
+        for chat_id, _ in hits:
+            alerts = self.by_chat[chat_id]
+            del alerts[(product_id, platform)]
+            if not alerts:
+                del self.by_chat[chat_id]
+        return hits
+
+    def for_chat(self, chat_id):
+        """{(product_id, platform): target} for one chat"""
+        return dict(self.by_chat.get(chat_id, {}))
+
+    def product_ids(self):
+        return {product_id for product_id, _ in self.by_product}
+
+class PriceAlerts:
+    """Price alert subscriptions for the chats this worker owns"""
+
+    def __init__(self, workers=ALERT_FANOUT_WORKERS):
+        self.index = PriceAlertIndex()
+        self.workers = workers
+        self.store = None
+        self.sent = 0
+        self._fan_outs = set()
+
+    def __len__(self):
+        return len(self.index)
+
+    @staticmethod
+    def _field(chat_id, product_id, platform):
+        return f"{chat_id}:{product_id}:{platform}"
+
+    async def load(self, store=None):
+        """Load the alerts of chats this worker owns from the shared store"""
+        self.store = store
+        if store is not None:
+            raw = await asyncio.to_thread(store.hgetall, STORE_KEY)
+            for field, target in raw.items():
+                if isinstance(field, bytes):
+                    field, target = field.decode(), target.decode()
+                chat_id, product_id, platform = field.split(':')
+                if owns_chat(int(chat_id)):
+                    self.index.add(int(chat_id), int(product_id), platform, int(target))
+            logger.info(f"🔔 Loaded {len(self.index)} price alerts")
+        LIVE_STATS.alerts = len(self.index)
+
+    async def subscribe(self, chat_id, product_id, platform, target):
+        self.index.add(chat_id, product_id, platform, target)
+        LIVE_STATS.alerts = len(self.index)
+        if self.store is not None:
+            await asyncio.to_thread(
+                self.store.hset, STORE_KEY, self._field(chat_id, product_id, platform), str(target)
+            )
+
+    async def unsubscribe(self, chat_id, product_id, platform):
+        removed = self.index.remove(chat_id, product_id, platform)
+        LIVE_STATS.alerts = len(self.index)
+        if removed and self.store is not None:
+            await asyncio.to_thread(self.store.hdel, STORE_KEY, self._field(chat_id, product_id, platform))
+        return removed
+
+    def _watching(self, chat_id, product_id, platform):
+        """Whether a chat currently has an alert on a deal"""
+        return (product_id, platform) in self.index.by_chat.get(chat_id, {})
+
+    def alerts_for(self, chat_id):
+        return self.index.for_chat(chat_id)
+
+    def on_catalog_changed(self, product_ids):
+        """Catalog change listener: notify alerts whose target the new prices crossed"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Offline tooling; the alerts fire on the next change seen by the bot
+            return
+
+        watched = self.index.product_ids()
+        if product_ids is not None:
+            watched &= set(product_ids)
+        if not watched:
+            return
+
+        for product in get_catalog().get_products(sorted(watched)):
+            for platform, deal in product['deals'].items():
+                if not deal:
+                    continue
+                hits = self.index.crossed(product['id'], platform, deal['discount_price'])
+                if hits:
+                    fan_out = loop.create_task(self._fan_out(product, platform, deal['discount_price'], hits))
+                    self._fan_outs.add(fan_out)
+                    fan_out.add_done_callback(self._fan_outs.discard)
+        LIVE_STATS.alerts = len(self.index)
+
+    async def _fan_out(self, product, platform, price, hits):
+        """Send triggered alerts with a fixed number of concurrent senders.
+
+        crossed() already took the alerts out of the index so a second price
+        change can't trigger them twice; alerts that failed to send are put
+        back and fire again on the product's next price change.  Chats that
+        blocked the bot lose theirs.
+        """
+        scheduler = get_scheduler()
+        keyboard = create_product_link_keyboard(product, platform)
+        pending = iter(hits)
+        failed = []
+
+        async def worker():
+            for chat_id, target in pending:
+                try:
+                    await scheduler.send('sendMessage', {
+                        'chat_id': chat_id,
+                        'text': format_price_alert(product, platform, price, target),
+                        'reply_markup': keyboard,
+                        'parse_mode': ParseMode.MARKDOWN
+                    }, NOTIFICATION)
+                    self.sent += 1
+                except Forbidden as e:
+                    logger.warning(f"Dropping price alert for {chat_id}: {e}")
+                except Exception as e:
+                    logger.error(f"Error sending price alert to {chat_id}: {e}")
+                    failed.append((chat_id, target))
+
+        await asyncio.gather(*(worker() for _ in range(min(self.workers, len(hits)))))
+        logger.info(f"🔔 Sent {len(hits) - len(failed)} of {len(hits)} price alerts for {product['name']} on {platform.title()}")
+
+        for chat_id, target in failed:
+            # Unless the chat set a new alert for this deal meanwhile
+            if not self._watching(chat_id, product['id'], platform):
+                self.index.add(chat_id, product['id'], platform, target)
+        LIVE_STATS.alerts = len(self.index)
+
+        # Alerts back in the index (retried, or set again meanwhile) keep their stored field
+        fields = [
+            self._field(chat_id, product['id'], platform) for chat_id, _ in hits
+            if not self._watching(chat_id, product['id'], platform)
+        ]
+        if fields and self.store is not None:
+            await asyncio.to_thread(self.store.hdel, STORE_KEY, *fields)
+
+PRICE_ALERTS = PriceAlerts()
+add_change_listener(PRICE_ALERTS.on_catalog_changed)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: shared static keyboards vs rebuilding them per update
+
+Both sides serialize the way python-telegram-bot does when it sends a
+reply_markup: to_dict(), then json.dumps() of the result.
+
+Run from the project root:
+
+    TELEGRAM_BOT_TOKEN=dummy python benchmarks/keyboard_benchmark.py
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import (
+    create_main_menu_keyboard, create_platform_keyboard,
+    create_category_keyboard, create_deal_type_keyboard
+)
+
+BUILDERS = [
+    create_main_menu_keyboard, create_platform_keyboard,
+    create_category_keyboard, create_deal_type_keyboard
+]
+
+def rebuild_and_serialize(builder):
+    """What every handler paid before: build the markup, then serialize it as a request does"""
+    return json.dumps(builder.__wrapped__().to_dict())
+
+def shared_and_serialize(builder):
+    """Shared instance whose payload dict is cached at construction; only json.dumps runs per send"""
+    return json.dumps(builder().to_dict())
+
+def main(number=20000):
+    for builder in BUILDERS:
+        builder()  # Build the shared instances outside the timed loop
+
+        before = timeit.timeit(lambda: rebuild_and_serialize(builder), number=number)
+        after = timeit.timeit(lambda: shared_and_serialize(builder), number=number)
+
+        print(
+            f"{builder.__name__:28} rebuild {before / number * 1e6:8.2f}µs  "
+            f"shared {after / number * 1e6:8.2f}µs  ({before / after:5.1f}x faster)"
+        )
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,42 @@
 """
 Telegram bot handlers for ShopSavvy deal finder bot
 """
+import asyncio
 import logging
+import re
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 from telegram.constants import ParseMode
 
-from config import PLATFORM_SELECTION, PRODUCT_SEARCH, CATEGORY_SEARCH, DEAL_TYPE_SELECTION
-from mock_data import search_products, MOCK_PRODUCTS
+from alerts import PRICE_ALERTS
+from broadcast import get_broadcast_store
+from catalog import get_catalog
+from deal_filters import DEAL_TYPE_NAMES, find_deals
+from config import PLATFORM_SELECTION, PRODUCT_SEARCH, CATEGORY_SEARCH, DEAL_TYPE_SELECTION, PRICE_ALERT
+from cache import cached_search, browse_category, snapshot_search, get_snapshot, snapshot_page
+from delivery import send_deal_results, send_result_page, edit_result_page
+from metrics import instrumented
+from outbound import reply_text, edit_message_text
+from trending import record_search
 from utils import (
-    format_deal_message, format_trending_deals, format_festival_deals,
+    format_trending_deals, format_festival_deals,
     create_platform_keyboard, create_category_keyboard, 
     create_deal_type_keyboard, create_main_menu_keyboard, 
-    get_product_link, create_product_link_keyboard
+    create_category_search_keyboard, create_category_page_keyboard,
+    get_product_link, create_product_link_keyboard,
+    format_price, format_price_alert_list, create_price_alert_keyboard
 )
 
 logger = logging.getLogger(__name__)
 
+# "<product name> under|below|@|₹|rs <target price>", e.g. "iPhone 15 Pro under ₹1,10,000"; the marker
+# keeps numbers that are part of a name ("iPhone 15") from being read as the target
+PRICE_ALERT_PATTERN = re.compile(
+    r'^(.+?)\s*(?:\b(?:under|below)\s|@|₹|\brs\.?)\s*(?:₹|rs\.?)?\s*([\d,]+(?:\.\d+)?)$',
+    re.IGNORECASE
+)
+
+@instrumented
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command"""
     welcome_message = """
@@ -33,7 +53,11 @@ What would you like to do today?
     
     keyboard = create_main_menu_keyboard()
     
-    await update.message.reply_text(
+    # Festival and trending deal broadcasts; /unsubscribe opts out
+    await asyncio.to_thread(get_broadcast_store().subscribe, update.effective_chat.id)
+    
+    await reply_text(
+        update.message,
         welcome_message.strip(),
         reply_markup=keyboard,
         parse_mode=ParseMode.MARKDOWN
@@ -41,6 +65,7 @@ What would you like to do today?
     
     return PLATFORM_SELECTION
 
+@instrumented
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /help command"""
     help_text = """
@@ -50,6 +75,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /start - Start the bot
 /help - Show this help message
 /deals - Browse trending deals
+/alerts - Manage your price alerts
+/unsubscribe - Stop deal broadcasts
 
 **How to use:**
 1️⃣ Choose a platform or search all platforms
@@ -63,30 +90,35 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 🎟️ Coupon codes and cashback info
 🔥 Trending deals
 🎉 Festival sale alerts
+🔔 Price drop alerts
 
 Need help? Just type your product name!
     """
     
     keyboard = create_main_menu_keyboard()
     
-    await update.message.reply_text(
+    await reply_text(
+        update.message,
         help_text.strip(),
         reply_markup=keyboard,
         parse_mode=ParseMode.MARKDOWN
     )
 
+@instrumented
 async def deals_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /deals command"""
     trending_message = format_trending_deals()
     
     keyboard = create_main_menu_keyboard()
     
-    await update.message.reply_text(
+    await reply_text(
+        update.message,
         trending_message,
         reply_markup=keyboard,
         parse_mode=ParseMode.MARKDOWN
     )
 
+@instrumented
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle button callbacks"""
     query = update.callback_query
@@ -97,18 +129,35 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if data.startswith('platform_'):
         platform = data.replace('platform_', '')
         context.user_data['selected_platform'] = platform
+        category = context.user_data.get('selected_category')
         
-        await query.edit_message_text(
+        if category:
+            await edit_message_text(
+                query.message,
+                f"✅ Selected: {platform.title() if platform != 'all' else 'All Platforms'}\n\n"
+                f"📂 Send a product name to search within {category.title()}, "
+                f"or browse the whole category.\n\n"
+                f"🏷️ You can also pick a deal type below:",
+                reply_markup=create_category_search_keyboard(category, platform),
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return PRODUCT_SEARCH
+        
+        await edit_message_text(
+            query.message,
             f"✅ Selected: {platform.title() if platform != 'all' else 'All Platforms'}\n\n"
             f"Now, what product are you looking for?\n"
-            f"💡 Try: smartphones, shirts, home appliances, electronics",
+            f"💡 Try: smartphones, shirts, home appliances, electronics\n\n"
+            f"🏷️ Or pick a deal type below:",
+            reply_markup=create_deal_type_keyboard(),
             parse_mode=ParseMode.MARKDOWN
         )
         return PRODUCT_SEARCH
     
     elif data == 'search_products':
         keyboard = create_platform_keyboard()
-        await query.edit_message_text(
+        await edit_message_text(
+            query.message,
             "🏪 **Choose Platform** 🏪\n\n"
             "Would you like to search one platform or compare deals across all?",
             reply_markup=keyboard,
@@ -118,7 +167,8 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     elif data == 'browse_categories':
         keyboard = create_category_keyboard()
-        await query.edit_message_text(
+        await edit_message_text(
+            query.message,
             "📂 **Browse by Category** 📂\n\n"
             "Select a category to explore:",
             reply_markup=keyboard,
@@ -131,7 +181,8 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data['selected_category'] = category
         
         keyboard = create_platform_keyboard()
-        await query.edit_message_text(
+        await edit_message_text(
+            query.message,
             f"📂 **Category:** {category.title()}\n\n"
             f"🏪 **Choose Platform:**",
             reply_markup=keyboard,
@@ -139,11 +190,76 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return PLATFORM_SELECTION
     
+    elif data.startswith('pg_'):
+        snapshot_id, offset = data[3:].rsplit('_', 1)
+        offset = int(offset)
+        snapshot = get_snapshot(snapshot_id)
+        page = snapshot_page(snapshot, offset) if snapshot else None
+        
+        if page is None:
+            await reply_text(
+                query.message,
+                "⌛ These results have expired. Please search again!",
+                reply_markup=create_main_menu_keyboard()
+            )
+            return
+        
+        await edit_result_page(query.message, snapshot_id, snapshot, page, offset)
+    
+    elif data.startswith('catpage_'):
+        _, platform, offset, category = data.split('_', 3)
+        category = category.replace('_', ' ')
+        offset = int(offset)
+        context.user_data.clear()
+        
+        scope = f" on {platform.title()}" if platform != 'all' else ""
+        total, results = browse_category(category, platform, offset)
+        
+        if not results:
+            await edit_message_text(
+                query.message,
+                f"📂 No deals in {category.title()}{scope} yet.\n\n"
+                f"💡 Try another category or search for a product.",
+                reply_markup=create_main_menu_keyboard(),
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return ConversationHandler.END
+        
+        await edit_message_text(
+            query.message,
+            f"📂 **{category.title()}**{scope}: deals {offset + 1}-{offset + len(results)} of {total}",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        
+        next_offset = offset + len(results)
+        await send_deal_results(
+            query.message,
+            results,
+            label="Deal",
+            footer_text="✅ **That's this page!** What would you like to do next?",
+            footer_keyboard=create_category_page_keyboard(
+                category, platform, next_offset if next_offset < total else None
+            )
+        )
+        return ConversationHandler.END
+    
+    elif data == 'deal_types':
+        keyboard = create_deal_type_keyboard()
+        await edit_message_text(
+            query.message,
+            "🏷️ **Browse by Deal Type** 🏷️\n\n"
+            "What kind of offer are you looking for?",
+            reply_markup=keyboard,
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return DEAL_TYPE_SELECTION
+    
     elif data == 'trending_deals':
         trending_message = format_trending_deals()
         keyboard = create_main_menu_keyboard()
         
-        await query.edit_message_text(
+        await edit_message_text(
+            query.message,
             trending_message,
             reply_markup=keyboard,
             parse_mode=ParseMode.MARKDOWN
@@ -153,7 +269,8 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         festival_message = format_festival_deals()
         keyboard = create_main_menu_keyboard()
         
-        await query.edit_message_text(
+        await edit_message_text(
+            query.message,
             festival_message,
             reply_markup=keyboard,
             parse_mode=ParseMode.MARKDOWN
@@ -167,6 +284,8 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /start - Start the bot
 /help - Show this help message
 /deals - Browse trending deals
+/alerts - Manage your price alerts
+/unsubscribe - Stop deal broadcasts
 
 **How to use:**
 1️⃣ Choose a platform or search all platforms
@@ -180,50 +299,106 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 🎟️ Coupon codes and cashback info
 🔥 Trending deals
 🎉 Festival sale alerts
+🔔 Price drop alerts
 
 Need help? Just type your product name!
         """
         
         keyboard = create_main_menu_keyboard()
         
-        await query.edit_message_text(
+        await edit_message_text(
+            query.message,
             help_text.strip(),
             reply_markup=keyboard,
             parse_mode=ParseMode.MARKDOWN
         )
     
+    elif data == 'price_alert':
+        await edit_message_text(
+            query.message,
+            "🔔 **Price Alerts** 🔔\n\n"
+            "Send me a product and your target price, and I'll message you when it drops that low.\n\n"
+            "💡 Example: `iPhone 15 Pro under ₹110000`\n\n"
+            "Use /alerts to see your alerts.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return PRICE_ALERT
+    
+    elif data.startswith('unalert_'):
+        _, product_id, platform = data.split('_', 2)
+        await PRICE_ALERTS.unsubscribe(query.message.chat_id, int(product_id), platform)
+        
+        message, keyboard = price_alert_list(query.message.chat_id)
+        await edit_message_text(
+            query.message,
+            message,
+            reply_markup=keyboard,
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
     elif data.startswith('dealtype_'):
-        deal_type = data.replace('dealtype_', '').replace('_', ' ')
+        deal_type = data.replace('dealtype_', '')
+        deal_type_name = DEAL_TYPE_NAMES.get(deal_type, deal_type.replace('_', ' ').title())
+        platform = context.user_data.get('selected_platform', 'all')
+        category = context.user_data.get('selected_category')
+        
+        # Narrowed to the platform and category picked earlier in the conversation
+        scope = ""
+        if category:
+            scope += f" in {category.title()}"
+        if platform != 'all':
+            scope += f" on {platform.title()}"
+        
+        total, results = find_deals(deal_type, platform, category)
+        context.user_data.clear()
+        
+        if not results:
+            await edit_message_text(
+                query.message,
+                f"❌ No {deal_type_name}{scope} right now.\n\n"
+                f"💡 Try another deal type or search for a product.",
+                reply_markup=create_main_menu_keyboard(),
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return ConversationHandler.END
         
-        await query.edit_message_text(
-            f"✅ Looking for: {deal_type.title()}\n\n"
-            f"This feature will be available in the next update! 🚀\n\n"
-            f"For now, try searching for specific products.",
+        await edit_message_text(
+            query.message,
+            f"🏷️ **Found {total} {deal_type_name}{scope}**\n\nHere are the best ones:",
             parse_mode=ParseMode.MARKDOWN
         )
+        
+        await send_deal_results(
+            query.message,
+            results,
+            label="Deal",
+            footer_text="✅ **All deals shown!** What would you like to do next?",
+            footer_keyboard=create_main_menu_keyboard()
+        )
+        return ConversationHandler.END
 
+@instrumented
 async def handle_product_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle product search input"""
     query = update.message.text.lower().strip()
     platform = context.user_data.get('selected_platform', 'all')
     category = context.user_data.get('selected_category')
     
-    # If category was selected, search within that category
-    if category:
-        search_query = category.lower()
-    else:
-        search_query = query
-    
-    await update.message.reply_text("🔍 Searching for deals... Please wait!")
+    # If a category was selected, search within it
+    search_query = query
+    scope = f" in {category.title()}" if category else ""
     
     try:
-        # Search products
-        results = search_products(search_query, platform)
+        # Search products, keeping the ranked results for paging
+        snapshot_id, snapshot = snapshot_search(
+            search_query, platform, category, title=f"Deals for '{search_query}'{scope}"
+        )
         
-        if not results:
+        if not snapshot.product_ids:
             keyboard = create_main_menu_keyboard()
-            await update.message.reply_text(
-                f"❌ Sorry, I couldn't find any offers matching '{search_query}'. "
+            await reply_text(
+                update.message,
+                f"❌ Sorry, I couldn't find any offers matching '{search_query}'{scope}. "
                 f"Try different keywords or check back later.\n\n"
                 f"💡 **Suggestions:**\n"
                 f"• Try broader terms like 'phone' instead of specific models\n"
@@ -234,49 +409,9 @@ async def handle_product_search(update: Update, context: ContextTypes.DEFAULT_TY
             )
             return ConversationHandler.END
         
-        # Send header message
-        await update.message.reply_text(
-            f"🎯 **Found {len(results)} deals for '{search_query}'**\n\nLet me show you the best deals:",
-            parse_mode=ParseMode.MARKDOWN
-        )
-        
-        # Send each product with image and shopping links
-        for i, product in enumerate(results, 1):
-            deal_message = format_deal_message(product, platform)
-            product_keyboard = create_product_link_keyboard(product, platform)
-            
-            try:
-                # Send photo with deal info and shopping buttons
-                if product.get('image_url'):
-                    await update.message.reply_photo(
-                        photo=product['image_url'],
-                        caption=f"**Deal {i}/{len(results)}**\n\n{deal_message}",
-                        reply_markup=product_keyboard,
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                else:
-                    # Fallback to text message if no image
-                    await update.message.reply_text(
-                        f"**Deal {i}/{len(results)}**\n\n{deal_message}",
-                        reply_markup=product_keyboard,
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-            except Exception as e:
-                logger.error(f"Error sending image for {product['name']}: {e}")
-                # Fallback to text message
-                await update.message.reply_text(
-                    f"**Deal {i}/{len(results)}**\n\n{deal_message}",
-                    reply_markup=product_keyboard,
-                    parse_mode=ParseMode.MARKDOWN
-                )
-        
-        # Send final menu
-        keyboard = create_main_menu_keyboard()
-        await update.message.reply_text(
-            "✅ **All deals shown!** What would you like to do next?",
-            reply_markup=keyboard,
-            parse_mode=ParseMode.MARKDOWN
-        )
+        # One message with the best deal; Prev/Next edit it in place
+        record_search(snapshot.product_ids)
+        await send_result_page(update.message, snapshot_id, snapshot, snapshot_page(snapshot, 0))
         
         # Clear user data
         context.user_data.clear()
@@ -284,7 +419,8 @@ async def handle_product_search(update: Update, context: ContextTypes.DEFAULT_TY
     except Exception as e:
         logger.error(f"Error in product search: {e}")
         keyboard = create_main_menu_keyboard()
-        await update.message.reply_text(
+        await reply_text(
+            update.message,
             "❌ **Oops! Something went wrong** ❌\n\n"
             "Our deal-finding robots are taking a quick break. "
             "Please try again in a moment!\n\n"
@@ -298,18 +434,128 @@ async def handle_product_search(update: Update, context: ContextTypes.DEFAULT_TY
     
     return ConversationHandler.END
 
+@instrumented
+async def handle_price_alert(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle the product and target price for a new price alert"""
+    match = PRICE_ALERT_PATTERN.match(update.message.text.strip())
+    if not match:
+        await reply_text(
+            update.message,
+            "❓ Please send the product name, then `under`, `@` or `₹` and your target price.\n\n"
+            "💡 Example: `iPhone 15 Pro under ₹110000`",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return PRICE_ALERT
+    
+    query = match.group(1).lower().strip()
+    target = int(float(match.group(2).replace(',', '')))
+    platform = context.user_data.get('selected_platform', 'all')
+    keyboard = create_main_menu_keyboard()
+    
+    results = cached_search(query, platform)
+    if not results:
+        await reply_text(
+            update.message,
+            f"❌ Sorry, I couldn't find '{query}'. Try the name as it appears in search results.",
+            reply_markup=keyboard,
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return ConversationHandler.END
+    
+    # Watch the selected platform, or the one that's cheapest right now
+    product = results[0][0]
+    if platform == 'all':
+        platform, deal = min(
+            ((p, d) for p, d in product['deals'].items() if d),
+            key=lambda item: item[1]['discount_price']
+        )
+    else:
+        deal = product['deals'][platform]
+    
+    if deal['discount_price'] <= target:
+        await reply_text(
+            update.message,
+            f"✅ Good news! **{product['name']}** is already {format_price(deal['discount_price'])} "
+            f"on {platform.title()}, within your target of {format_price(target)}.",
+            reply_markup=create_product_link_keyboard(product, platform),
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return ConversationHandler.END
+    
+    await PRICE_ALERTS.subscribe(update.effective_chat.id, product['id'], platform, target)
+    await reply_text(
+        update.message,
+        f"🔔 **Alert set!**\n\n"
+        f"I'll message you when **{product['name']}** on {platform.title()} drops to "
+        f"{format_price(target)} or less (now {format_price(deal['discount_price'])}).",
+        reply_markup=keyboard,
+        parse_mode=ParseMode.MARKDOWN
+    )
+    
+    context.user_data.clear()
+    return ConversationHandler.END
+
+def price_alert_list(chat_id):
+    """Message and keyboard listing a chat's price alerts"""
+    alerts = PRICE_ALERTS.alerts_for(chat_id)
+    products = {
+        product['id']: product
+        for product in get_catalog().get_products(sorted({product_id for product_id, _ in alerts}))
+    }
+    return format_price_alert_list(alerts, products), create_price_alert_keyboard(alerts)
+
+@instrumented
+async def alerts_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /alerts command"""
+    message, keyboard = price_alert_list(update.effective_chat.id)
+    
+    await reply_text(
+        update.message,
+        message,
+        reply_markup=keyboard,
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+@instrumented
+async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /subscribe command"""
+    await asyncio.to_thread(get_broadcast_store().subscribe, update.effective_chat.id)
+    await reply_text(
+        update.message,
+        "📣 **Subscribed!** I'll let you know when big sales start and send the day's trending deals.\n\n"
+        "Send /unsubscribe to stop.",
+        reply_markup=create_main_menu_keyboard(),
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+@instrumented
+async def unsubscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /unsubscribe command"""
+    await asyncio.to_thread(get_broadcast_store().unsubscribe, update.effective_chat.id)
+    await reply_text(
+        update.message,
+        "🔕 **Unsubscribed.** You won't get deal broadcasts any more.\n\n"
+        "Send /subscribe to get them again.",
+        reply_markup=create_main_menu_keyboard(),
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+@instrumented
 async def handle_invalid_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle invalid input during conversation"""
-    await update.message.reply_text(
+    await reply_text(
+        update.message,
         "❓ I didn't understand that. Please try again or use the menu buttons below.",
         reply_markup=create_main_menu_keyboard(),
         parse_mode=ParseMode.MARKDOWN
     )
 
+@instrumented
 async def cancel_conversation(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Cancel the current conversation"""
     keyboard = create_main_menu_keyboard()
-    await update.message.reply_text(
+    await reply_text(
+        update.message,
         "✅ **Operation cancelled**\n\nWhat would you like to do next?",
         reply_markup=keyboard,
         parse_mode=ParseMode.MARKDOWN
@@ -318,6 +564,7 @@ async def cancel_conversation(update: Update, context: ContextTypes.DEFAULT_TYPE
     context.user_data.clear()
     return ConversationHandler.END
 
+@instrumented
 async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle direct text messages (product searches)"""
     query = update.message.text.lower().strip()
@@ -326,14 +573,13 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
     if query.startswith('/'):
         return
     
-    await update.message.reply_text("🔍 Let me search for deals on that...")
-    
     # Search across all platforms by default
-    results = search_products(query, 'all')
+    snapshot_id, snapshot = snapshot_search(query, 'all', title=f"Results for '{query}'")
     
-    if not results:
+    if not snapshot.product_ids:
         keyboard = create_main_menu_keyboard()
-        await update.message.reply_text(
+        await reply_text(
+            update.message,
             f"❌ No deals found for '{query}'\n\n"
             f"💡 **Try:**\n"
             f"• More general terms (e.g., 'phone' instead of 'iPhone 15 Pro')\n"
@@ -344,37 +590,12 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
         return
     
-    # Send results with images
-    for i, product in enumerate(results, 1):
-        deal_message = format_deal_message(product, 'all')
-        keyboard = create_main_menu_keyboard() if i == len(results) else None
-        
-        try:
-            # Send photo with deal info
-            if product.get('image_url'):
-                await update.message.reply_photo(
-                    photo=product['image_url'],
-                    caption=f"**Result {i}/{len(results)}**\n\n{deal_message}",
-                    reply_markup=keyboard,
-                    parse_mode=ParseMode.MARKDOWN
-                )
-            else:
-                # Fallback to text message if no image
-                await update.message.reply_text(
-                    f"**Result {i}/{len(results)}**\n\n{deal_message}",
-                    reply_markup=keyboard,
-                    parse_mode=ParseMode.MARKDOWN
-                )
-        except Exception as e:
-            logger.error(f"Error sending image for {product['name']}: {e}")
-            # Fallback to text message
-            await update.message.reply_text(
-                f"**Result {i}/{len(results)}**\n\n{deal_message}",
-                reply_markup=keyboard,
-                parse_mode=ParseMode.MARKDOWN
-            )
+    # One message with the best result; Prev/Next edit it in place
+    record_search(snapshot.product_ids)
+    await send_result_page(update.message, snapshot_id, snapshot, snapshot_page(snapshot, 0))
 
 # Error handler
+@instrumented
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
     """Handle errors"""
     logger.error(f'Update {update} caused error {context.error}')
@@ -382,7 +603,8 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
     try:
         if update and hasattr(update, 'message') and update.message:
             from utils import create_main_menu_keyboard
-            await update.message.reply_text(
+            await reply_text(
+                update.message,
                 "❌ **Something went wrong!**\n\n"
                 "Please try again or contact support if the issue persists.",
                 reply_markup=create_main_menu_keyboard(),
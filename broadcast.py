@@ -0,0 +1,260 @@
+"""
+Scheduled broadcasts of festival and trending deals to subscribers
+
+Subscribers live in SQLite and are read in chunks of chat ids, so a
+broadcast never holds the whole list in memory.  The message is rendered
+once and stored with the broadcast.  Each chunk is sent by a fixed pool of
+workers through the outbound scheduler at BROADCAST priority, which paces
+it with the rate limiter behind interactive replies.  After every chunk the
+last chat id is checkpointed; a broadcast interrupted by a crash or deploy
+resumes from there on the next start.
+"""
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime, time as dt_time
+from zoneinfo import ZoneInfo
+
+from telegram.constants import ParseMode
+
+from catalog import get_catalog
+from config import (
+    BROADCAST_DB_PATH, BROADCAST_CHUNK_SIZE, BROADCAST_WORKERS, BROADCAST_TIMEZONE,
+    FESTIVAL_BROADCAST_HOUR, TRENDING_BROADCAST_TIME, WORKER_URL
+)
+from metrics import REGISTRY
+from outbound import BROADCAST, get_scheduler
+from persistence import owns_chat
+from utils import format_festival_announcement, format_trending_deals, create_main_menu_keyboard
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_MESSAGES = REGISTRY.counter(
+    'shopsavvy_broadcast_messages_total', 'Broadcast messages by result', ('result',)
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscribers (
+    chat_id INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    last_chat_id INTEGER NOT NULL DEFAULT 0,
+    sent INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    started_at REAL NOT NULL,
+    finished_at REAL
+);
+"""
+
+class BroadcastStore:
+    """Subscribers and broadcast checkpoints in SQLite"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self.connection as connection:
+            connection.executescript(SCHEMA)
+
+    @property
+    def connection(self):
+        """One connection per thread, since lookups run in worker threads"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = sqlite3.connect(self.path)
+            connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    def subscribe(self, chat_id):
+        with self.connection as connection:
+            connection.execute("INSERT OR IGNORE INTO subscribers (chat_id) VALUES (?)", (chat_id,))
+
+    def unsubscribe(self, chat_id):
+        with self.connection as connection:
+            return connection.execute("DELETE FROM subscribers WHERE chat_id = ?", (chat_id,)).rowcount > 0
+
+    def unsubscribe_many(self, chat_ids):
+        with self.connection as connection:
+            connection.executemany("DELETE FROM subscribers WHERE chat_id = ?", [(c,) for c in chat_ids])
+
+    def count(self):
+        return self.connection.execute("SELECT COUNT(*) FROM subscribers").fetchone()[0]
+
+    def subscriber_chunk(self, after, limit=BROADCAST_CHUNK_SIZE):
+        """Up to limit subscriber chat ids greater than after, in order"""
+        rows = self.connection.execute(
+            "SELECT chat_id FROM subscribers WHERE chat_id > ? ORDER BY chat_id LIMIT ?", (after, limit)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def start(self, broadcast_id, text):
+        """Create a broadcast, or return the saved state of an existing one.
+
+        Returns a dict with text, last_chat_id, sent, failed and finished_at.
+        """
+        with self.connection as connection:
+            connection.execute(
+                "INSERT OR IGNORE INTO broadcasts (id, text, last_chat_id, started_at) VALUES (?, ?, ?, ?)",
+                (broadcast_id, text, -2 ** 63, time.time())
+            )
+            row = connection.execute(
+                "SELECT text, last_chat_id, sent, failed, finished_at FROM broadcasts WHERE id = ?",
+                (broadcast_id,)
+            ).fetchone()
+        return dict(zip(('text', 'last_chat_id', 'sent', 'failed', 'finished_at'), row))
+
+    def checkpoint(self, broadcast_id, last_chat_id, sent, failed):
+        with self.connection as connection:
+            connection.execute(
+                "UPDATE broadcasts SET last_chat_id = ?, sent = ?, failed = ? WHERE id = ?",
+                (last_chat_id, sent, failed, broadcast_id)
+            )
+
+    def finish(self, broadcast_id):
+        with self.connection as connection:
+            connection.execute("UPDATE broadcasts SET finished_at = ? WHERE id = ?", (time.time(), broadcast_id))
+
+    def unfinished(self):
+        """Ids of broadcasts that were interrupted"""
+        rows = self.connection.execute("SELECT id FROM broadcasts WHERE finished_at IS NULL").fetchall()
+        return [row[0] for row in rows]
+
+_store = None
+
+def get_broadcast_store():
+    """Get the subscriber store, opening it on first use"""
+    global _store
+    if _store is None:
+        _store = BroadcastStore(BROADCAST_DB_PATH)
+    return _store
+
+def _blocked(error):
+    """Whether sending failed because the user blocked the bot or left"""
+    from telegram.error import Forbidden
+    return isinstance(error, Forbidden) or 'Forbidden' in str(error)
+
+async def run_broadcast(broadcast_id, text, store=None, workers=BROADCAST_WORKERS):
+    """Send text to every subscriber this worker owns, resuming from the last checkpoint.
+
+    Returns {'sent', 'failed', 'seconds', 'rate'} for this run, or None if the
+    broadcast had already finished.
+    """
+    store = store or get_broadcast_store()
+    state = await asyncio.to_thread(store.start, broadcast_id, text)
+    if state['finished_at'] is not None:
+        logger.info(f"📣 Broadcast {broadcast_id} already finished")
+        return None
+
+    scheduler = get_scheduler()
+    params = {
+        'text': state['text'],
+        'parse_mode': ParseMode.MARKDOWN,
+        'reply_markup': create_main_menu_keyboard()
+    }
+    sent, failed = state['sent'], state['failed']
+    started = time.monotonic()
+    run_sent = 0
+    last_chat_id = state['last_chat_id']
+    if last_chat_id > -2 ** 63:
+        logger.info(f"📣 Resuming broadcast {broadcast_id} after chat {last_chat_id} ({sent} sent)")
+
+    next_chunk = asyncio.create_task(asyncio.to_thread(store.subscriber_chunk, last_chat_id))
+    while True:
+        chunk = await next_chunk
+        if not chunk:
+            break
+        # Read the next chunk while this one is being sent
+        next_chunk = asyncio.create_task(asyncio.to_thread(store.subscriber_chunk, chunk[-1]))
+
+        pending = iter([chat_id for chat_id in chunk if owns_chat(chat_id)])
+        blocked = []
+
+        async def worker():
+            nonlocal sent, failed, run_sent
+            for chat_id in pending:
+                try:
+                    await scheduler.send('sendMessage', {'chat_id': chat_id, **params}, BROADCAST)
+                    sent += 1
+                    run_sent += 1
+                    BROADCAST_MESSAGES.inc('sent')
+                except Exception as e:
+                    failed += 1
+                    BROADCAST_MESSAGES.inc('failed')
+                    if _blocked(e):
+                        blocked.append(chat_id)
+                    else:
+                        logger.error(f"Error broadcasting to {chat_id}: {e}")
+
+        await asyncio.gather(*(worker() for _ in range(workers)))
+
+        last_chat_id = chunk[-1]
+        if blocked:
+            await asyncio.to_thread(store.unsubscribe_many, blocked)
+        await asyncio.to_thread(store.checkpoint, broadcast_id, last_chat_id, sent, failed)
+
+        elapsed = time.monotonic() - started
+        logger.info(
+            f"📣 {broadcast_id}: {sent} sent, {failed} failed, "
+            f"{run_sent / elapsed if elapsed else 0:.1f} msg/s"
+        )
+
+    await asyncio.to_thread(store.finish, broadcast_id)
+    elapsed = time.monotonic() - started
+    report = {
+        'sent': sent,
+        'failed': failed,
+        'seconds': round(elapsed, 1),
+        'rate': round(run_sent / elapsed, 1) if elapsed else 0.0
+    }
+    logger.info(f"✅ Broadcast {broadcast_id} finished: {report}")
+    return report
+
+def _broadcast_id(name):
+    """Checkpoints are per worker since each worker sends to the chats it owns"""
+    return f"{name}@{WORKER_URL}" if WORKER_URL else name
+
+async def festival_broadcast_job(context):
+    """Job: announce a festival sale on its day"""
+    event = context.job.data
+    details = get_catalog().get_festival_deals().get(event)
+    if details:
+        await run_broadcast(
+            _broadcast_id(f"festival:{event}:{details['date']}"),
+            format_festival_announcement(event, details)
+        )
+
+async def trending_broadcast_job(context):
+    """Job: send the day's trending deals"""
+    today = datetime.now(ZoneInfo(BROADCAST_TIMEZONE)).date().isoformat()
+    await run_broadcast(_broadcast_id(f"trending:{today}"), format_trending_deals())
+
+async def resume_broadcast_job(context):
+    """Job: finish a broadcast interrupted by a restart"""
+    await run_broadcast(context.job.data, None)
+
+def schedule_broadcasts(job_queue):
+    """Schedule festival and trending broadcasts and resume interrupted ones"""
+    if job_queue is None:
+        logger.warning("⚠️ Job queue unavailable, scheduled broadcasts are disabled")
+        return
+
+    timezone = ZoneInfo(BROADCAST_TIMEZONE)
+    now = datetime.now(timezone)
+
+    for event, details in get_catalog().get_festival_deals().items():
+        when = datetime.strptime(details['date'], '%Y-%m-%d').replace(hour=FESTIVAL_BROADCAST_HOUR, tzinfo=timezone)
+        if when > now:
+            job_queue.run_once(festival_broadcast_job, when, data=event, name=f"festival:{event}")
+            logger.info(f"📅 {event} broadcast scheduled for {when:%d %B %Y %H:%M}")
+
+    if TRENDING_BROADCAST_TIME:
+        hour, minute = map(int, TRENDING_BROADCAST_TIME.split(':'))
+        job_queue.run_daily(trending_broadcast_job, dt_time(hour, minute, tzinfo=timezone), name="trending")
+
+    for broadcast_id in get_broadcast_store().unfinished():
+        # Other workers resume their own broadcasts
+        if broadcast_id == _broadcast_id(broadcast_id.split('@')[0]):
+            job_queue.run_once(resume_broadcast_job, 1, data=broadcast_id, name=f"resume:{broadcast_id}")
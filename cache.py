@@ -0,0 +1,227 @@
+"""
+Caches sitting in front of the catalog
+"""
+import base64
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from catalog import PLATFORMS, add_change_listener, get_catalog
+from config import (
+    SEARCH_RESULT_LIMIT, QUERY_CACHE_SIZE, QUERY_CACHE_TTL, RENDERED_DEAL_CACHE_SIZE, RENDERED_DEAL_TTL,
+    RESULT_SNAPSHOT_DEPTH, RESULT_SNAPSHOT_CACHE_SIZE, RESULT_SNAPSHOT_TTL
+)
+from live_stats import LIVE_STATS
+from metrics import SEARCH_SECONDS, SEARCHES
+from utils import format_deal_message, create_product_link_keyboard
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after ttl seconds"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Get a live entry and mark it recently used"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        """Store an entry, evicting the least recently used ones when full"""
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        """Drop an entry if present"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        """Drop every entry whose value matches predicate(value)"""
+        with self._lock:
+            stale = [key for key, (_, value) in self._data.items() if predicate(value)]
+            for key in stale:
+                del self._data[key]
+        return len(stale)
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Hit/miss counters for monitoring"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+# Ranked product ids and rendered deals per (query, platform, category)
+QUERY_CACHE = TTLCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+
+# Deal message and link keyboard per (product id, platform), kept until the deals change or the
+# offer validity date shown in the message is due to be redrawn
+RENDERED_DEALS = TTLCache(RENDERED_DEAL_CACHE_SIZE, RENDERED_DEAL_TTL)
+
+# Ranked results of a search, kept by query id while the user pages through them
+RESULT_SNAPSHOTS = TTLCache(RESULT_SNAPSHOT_CACHE_SIZE, RESULT_SNAPSHOT_TTL)
+
+Snapshot = namedtuple('Snapshot', 'title platform product_ids')
+
+def render_deal(product, platform='all'):
+    """Get the (deal_message, link_keyboard) for a product, rendering it only once"""
+    platform = platform or 'all'
+    key = (product['id'], platform)
+    rendered = RENDERED_DEALS.get(key)
+
+    if rendered is None:
+        rendered = (format_deal_message(product, platform), create_product_link_keyboard(product, platform))
+        RENDERED_DEALS.set(key, rendered)
+
+    return rendered
+
+def prerender_deals(limit=RENDERED_DEAL_CACHE_SIZE):
+    """Render deals ahead of time, for each platform a product is sold on, until the cache is full"""
+    count = 0
+    for _, product in get_catalog().iter_products():
+        if count >= limit:
+            break
+        render_deal(product, 'all')
+        count += 1
+        for platform in PLATFORMS:
+            if product['deals'].get(platform):
+                render_deal(product, platform)
+                count += 1
+    return count
+
+def normalize_query(query):
+    """Lowercase a query and collapse its whitespace"""
+    return " ".join(query.lower().split())
+
+def cached_search(query, platform='all', category=None, limit=SEARCH_RESULT_LIMIT):
+    """Search the catalog, returning [(product, deal_message, link_keyboard)] best deals first.
+
+    Results are served from QUERY_CACHE when the same normalized query was
+    searched recently, so repeated queries skip both the search and the
+    message formatting.
+    """
+    start = time.perf_counter()
+    platform = platform or 'all'
+    key = (normalize_query(query), platform, category, limit)
+    LIVE_STATS.record_search(key[0])
+    entry = QUERY_CACHE.get(key)
+    catalog = get_catalog()
+
+    if entry is not None:
+        product_ids, rendered = entry
+        products = catalog.get_products(product_ids)
+        if len(products) == len(product_ids):
+            if platform != 'all':
+                products = [{**product, 'platform_filter': platform} for product in products]
+            SEARCH_SECONDS.observe(time.perf_counter() - start, 'hit')
+            SEARCHES.inc('found' if products else 'empty')
+            return [(product, *deal) for product, deal in zip(products, rendered)]
+        # A product disappeared from the catalog, search again
+        QUERY_CACHE.pop(key)
+
+    products = catalog.search(key[0], platform, limit=limit, category=category)
+    rendered = [render_deal(product, platform) for product in products]
+    QUERY_CACHE.set(key, ([product['id'] for product in products], rendered))
+    SEARCH_SECONDS.observe(time.perf_counter() - start, 'miss')
+    SEARCHES.inc('found' if products else 'empty')
+
+    return [(product, *deal) for product, deal in zip(products, rendered)]
+
+def query_id(key):
+    """Short id for a search, compact enough for callback_data"""
+    digest = hashlib.blake2b(repr(key).encode(), digest_size=6).digest()
+    return base64.urlsafe_b64encode(digest).decode()
+
+def snapshot_search(query, platform='all', category=None, title=None):
+    """Search up to RESULT_SNAPSHOT_DEPTH results and keep them for paging.
+
+    Returns (query id, Snapshot), with no product ids when nothing matched.
+    Pages are then read with get_snapshot(), never by searching again.
+    """
+    platform = platform or 'all'
+    key = (normalize_query(query), platform, category)
+    results = cached_search(query, platform, category, limit=RESULT_SNAPSHOT_DEPTH)
+
+    # A product listed under two catalog listings would otherwise fill two pages
+    product_ids = {}
+    for product, _, _ in results:
+        product_ids.setdefault(product['name'], product['id'])
+    snapshot = Snapshot(title or key[0], platform, tuple(product_ids.values()))
+
+    snapshot_id = query_id(key)
+    if snapshot.product_ids:
+        RESULT_SNAPSHOTS.set(snapshot_id, snapshot)
+    return snapshot_id, snapshot
+
+def get_snapshot(snapshot_id):
+    """The Snapshot of a recent search, or None once it expired"""
+    return RESULT_SNAPSHOTS.get(snapshot_id)
+
+def snapshot_page(snapshot, offset):
+    """(product, deal_message, link_keyboard) for one result of a snapshot, or None"""
+    if not 0 <= offset < len(snapshot.product_ids):
+        return None
+    product = get_catalog().get_product(snapshot.product_ids[offset])
+    if product is None:
+        return None
+    if snapshot.platform != 'all':
+        product = {**product, 'platform_filter': snapshot.platform}
+    return (product, *render_deal(product, snapshot.platform))
+
+def browse_category(category, platform='all', offset=0, limit=SEARCH_RESULT_LIMIT):
+    """One page of a category as (total, [(product, deal_message, link_keyboard)]), best deals first"""
+    platform = platform or 'all'
+    total, products = get_catalog().browse_category(category, platform, offset, limit)
+    return total, [(product, *render_deal(product, platform)) for product in products]
+
+def invalidate_products(product_ids=None):
+    """Drop cached searches and rendered deals for product_ids (or all of them).
+
+    Searches whose ranking would now let a changed product in are left to
+    expire through QUERY_CACHE_TTL.
+    """
+    if product_ids is None:
+        QUERY_CACHE.clear()
+        RENDERED_DEALS.clear()
+        return
+
+    changed = set(product_ids)
+    QUERY_CACHE.invalidate_where(lambda entry: not changed.isdisjoint(entry[0]))
+    for product_id in changed:
+        for platform in ['all', *PLATFORMS]:
+            RENDERED_DEALS.pop((product_id, platform))
+
+add_change_listener(invalidate_products)
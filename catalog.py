@@ -0,0 +1,802 @@
+"""
+Catalog providers for product and deal data
+
+The bot talks to the catalog through get_catalog() so the storage behind it
+can be swapped without touching the handlers:
+
+- InMemoryCatalog serves the MOCK_PRODUCTS dict through a SearchIndex
+- SQLiteCatalog serves a SQLite database with an FTS5 trigram index
+
+Both keep a CategoryIndex for browsing config.CATEGORIES; SQLiteCatalog
+stores it in the database so every worker shares the one built at import.
+Deal feeds are applied through update_deals() and add_products() (see
+ingest.py), which keep these indexes up to date product by product.
+
+Convert the mock data into a SQLite catalog with:
+
+    python catalog.py [path/to/catalog.db]
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from itertools import islice
+
+from category_index import CategoryIndex, category_key, product_categories
+from config import CATALOG_BACKEND, CATALOG_DB_PATH, SEARCH_RESULT_LIMIT, FUZZY_SEARCH_BUDGET_MS
+from deal_store import PLATFORMS
+from fuzzy import FuzzyIndex, SearchBudgetExceeded, levenshtein, max_edits, trigrams
+from ranking import rank_products, score_product
+from search_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+class CatalogProvider:
+    """Interface implemented by every catalog backend.
+
+    Products are returned as dicts shaped like the MOCK_PRODUCTS entries
+    plus an integer 'id', and searches filtered to one platform also carry
+    'platform_filter' as search_products() results do.
+    """
+
+    # Whether updates may run in a worker thread while the event loop keeps reading
+    threaded_writes = False
+
+    def iter_matches(self, query, platform=None, category=None):
+        """Yield every product matching query, platform and category, in catalog order"""
+        raise NotImplementedError
+
+    def search(self, query, platform=None, limit=SEARCH_RESULT_LIMIT, weights=None, category=None):
+        """Search for products based on query and platform, best deals first.
+
+        weights overrides config.RANKING_WEIGHTS for this search only.
+        category limits the search to one of config.CATEGORIES.
+        """
+        results = rank_products(
+            self.iter_matches(query, platform, category), query, platform, k=limit, weights=weights
+        )
+
+        if not results and FUZZY_SEARCH_BUDGET_MS > 0:
+            # Nothing matched exactly, retry tolerating typos within the latency budget
+            deadline = time.perf_counter() + FUZZY_SEARCH_BUDGET_MS / 1000
+            try:
+                fuzzy_matches = list(self.iter_fuzzy_matches(query, platform, deadline))
+                if category:
+                    members = self.category_product_ids(category)
+                    fuzzy_matches = [product for product in fuzzy_matches if product['id'] in members]
+            except SearchBudgetExceeded:
+                logger.warning(f"Fuzzy search for '{query}' exceeded {FUZZY_SEARCH_BUDGET_MS}ms budget")
+                fuzzy_matches = []
+            results = rank_products(fuzzy_matches, query, platform, k=limit, weights=weights)
+
+        return [_with_platform_filter(product, platform) for product in results]
+
+    def iter_fuzzy_matches(self, query, platform=None, deadline=None):
+        """Yield products matching query with typos, in catalog order.
+
+        Backends without a fuzzy index match nothing.  Implementations raise
+        SearchBudgetExceeded once time.perf_counter() passes deadline.
+        """
+        return iter(())
+
+    def get_product(self, product_id):
+        """Get a single product by id, or None"""
+        raise NotImplementedError
+
+    def category_page(self, category, platform=None, offset=0, limit=SEARCH_RESULT_LIMIT):
+        """(total, product ids) for one page of a category, best deals first"""
+        raise NotImplementedError
+
+    def category_product_ids(self, category):
+        """Ids of every product in a category, on any platform"""
+        raise NotImplementedError
+
+    def browse_category(self, category, platform=None, offset=0, limit=SEARCH_RESULT_LIMIT):
+        """(total, products) for one page of a category, best deals first"""
+        total, product_ids = self.category_page(category, platform, offset, limit)
+        products = self.get_products(product_ids)
+        return total, [_with_platform_filter(product, platform) for product in products]
+
+    def get_products(self, product_ids):
+        """Get several products by id, keeping their order and skipping missing ids"""
+        products = (self.get_product(product_id) for product_id in product_ids)
+        return [product for product in products if product is not None]
+
+    def iter_products(self):
+        """Yield (category, product) for every product in catalog order"""
+        raise NotImplementedError
+
+    def get_trending_deals(self):
+        """Get trending deals"""
+        raise NotImplementedError
+
+    def get_festival_deals(self):
+        """Get upcoming festival deals"""
+        raise NotImplementedError
+
+    def find_product_ids(self, names):
+        """{lowercase name: [product ids]} for the names that are in the catalog"""
+        raise NotImplementedError
+
+    def platform_product_ids(self, platform):
+        """Ids of every product with a deal on platform"""
+        raise NotImplementedError
+
+    def update_deals(self, changes):
+        """Apply [(product_id, platform, deal or None)] and re-index the changed products"""
+        raise NotImplementedError
+
+    def add_products(self, listed):
+        """Add [(listing, product)] to the catalog, returning their new ids"""
+        raise NotImplementedError
+
+    def refresh_rankings(self):
+        """Finish re-ranking after a run of updates; most backends rank as they go"""
+
+    def index_pending(self, deadline=None):
+        """Finish indexing added products until time.perf_counter() passes deadline; returns whether work is left"""
+        return False
+
+    def poll_changes(self):
+        """Ids of products changed by other processes since the last poll"""
+        return []
+
+def _with_platform_filter(product, platform):
+    """Tag a search result with the platform it was filtered to"""
+    if platform and platform != 'all':
+        return {**product, 'platform_filter': platform}
+    return product
+
+class InMemoryCatalog(CatalogProvider):
+    """Catalog backed by an in-memory dict and SearchIndex"""
+
+    def __init__(self, products=None, trending=None, festivals=None):
+        import mock_data
+        from search_index import SearchIndex
+
+        if products is None:
+            self.index = mock_data.SEARCH_INDEX
+        else:
+            self.index = SearchIndex(products)
+        self.fuzzy_index = FuzzyIndex(self.index)
+
+        # Copied so deal updates never touch the module-level mock data
+        self.trending = [dict(item) for item in (mock_data.TRENDING_DEALS if trending is None else trending)]
+        self.festivals = mock_data.FESTIVAL_DEALS if festivals is None else festivals
+        self.categories = CategoryIndex(self.iter_products())
+
+    def iter_matches(self, query, platform=None, category=None):
+        """Yield every product matching query, platform and category, in catalog order"""
+        within = self.categories.product_ids(category) if category else None
+        for product_id in self.index.iter_matches(query, platform, within):
+            yield self.get_product(product_id)
+
+    def iter_fuzzy_matches(self, query, platform=None, deadline=None):
+        """Yield products matching query with typos, in catalog order"""
+        for product_id in self.fuzzy_index.search(query, platform, deadline):
+            yield self.get_product(product_id)
+
+    def get_product(self, product_id):
+        """Get a single product by id, or None"""
+        if 0 <= product_id < len(self.index.products):
+            return {**self.index.products[product_id], 'id': product_id}
+        return None
+
+    def category_page(self, category, platform=None, offset=0, limit=SEARCH_RESULT_LIMIT):
+        """(total, product ids) for one page of a category, best deals first"""
+        return self.categories.page(category, platform, offset, limit)
+
+    def category_product_ids(self, category):
+        """Ids of every product in a category, on any platform"""
+        return self.categories.product_ids(category)
+
+    def iter_products(self):
+        """Yield (category, product) for every product in catalog order"""
+        for product_id, category in enumerate(self.index.categories):
+            yield category, self.get_product(product_id)
+
+    def get_trending_deals(self):
+        """Get trending deals"""
+        return self.trending
+
+    def get_festival_deals(self):
+        """Get upcoming festival deals"""
+        return self.festivals
+
+    def find_product_ids(self, names):
+        """{lowercase name: [product ids]} for the names that are in the catalog"""
+        return {name: self.index.names[name] for name in names if name in self.index.names}
+
+    def platform_product_ids(self, platform):
+        """Ids of every product with a deal on platform"""
+        return set(self.index.platform_postings.get(platform, ()))
+
+    def update_deals(self, changes):
+        """Apply [(product_id, platform, deal or None)] and re-index the changed products"""
+        changed = set()
+        for product_id, platform, deal in changes:
+            self.index.set_deal(product_id, platform, deal)
+            _update_trending(self.trending, self.index.products[product_id]['name'], platform, deal)
+            changed.add(product_id)
+
+        self.categories.update_many(
+            (self.index.categories[product_id], self.get_product(product_id)) for product_id in changed
+        )
+
+    def add_products(self, listed):
+        """Add [(listing, product)] to the catalog, returning their new ids"""
+        product_ids, new_tokens = self.index.add_products(listed)
+        self.fuzzy_index.add(new_tokens)
+        self.categories.update_many(
+            (listing, self.get_product(product_id)) for (listing, _), product_id in zip(listed, product_ids)
+        )
+        return product_ids
+
+    def index_pending(self, deadline=None):
+        """Move new products' tokens into the typo index until deadline; returns whether work is left"""
+        return self.fuzzy_index.index_pending(deadline)
+
+def _update_trending(trending, name, platform, deal):
+    """Keep a trending list's discounts in line with a changed deal"""
+    for item in list(trending):
+        if item['product'] == name and item['platform'] == platform:
+            if deal:
+                item['discount'] = deal['discount']
+            else:
+                trending.remove(item)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    listing TEXT NOT NULL,
+    name TEXT NOT NULL,
+    category TEXT,
+    image TEXT,
+    image_url TEXT
+);
+CREATE TABLE IF NOT EXISTS deals (
+    product_id INTEGER NOT NULL REFERENCES products(id),
+    platform TEXT NOT NULL,
+    original_price INTEGER NOT NULL,
+    discount_price INTEGER NOT NULL,
+    discount INTEGER NOT NULL,
+    coupon TEXT,
+    cashback INTEGER NOT NULL DEFAULT 0,
+    bogo INTEGER NOT NULL DEFAULT 0,
+    bank_offer TEXT,
+    PRIMARY KEY (product_id, platform)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS products_by_name ON products (lower(name));
+CREATE INDEX IF NOT EXISTS deals_by_platform ON deals (platform, product_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+    name, listing, content='products', content_rowid='id', tokenize='trigram'
+);
+CREATE TABLE IF NOT EXISTS category_products (
+    category TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    product_id INTEGER NOT NULL REFERENCES products(id),
+    score REAL NOT NULL,
+    PRIMARY KEY (category, platform, rank)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS category_members ON category_products (category, platform, product_id);
+CREATE INDEX IF NOT EXISTS category_products_by_product ON category_products (product_id);
+CREATE TABLE IF NOT EXISTS deal_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_id INTEGER NOT NULL,
+    changed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS trending (
+    rank INTEGER PRIMARY KEY,
+    product TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    discount INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS festivals (
+    name TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    platforms TEXT NOT NULL,
+    description TEXT
+);
+"""
+
+# The trigram tokenizer needs at least three characters to use the index
+MIN_FTS_QUERY_LENGTH = 3
+
+# Most trigram candidates checked by edit distance per fuzzy search
+FUZZY_CANDIDATE_LIMIT = 200
+
+class SQLiteCatalog(CatalogProvider):
+    """Catalog stored in SQLite with an FTS5 trigram index over names.
+
+    Trigram matching keeps the substring semantics of search_products(), so
+    a lookup only touches the rows that match instead of the whole catalog.
+    Each thread gets its own read connection.
+
+    Deal updates re-score a product's category rows in place; rows it newly
+    enters wait at a negative rank until refresh_rankings() renumbers the
+    rankings that changed.  Every update is logged to deal_changes so the
+    other workers can invalidate their caches through poll_changes().
+    The database runs in WAL mode, so readers never wait for a writer.
+    """
+
+    threaded_writes = True
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._dirty = set()      # (category, platform) rankings to renumber
+        self.change_seq = None   # Last deal_changes row seen by poll_changes()
+
+    @property
+    def connection(self):
+        """Per-thread connection to the catalog database"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _match_ids(self, query, platform, category=None):
+        """Stream matching product ids in catalog order"""
+        platform_join = ""
+        category_join = ""
+        params = []
+
+        if len(query) >= MIN_FTS_QUERY_LENGTH:
+            phrase = '"' + query.replace('"', '""') + '"'
+            sql = "SELECT p.id FROM products_fts f JOIN products p ON p.id = f.rowid"
+            where = "products_fts MATCH ?"
+            params.append(phrase)
+        else:
+            # Too short for trigrams, fall back to a scan
+            pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            sql = "SELECT p.id FROM products p"
+            where = "(lower(p.name) LIKE ? ESCAPE '\\' OR p.listing LIKE ? ESCAPE '\\')"
+            params.extend([pattern, pattern])
+
+        if category:
+            category_join = (
+                " JOIN category_products c ON c.product_id = p.id AND c.category = ? AND c.platform = 'all'"
+            )
+            params.insert(0, category_key(category))
+
+        if platform and platform != 'all':
+            platform_join = " JOIN deals d ON d.product_id = p.id AND d.platform = ?"
+            params.insert(0, platform)
+
+        sql = f"{sql}{platform_join}{category_join} WHERE {where} ORDER BY p.id"
+
+        for row in self.connection.execute(sql, params):
+            yield row[0]
+
+    def _load_products(self, product_ids):
+        """Load full product dicts for the given ids, keeping their order"""
+        if not product_ids:
+            return []
+
+        placeholders = ",".join("?" * len(product_ids))
+        conn = self.connection
+
+        products = {}
+        for row in conn.execute(f"SELECT * FROM products WHERE id IN ({placeholders})", product_ids):
+            products[row['id']] = {
+                'id': row['id'],
+                'name': row['name'],
+                'category': row['category'],
+                'image': row['image'],
+                'image_url': row['image_url'],
+                'deals': {platform: None for platform in PLATFORMS},
+            }
+
+        for row in conn.execute(f"SELECT * FROM deals WHERE product_id IN ({placeholders})", product_ids):
+            products[row['product_id']]['deals'][row['platform']] = {
+                'original_price': row['original_price'],
+                'discount_price': row['discount_price'],
+                'discount': row['discount'],
+                'coupon': row['coupon'],
+                'cashback': row['cashback'],
+            }
+            if row['bogo']:
+                products[row['product_id']]['deals'][row['platform']]['bogo'] = True
+            if row['bank_offer']:
+                products[row['product_id']]['deals'][row['platform']]['bank_offer'] = row['bank_offer']
+
+        return [products[i] for i in product_ids if i in products]
+
+    def iter_matches(self, query, platform=None, category=None, batch_size=500):
+        """Yield every product matching query, platform and category, in catalog order"""
+        product_ids = self._match_ids(query.lower(), platform, category)
+
+        while True:
+            batch = list(islice(product_ids, batch_size))
+            if not batch:
+                return
+            yield from self._load_products(batch)
+
+    def iter_fuzzy_matches(self, query, platform=None, deadline=None):
+        """Yield products matching query with typos, in catalog order.
+
+        Candidates come from the FTS5 trigram index (any shared trigram,
+        best bm25 first) and are then checked term by term with edit
+        distance, so the catalog is never scanned.
+        """
+        terms = tokenize(query)
+        grams = set().union(*(trigrams(term) for term in terms)) if terms else set()
+        if not grams:
+            return
+
+        params = [" OR ".join('"' + gram.replace('"', '""') + '"' for gram in sorted(grams))]
+        platform_join = ""
+        if platform and platform != 'all':
+            platform_join = " JOIN deals d ON d.product_id = p.id AND d.platform = ?"
+            params.insert(0, platform)
+        params.append(FUZZY_CANDIDATE_LIMIT)
+
+        rows = self.connection.execute(
+            f"SELECT p.id, p.name, p.listing FROM products_fts f JOIN products p ON p.id = f.rowid"
+            f"{platform_join} WHERE products_fts MATCH ? ORDER BY f.rank LIMIT ?",
+            params
+        )
+
+        matched_ids = []
+        for row in rows:
+            if deadline is not None and time.perf_counter() > deadline:
+                raise SearchBudgetExceeded(query)
+
+            tokens = set(tokenize(row['name'])) | set(tokenize(row['listing']))
+            if all(any(term in token or levenshtein(term, token, max_edits(term)) <= max_edits(term)
+                       for token in tokens) for term in terms):
+                matched_ids.append(row['id'])
+
+        yield from self._load_products(sorted(matched_ids))
+
+    def get_product(self, product_id):
+        """Get a single product by id, or None"""
+        products = self._load_products([product_id])
+        return products[0] if products else None
+
+    def get_products(self, product_ids):
+        """Get several products by id, keeping their order and skipping missing ids"""
+        return self._load_products(list(product_ids))
+
+    def category_page(self, category, platform=None, offset=0, limit=SEARCH_RESULT_LIMIT):
+        """(total, product ids) for one page of a category, best deals first"""
+        params = (category_key(category), platform or 'all')
+        # Ranks are dense from 0, so the highest one gives the total without a count
+        last = self.connection.execute(
+            "SELECT MAX(rank) FROM category_products WHERE category = ? AND platform = ?", params
+        ).fetchone()[0]
+        rows = self.connection.execute(
+            "SELECT product_id FROM category_products WHERE category = ? AND platform = ? "
+            "AND rank >= ? ORDER BY rank LIMIT ?",
+            (*params, offset, -1 if limit is None else limit)
+        )
+        return (0 if last is None else last + 1), [row[0] for row in rows]
+
+    def category_product_ids(self, category):
+        """Ids of every product in a category, on any platform"""
+        rows = self.connection.execute(
+            "SELECT product_id FROM category_products WHERE category = ? AND platform = 'all'",
+            (category_key(category),)
+        )
+        return {row[0] for row in rows}
+
+    def iter_products(self, batch_size=1000):
+        """Yield (category, product) for every product in catalog order"""
+        last_id = -1
+        while True:
+            rows = self.connection.execute(
+                "SELECT id, listing FROM products WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, batch_size)
+            ).fetchall()
+            if not rows:
+                return
+
+            listings = {row['id']: row['listing'] for row in rows}
+            for product in self._load_products(list(listings)):
+                yield listings[product['id']], product
+
+            last_id = rows[-1]['id']
+
+    def get_trending_deals(self):
+        """Get trending deals"""
+        rows = self.connection.execute("SELECT product, platform, discount FROM trending ORDER BY rank")
+        return [dict(row) for row in rows]
+
+    def get_festival_deals(self):
+        """Get upcoming festival deals"""
+        rows = self.connection.execute("SELECT * FROM festivals ORDER BY date")
+        return {
+            row['name']: {
+                'date': row['date'],
+                'platforms': json.loads(row['platforms']),
+                'description': row['description'],
+            }
+            for row in rows
+        }
+
+    def find_product_ids(self, names):
+        """{lowercase name: [product ids]} for the names that are in the catalog"""
+        names = list(names)
+        if not names:
+            return {}
+
+        found = {}
+        rows = self.connection.execute(
+            f"SELECT id, lower(name) FROM products WHERE lower(name) IN ({','.join('?' * len(names))}) ORDER BY id",
+            names
+        )
+        for product_id, name in rows:
+            found.setdefault(name, []).append(product_id)
+        return found
+
+    def platform_product_ids(self, platform):
+        """Ids of every product with a deal on platform"""
+        rows = self.connection.execute("SELECT product_id FROM deals WHERE platform = ?", (platform,))
+        return {row[0] for row in rows}
+
+    def update_deals(self, changes):
+        """Apply [(product_id, platform, deal or None)] and re-index the changed products"""
+        conn = self.connection
+        changed = set()
+        with conn:
+            for product_id, platform, deal in changes:
+                if deal:
+                    conn.execute(REPLACE_DEAL, _deal_row(product_id, platform, deal))
+                    conn.execute(
+                        "UPDATE trending SET discount = ? WHERE platform = ? "
+                        "AND product = (SELECT name FROM products WHERE id = ?)",
+                        (deal['discount'], platform, product_id)
+                    )
+                else:
+                    conn.execute("DELETE FROM deals WHERE product_id = ? AND platform = ?", (product_id, platform))
+                    conn.execute(
+                        "DELETE FROM trending WHERE platform = ? AND product = (SELECT name FROM products WHERE id = ?)",
+                        (platform, product_id)
+                    )
+                changed.add(product_id)
+
+            for product in self._load_products(sorted(changed)):
+                categories = [
+                    row[0] for row in conn.execute(
+                        "SELECT category FROM category_products WHERE product_id = ? AND platform = 'all'",
+                        (product['id'],)
+                    )
+                ]
+                self._rescore(conn, product, categories)
+            self._log_changes(conn, changed)
+
+    def add_products(self, listed):
+        """Add [(listing, product)] to the catalog, returning their new ids"""
+        conn = self.connection
+        product_ids = []
+        with conn:
+            next_id = conn.execute("SELECT COALESCE(MAX(id), -1) + 1 FROM products").fetchone()[0]
+            for listing, product in listed:
+                product = {**product, 'id': next_id}
+                conn.execute(INSERT_PRODUCT, _product_row(listing, product))
+                conn.execute(
+                    "INSERT INTO products_fts (rowid, name, listing) VALUES (?, ?, ?)",
+                    (next_id, product['name'], listing)
+                )
+                conn.executemany(INSERT_DEAL, _deal_rows(product))
+
+                # A product listed under several listings shows up once per category
+                categories = [
+                    category for category in product_categories(listing, product)
+                    if conn.execute(
+                        "SELECT 1 FROM products p CROSS JOIN category_products c ON c.product_id = p.id "
+                        "WHERE lower(p.name) = ? AND p.id != ? AND c.category = ? AND c.platform = 'all' LIMIT 1",
+                        (product['name'].lower(), next_id, category)
+                    ).fetchone() is None
+                ]
+                self._rescore(conn, product, categories)
+                product_ids.append(next_id)
+                next_id += 1
+            self._log_changes(conn, product_ids)
+        return product_ids
+
+    def _rescore(self, conn, product, categories):
+        """Update a product's category rows to its current deals"""
+        product_id = product['id']
+        old_ranks = {
+            (row[0], row[1]): row[2] for row in conn.execute(
+                "SELECT category, platform, rank FROM category_products WHERE product_id = ?", (product_id,)
+            )
+        }
+
+        rows = []
+        for platform in ['all'] + [platform for platform, deal in product['deals'].items() if deal]:
+            score = score_product(product, [], platform)
+            for category in categories:
+                # New entries park at a rank of their own until refresh_rankings()
+                rank = old_ranks.pop((category, platform), -1 - product_id)
+                rows.append((category, platform, rank, product_id, score))
+                self._dirty.add((category, platform))
+
+        for category, platform in old_ranks:
+            self._dirty.add((category, platform))
+        conn.execute("DELETE FROM category_products WHERE product_id = ?", (product_id,))
+        conn.executemany(INSERT_CATEGORY_PRODUCT, rows)
+
+    def _log_changes(self, conn, product_ids):
+        """Record changed products for the other workers, without echoing them back to this one"""
+        conn.executemany(
+            "INSERT INTO deal_changes (product_id, changed_at) VALUES (?, ?)",
+            [(product_id, time.time()) for product_id in product_ids]
+        )
+        if self.change_seq is not None:
+            self.change_seq = conn.execute("SELECT MAX(seq) FROM deal_changes").fetchone()[0]
+
+    def refresh_rankings(self):
+        """Renumber the category rankings changed since the last refresh, one transaction each"""
+        if not self._dirty:
+            return
+
+        conn = self.connection
+        count = len(self._dirty)
+        while self._dirty:
+            category, platform = self._dirty.pop()
+            with conn:
+                rows = conn.execute(
+                    "SELECT product_id, score FROM category_products WHERE category = ? AND platform = ? "
+                    "ORDER BY score DESC, product_id",
+                    (category, platform)
+                ).fetchall()
+                conn.execute(
+                    "DELETE FROM category_products WHERE category = ? AND platform = ?", (category, platform)
+                )
+                conn.executemany(
+                    INSERT_CATEGORY_PRODUCT,
+                    [(category, platform, rank, product_id, score) for rank, (product_id, score) in enumerate(rows)]
+                )
+        with conn:
+            conn.execute("DELETE FROM deal_changes WHERE changed_at < ?", (time.time() - DEAL_CHANGES_RETENTION,))
+
+        logger.info(f"📊 Re-ranked {count} category rankings")
+
+    def poll_changes(self):
+        """Ids of products changed by other processes since the last poll"""
+        conn = self.connection
+        if self.change_seq is None:
+            # Start from now; earlier changes are already in the catalog this worker loaded
+            self.change_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM deal_changes").fetchone()[0]
+            return []
+
+        rows = conn.execute(
+            "SELECT seq, product_id FROM deal_changes WHERE seq > ? ORDER BY seq", (self.change_seq,)
+        ).fetchall()
+        if not rows:
+            return []
+        self.change_seq = rows[-1][0]
+        return sorted({row[1] for row in rows})
+
+INSERT_PRODUCT = (
+    "INSERT INTO products (id, listing, name, category, image, image_url) VALUES (?, ?, ?, ?, ?, ?)"
+)
+INSERT_DEAL = (
+    "INSERT INTO deals (product_id, platform, original_price, discount_price, discount, coupon, cashback, "
+    "bogo, bank_offer) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+REPLACE_DEAL = INSERT_DEAL.replace("INSERT", "INSERT OR REPLACE", 1)
+INSERT_CATEGORY_PRODUCT = (
+    "INSERT INTO category_products (category, platform, rank, product_id, score) VALUES (?, ?, ?, ?, ?)"
+)
+
+# Seconds deal_changes rows are kept for workers catching up
+DEAL_CHANGES_RETENTION = 24 * 60 * 60
+
+def _product_row(listing, product):
+    """products table row for a product dict with an 'id'"""
+    return (product['id'], listing, product['name'], product.get('category'),
+            product.get('image'), product.get('image_url'))
+
+def _deal_row(product_id, platform, deal):
+    """deals table row for one platform's deal"""
+    return (product_id, platform, deal['original_price'], deal['discount_price'], deal['discount'],
+            deal.get('coupon'), deal.get('cashback', 0), int(bool(deal.get('bogo'))), deal.get('bank_offer'))
+
+def _deal_rows(product):
+    """deals table rows for every platform a product has a deal on"""
+    return [_deal_row(product['id'], platform, deal) for platform, deal in product['deals'].items() if deal]
+
+def import_catalog(path, products, trending=(), festivals=None):
+    """Write a MOCK_PRODUCTS-style dict into a SQLite catalog at path"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    conn = sqlite3.connect(path)
+    try:
+        with conn:
+            # Derived tables are recreated in case an older import left them with fewer columns
+            conn.executescript(
+                "DROP TABLE IF EXISTS category_products; DROP TABLE IF EXISTS deals; "
+                "DROP TABLE IF EXISTS deal_changes;"
+            )
+            conn.executescript(SCHEMA)
+            conn.execute("DELETE FROM products")
+            conn.execute("DELETE FROM trending")
+            conn.execute("DELETE FROM festivals")
+
+            product_id = 0
+            listed = []
+            for listing, items in products.items():
+                for product in items:
+                    product = {**product, 'id': product_id}
+                    listed.append((listing, product))
+                    conn.execute(INSERT_PRODUCT, _product_row(listing, product))
+                    conn.executemany(INSERT_DEAL, _deal_rows(product))
+                    product_id += 1
+
+            conn.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+            conn.executemany(INSERT_CATEGORY_PRODUCT, CategoryIndex(listed).rows())
+
+            conn.executemany(
+                "INSERT INTO trending (rank, product, platform, discount) VALUES (?, ?, ?, ?)",
+                [(rank, d['product'], d['platform'], d['discount']) for rank, d in enumerate(trending)]
+            )
+            conn.executemany(
+                "INSERT INTO festivals (name, date, platforms, description) VALUES (?, ?, ?, ?)",
+                [
+                    (name, d['date'], json.dumps(d['platforms']), d.get('description'))
+                    for name, d in (festivals or {}).items()
+                ]
+            )
+    finally:
+        conn.close()
+
+    logger.info(f"📦 Imported {product_id} products into {path}")
+    return product_id
+
+def import_mock_catalog(path=CATALOG_DB_PATH):
+    """Convert the MOCK_PRODUCTS dict into a SQLite catalog"""
+    from mock_data import MOCK_PRODUCTS, TRENDING_DEALS, FESTIVAL_DEALS
+    return import_catalog(path, MOCK_PRODUCTS, TRENDING_DEALS, FESTIVAL_DEALS)
+
+_catalog = None
+
+def get_catalog():
+    """Get the configured catalog provider"""
+    global _catalog
+
+    if _catalog is None:
+        if CATALOG_BACKEND == 'sqlite':
+            _catalog = SQLiteCatalog(CATALOG_DB_PATH)
+        else:
+            _catalog = InMemoryCatalog()
+        logger.info(f"📚 Using {type(_catalog).__name__} catalog")
+
+    return _catalog
+
+def set_catalog(catalog):
+    """Replace the catalog provider used by the bot"""
+    global _catalog
+    _catalog = catalog
+    notify_catalog_changed()
+
+_change_listeners = []
+
+def add_change_listener(listener):
+    """Register listener(product_ids) to be called when catalog data changes.
+
+    product_ids is None when the whole catalog may have changed.
+    """
+    _change_listeners.append(listener)
+
+def notify_catalog_changed(product_ids=None):
+    """Tell every listener that deals for product_ids (or everything) changed"""
+    for listener in _change_listeners:
+        try:
+            listener(product_ids)
+        except Exception as e:
+            logger.error(f"Error in catalog change listener {listener}: {e}")
+
+if __name__ == '__main__':
+    import sys
+    import_mock_catalog(sys.argv[1] if len(sys.argv) > 1 else CATALOG_DB_PATH)
@@ -0,0 +1,104 @@
+"""
+Browse index from the menu categories to products
+
+Catalog listings ('smartphones', 'shirts', ...) and product categories
+('Electronics', 'Fashion', ...) are mapped onto config.CATEGORIES once when
+the catalog loads.  Each category keeps its product ids best deals first,
+for every platform, so a page of a category is a slice and searching
+within a category only verifies the products in it.  Products whose deals
+change are re-ranked one at a time.
+"""
+from bisect import bisect_left
+
+from config import CATEGORIES, CATEGORY_LISTINGS
+from ranking import score_product
+from search_index import merge_sorted
+
+def category_key(name):
+    """Normalize a category name as it arrives from callbacks and menus"""
+    return " ".join(name.lower().replace('_', ' ').split())
+
+# (category key, catalog listings) of every menu category, worked out once
+MENU_CATEGORIES = [(category_key(name), CATEGORY_LISTINGS.get(name, (name.lower(),))) for name in CATEGORIES]
+
+def product_categories(listing, product):
+    """Keys of the menu categories a catalog product belongs to"""
+    listing = listing.lower()
+    product_category = (product.get('category') or '').lower()
+    return [key for key, listings in MENU_CATEGORIES if key == product_category or listing in listings]
+
+class CategoryIndex:
+    """Product ids per (category, platform), best deals first.
+
+    Each ranking is a sorted list of (-score, product_id), so a product
+    whose deals change moves with one bisect removal and one insertion.
+    """
+
+    def __init__(self, products=()):
+        self.ranked = {}   # (category key, platform or 'all') -> sorted [(-score, product_id)]
+        self.scores = {}   # product_id -> {(category key, platform): -score}
+        self.members = {}  # category key -> {product_id} on any platform
+        self.names = {}    # (category key, lowercase name) -> product_id listed under that name
+
+        entries = {}
+        for listing, product in products:
+            for key, entry in self._entries(listing, product):
+                entries.setdefault(key, []).append(entry)
+        for key, key_entries in entries.items():
+            key_entries.sort()
+            self.ranked[key] = key_entries
+
+    def _entries(self, listing, product):
+        """Yield ((category, platform), (-score, product_id)) for every ranking a product is in"""
+        product_id = product['id']
+        name = product['name'].lower()
+
+        categories = []
+        for category in product_categories(listing, product):
+            # A product listed under several listings shows up once per category
+            if self.names.setdefault((category, name), product_id) == product_id:
+                categories.append(category)
+                self.members.setdefault(category, set()).add(product_id)
+        if not categories:
+            return
+
+        scores = self.scores.setdefault(product_id, {})
+        for platform in ['all'] + [platform for platform, deal in product['deals'].items() if deal]:
+            entry = (-score_product(product, [], platform), product_id)
+            for category in categories:
+                scores[(category, platform)] = entry[0]
+                yield (category, platform), entry
+
+    def update(self, listing, product):
+        """Re-rank a product whose deals changed, or add a new one"""
+        self.update_many([(listing, product)])
+
+    def update_many(self, listed):
+        """Re-rank or add [(listing, product)], sorting each changed ranking once"""
+        added = {}
+        for listing, product in listed:
+            product_id = product['id']
+            for key, score in self.scores.pop(product_id, {}).items():
+                ranked = self.ranked[key]
+                del ranked[bisect_left(ranked, (score, product_id))]
+            for key, entry in self._entries(listing, product):
+                added.setdefault(key, []).append(entry)
+
+        for key, entries in added.items():
+            self.ranked[key] = merge_sorted(self.ranked.get(key, []), entries)
+
+    def page(self, category, platform='all', offset=0, limit=None):
+        """(total, product ids) for one page of a category"""
+        ranked = self.ranked.get((category_key(category), platform or 'all'), [])
+        end = None if limit is None else offset + limit
+        return len(ranked), [product_id for _, product_id in ranked[offset:end]]
+
+    def product_ids(self, category):
+        """Every product id in a category, on any platform"""
+        return self.members.get(category_key(category), set())
+
+    def rows(self):
+        """(category, platform, rank, product_id, score) rows for storing the index"""
+        for (category, platform), ranked in self.ranked.items():
+            for rank, (score, product_id) in enumerate(ranked):
+                yield category, platform, rank, product_id, -score
@@ -1,6 +1,7 @@
 """
 Configuration file for the Telegram bot
 """
+import hashlib
 import os
 import logging
 
@@ -15,6 +16,104 @@ WEBAPP_PORT = int(os.getenv("PORT", 5000))  # Render provides PORT environment v
 WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # Set this in Render.com environment variables
 WEBHOOK_PATH = f"/templates/index.html/{BOT_TOKEN}"  # Unique path for your webhook
 WEBHOOK_URL_FULL = f"{WEBHOOK_URL}{WEBHOOK_PATH}" if WEBHOOK_URL else ""
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # Sent back by Telegram in X-Telegram-Bot-Api-Secret-Token
+
+# Update processing
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", 64))  # Updates handled at once across chats
+MAX_PENDING_UPDATES = int(os.getenv("MAX_PENDING_UPDATES", 2000))  # Updates handed to handlers but not finished
+# Webhook updates survive restarts here; one file per worker, so workers sharing /data each get their own
+UPDATE_JOURNAL_PATH = os.getenv("UPDATE_JOURNAL_PATH") or (
+    f"/data/updates-{hashlib.sha1(os.environ['WORKER_URL'].encode()).hexdigest()[:12]}.journal"
+    if os.getenv("WORKER_URL") else "/data/updates.journal"
+)
+UPDATE_JOURNAL_SIZE = int(os.getenv("UPDATE_JOURNAL_SIZE", 64 * 1024 * 1024))  # Bytes; the webhook returns 503 when full
+UPDATE_BATCH_SIZE = 100  # Updates pulled from the journal at a time
+UPDATE_DEDUPE_WINDOW = 100000  # Recent update_ids remembered to drop Telegram's redeliveries
+
+# Multi-worker state
+PERSISTENCE_BACKEND = os.getenv("PERSISTENCE_BACKEND", "")  # '', 'sqlite' or 'redis'
+PERSISTENCE_PATH = os.getenv("PERSISTENCE_PATH", "/data/state.db")  # Used by the 'sqlite' backend
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")  # Used by the 'redis' backend
+PERSISTENCE_FLUSH_DELAY = float(os.getenv("PERSISTENCE_FLUSH_DELAY", 0.5))  # Seconds to batch state writes
+PERSISTENCE_SEEN_CACHE_SIZE = 100000  # Users and chats remembered as already loaded from the store
+WORKER_URL = os.getenv("WORKER_URL", "")  # This worker's internal base URL, as listed in WORKER_NODES
+WORKER_NODES = [url for url in os.getenv("WORKER_NODES", "").split(",") if url]  # All workers; chats are hashed across them
+
+# Catalog Configuration
+CATALOG_BACKEND = os.getenv("CATALOG_BACKEND", "memory")  # 'memory' or 'sqlite'
+CATALOG_DB_PATH = os.getenv("CATALOG_DB_PATH", "/data/catalog.db")  # Render persistent disk
+FEED_DIR = os.getenv("FEED_DIR", "/data/feeds")  # <platform>.ndjson, .jsonl or .csv deal feeds
+FEED_REFRESH_INTERVAL = int(os.getenv("FEED_REFRESH_INTERVAL", 900))  # Seconds between feed checks; 0 disables
+INGEST_BATCH_SIZE = 1000  # Feed rows diffed and applied at a time
+INGEST_LOOP_BATCH_SIZE = 100  # Feed rows applied between yields to the event loop (in-memory catalog)
+INGEST_SLICE_SECONDS = 0.02  # Longest stretch of typo-index work between yields to the event loop
+CATALOG_CHANGES_POLL_INTERVAL = 10  # Seconds between checks for deal changes made by other workers
+
+# Search Configuration
+SEARCH_RESULT_LIMIT = 5
+FUZZY_SEARCH_BUDGET_MS = int(os.getenv("FUZZY_SEARCH_BUDGET_MS", 50))  # 0 disables typo tolerance
+RANKING_WEIGHTS = {
+    'relevance': 1.0,  # How closely the query matches the product name
+    'discount': 1.0,   # Discount percentage
+    'cashback': 0.5,   # Cashback relative to the original price
+    'savings': 0.5     # Absolute rupee savings, log-scaled
+}
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 1024))  # Cached searches kept per worker
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", 300))  # Seconds before a cached search expires
+RENDERED_DEAL_CACHE_SIZE = int(os.getenv("RENDERED_DEAL_CACHE_SIZE", 100000))  # Rendered (product, platform) deals
+RENDERED_DEAL_TTL = int(os.getenv("RENDERED_DEAL_TTL", 24 * 60 * 60))  # Seconds before a rendered deal is redrawn
+# Render deals at startup, up to RENDERED_DEAL_CACHE_SIZE; off by default for a shared SQLite catalog
+PRERENDER_DEALS = os.getenv("PRERENDER_DEALS", "false" if CATALOG_BACKEND == "sqlite" else "true").lower() == "true"
+RESULT_SNAPSHOT_DEPTH = 50  # Search results a user can page through
+RESULT_SNAPSHOT_CACHE_SIZE = int(os.getenv("RESULT_SNAPSHOT_CACHE_SIZE", 10000))  # Searches kept for paging per worker
+RESULT_SNAPSHOT_TTL = 3600  # Seconds a search stays pageable
+
+# Telegram rate limits (messages per second)
+TELEGRAM_GLOBAL_RATE = 30  # Across all chats
+TELEGRAM_CHAT_RATE = 1     # Sustained rate within one chat
+TELEGRAM_CHAT_BURST = 3    # Short bursts allowed within one chat
+OUTBOUND_MAX_RETRIES = 3  # Retries after a 429 before a send fails
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")  # Point at a fake Bot API for testing
+
+# Price alerts
+ALERT_FANOUT_WORKERS = 8  # Triggered alerts being sent at once; the rate limiter paces them further
+
+# Broadcasts
+BROADCAST_DB_PATH = os.getenv("BROADCAST_DB_PATH", "/data/broadcast.db" if os.getenv('RENDER') else "broadcast.db")  # Subscribers and checkpoints
+BROADCAST_CHUNK_SIZE = 1000  # Subscribers read and checkpointed at a time
+BROADCAST_WORKERS = 64  # Broadcast messages in flight; the rate limiter sets the actual pace
+BROADCAST_TIMEZONE = "Asia/Kolkata"
+FESTIVAL_BROADCAST_HOUR = 9  # Festival sales are announced at this hour on their first day
+TRENDING_BROADCAST_TIME = os.getenv("TRENDING_BROADCAST_TIME", "18:00")  # Daily trending deals; empty disables
+
+# Trending deals from engagement
+TRENDING_LIMIT = 7  # Deals in the trending list
+TRENDING_CAPACITY = 1000  # Products tracked per worker; the summary holds up to twice this
+TRENDING_HALF_LIFE = int(os.getenv("TRENDING_HALF_LIFE", 6 * 60 * 60))  # Seconds for engagement to lose half its weight
+TRENDING_WEIGHTS = {
+    'search': 1.0,  # Product among a search's top results
+    'view': 2.0,    # Deal shown to a user
+    'click': 5.0    # Buy Now link followed
+}
+TRENDING_SEARCH_DEPTH = 5  # Top results of a search that count towards trending
+TRENDING_SYNC_INTERVAL = 60  # Seconds between exchanging trending summaries with other workers
+
+# Click tracking
+CLICK_TRACKING_URL = os.getenv(
+    "CLICK_TRACKING_URL",
+    f"https://{os.getenv('RENDER_EXTERNAL_HOSTNAME')}" if os.getenv('RENDER_EXTERNAL_HOSTNAME') else ""
+).rstrip("/")  # Public base URL serving /go/ redirects; empty links straight to the shops
+CLICK_DB_PATH = os.getenv("CLICK_DB_PATH", "/data/clicks.db" if os.getenv('RENDER') else "clicks.db")  # Click log
+CLICK_LINK_CACHE_SIZE = 100000  # Resolved Buy Now links kept per worker
+CLICK_LOG_BATCH_SIZE = 500  # Clicks written to the log at a time
+CLICK_LOG_FLUSH_INTERVAL = 2  # Most seconds a click waits in memory before being written
+CLICK_LOG_MAX_PENDING = 100000  # Unwritten clicks kept if the disk falls behind
+
+# Live dashboard
+DASHBOARD_TOKEN = os.getenv("DASHBOARD_TOKEN", "")  # Required as ?token= to open it; unset shows it without searches
+LIVE_FEED_INTERVAL = 2  # Seconds between dashboard stat pushes
+TOP_QUERY_COUNT = 5  # Top searches shown on the dashboard
+TOP_QUERY_HALF_LIFE = 600  # Seconds for a query's weight in the top searches to halve
 
 # Logging configuration
 logging.basicConfig(
@@ -41,12 +140,20 @@ CATEGORIES = [
     'Home & Kitchen', 'Books', 'Sports & Fitness', 
     'Beauty & Personal Care', 'Automotive'
 ]
+# Catalog listings shown under each category, besides products whose own
+# category matches; categories not listed here match the listing of the same name
+CATEGORY_LISTINGS = {
+    'Mobile': ('mobile', 'smartphones'),
+    'Shirt': ('shirt', 'shirts'),
+}
 
 # Deal types
 DEAL_TYPES = [
     'Percentage Discounts', 'BOGO Offers', 'Bank Discounts', 
     'Clearance Sales', 'Cashback Offers'
 ]
+PERCENTAGE_DEAL_MIN_DISCOUNT = 20  # Percent off for a deal to count as a percentage discount
+CLEARANCE_MIN_DISCOUNT = 40  # Percent off for a deal to count as a clearance sale
 # ======================
 # Deployment Checks
 # ======================
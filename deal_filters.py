@@ -0,0 +1,126 @@
+"""
+Deal-type filters over the catalog
+
+Each deal type is a rule on one platform's deal record.  DealTypeIndex
+evaluates the rules once per deal and keeps posting sets of product ids per
+(deal type, platform), so a deal type combined with a platform and the
+catalog's category members is a set intersection instead of a catalog scan.
+Changed products are re-indexed from catalog change notifications.
+"""
+import logging
+from itertools import islice
+
+from cache import render_deal
+from catalog import add_change_listener, get_catalog
+from config import DEAL_TYPES, SEARCH_RESULT_LIMIT, PERCENTAGE_DEAL_MIN_DISCOUNT, CLEARANCE_MIN_DISCOUNT
+from ranking import rank_products
+
+logger = logging.getLogger(__name__)
+
+# dealtype_ callback suffix -> display name, e.g. 'bogo_offers' -> 'BOGO Offers'
+DEAL_TYPE_NAMES = {name.lower().replace(' ', '_'): name for name in DEAL_TYPES}
+
+# Which deals count as each type; BOGO and bank offers are flagged by the deal feed
+DEAL_TYPE_RULES = {
+    'percentage_discounts': lambda deal: deal['discount'] >= PERCENTAGE_DEAL_MIN_DISCOUNT,
+    'bogo_offers': lambda deal: bool(deal.get('bogo')),
+    'bank_discounts': lambda deal: bool(deal.get('bank_offer')),
+    'clearance_sales': lambda deal: deal['discount'] >= CLEARANCE_MIN_DISCOUNT,
+    'cashback_offers': lambda deal: deal.get('cashback', 0) > 0,
+}
+
+class DealTypeIndex:
+    """Posting sets of product ids per (deal type, platform)"""
+
+    def __init__(self, rules=DEAL_TYPE_RULES):
+        self.rules = rules
+        self.postings = {}  # (deal_type, platform or 'all') -> {product_id}
+        self._keys = {}     # product_id -> posting keys
+        self.built = False
+
+    def __len__(self):
+        return len(self._keys)
+
+    def build(self, catalog):
+        """Index every product in the catalog"""
+        self.postings.clear()
+        self._keys.clear()
+        for _, product in catalog.iter_products():
+            self.add(product)
+        self.built = True
+        logger.info(f"🏷️ Indexed deal types for {len(self)} products")
+
+    def add(self, product):
+        """Index one product under its deal types"""
+        product_id = product['id']
+        posting_keys = set()
+        for platform, deal in product['deals'].items():
+            if not deal:
+                continue
+            for deal_type, rule in self.rules.items():
+                if rule(deal):
+                    posting_keys.add((deal_type, platform))
+                    posting_keys.add((deal_type, 'all'))
+
+        for key in posting_keys:
+            self.postings.setdefault(key, set()).add(product_id)
+        self._keys[product_id] = posting_keys
+
+    def remove(self, product_id):
+        """Drop a product from every posting set"""
+        for key in self._keys.pop(product_id, ()):
+            self.postings[key].discard(product_id)
+            if not self.postings[key]:
+                del self.postings[key]
+
+    def matching(self, deal_type, platform='all', within=None):
+        """Ids of products with a deal_type deal on platform, optionally within a set of ids"""
+        ids = self.postings.get((deal_type, platform or 'all'), set())
+        if within is not None:
+            ids = ids & within
+        return ids
+
+    def on_catalog_changed(self, product_ids):
+        """Catalog change listener: re-index changed products or rebuild on next use"""
+        if not self.built:
+            return
+        if product_ids is None:
+            self.built = False
+            return
+
+        product_ids = list(product_ids)
+        for product_id in product_ids:
+            self.remove(product_id)
+        for product in get_catalog().get_products(product_ids):
+            self.add(product)
+
+DEAL_TYPE_INDEX = DealTypeIndex()
+add_change_listener(DEAL_TYPE_INDEX.on_catalog_changed)
+
+def _iter_products(catalog, product_ids, batch_size=500):
+    """Load products in batches so large result sets stream through ranking"""
+    product_ids = iter(product_ids)
+    while True:
+        batch = list(islice(product_ids, batch_size))
+        if not batch:
+            return
+        yield from catalog.get_products(batch)
+
+def find_deals(deal_type, platform='all', category=None, limit=SEARCH_RESULT_LIMIT):
+    """Best deals of one type, as (match count, [(product, deal_message, link_keyboard)])"""
+    platform = platform or 'all'
+    catalog = get_catalog()
+    if not DEAL_TYPE_INDEX.built:
+        DEAL_TYPE_INDEX.build(catalog)
+
+    within = catalog.category_product_ids(category) if category else None
+    product_ids = DEAL_TYPE_INDEX.matching(deal_type, platform, within)
+    products = rank_products(_iter_products(catalog, sorted(product_ids)), '', platform, k=limit)
+    if platform != 'all':
+        products = [{**product, 'platform_filter': platform} for product in products]
+
+    return len(product_ids), [(product, *render_deal(product, platform)) for product in products]
+
+def build_deal_type_index():
+    """Build the index up front so the first deal-type lookup doesn't pay for it"""
+    DEAL_TYPE_INDEX.build(get_catalog())
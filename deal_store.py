@@ -0,0 +1,258 @@
+"""
+Columnar storage for the deals of every product
+
+A product's deals used to be a dict of four platform dicts, dozens of
+Python objects per product.  DealStore keeps them in flat typed arrays
+indexed by product_id * len(PLATFORMS) + platform_id, with coupon and bank
+offer strings interned, and hands out read-only Mapping views so
+product['deals'][platform]['discount'] keeps working everywhere.
+
+Savings and the effective price after cashback are stored per deal, and
+each product's biggest-discount and cheapest platforms per product, so
+best-deal questions are lookups.  The per-product columns are filled in
+strided passes over the catalog and kept current as deals change.
+"""
+from array import array
+from collections.abc import Mapping
+
+# Platform order used for deal columns and rebuilt deal dicts
+PLATFORMS = ['flipkart', 'amazon', 'myntra', 'meesho']
+
+# Bits of the flags column
+PRESENT = 1
+BOGO = 2
+
+# best() criteria -> (per-product column, deal column, lowest wins)
+BEST_BY = {
+    'discount': ('best_discount', 'discount', False),
+    'price': ('cheapest', 'effective_price', True),
+}
+
+class DealStore:
+    """Deal columns for every (product, platform) slot"""
+
+    def __init__(self, platforms=PLATFORMS):
+        self.platforms = list(platforms)
+        self.platform_ids = {platform: i for i, platform in enumerate(self.platforms)}
+
+        self.original_price = array('i')
+        self.discount_price = array('i')
+        self.discount = array('h')
+        self.cashback = array('i')
+        self.coupon = array('I')      # Index into strings, 0 for no coupon
+        self.bank_offer = array('I')  # Index into strings, 0 for no bank offer
+        self.flags = array('B')       # PRESENT | BOGO
+        self.savings = array('i')          # original_price - discount_price
+        self.effective_price = array('i')  # discount_price - cashback
+
+        # Per product: platform id of the best deal, -1 without deals
+        self.best_discount = array('b')
+        self.cheapest = array('b')
+
+        self.strings = [None]
+        self._string_ids = {None: 0}
+
+    def __len__(self):
+        return len(self.flags) // len(self.platforms)
+
+    def _intern(self, text):
+        """Id of a coupon or bank offer string, shared by every deal using it"""
+        string_id = self._string_ids.get(text)
+        if string_id is None:
+            string_id = self._string_ids[text] = len(self.strings)
+            self.strings.append(text)
+        return string_id
+
+    def append(self, deals):
+        """Store a product's {platform: deal or None} dict, returning its product id"""
+        product_id = len(self)
+        width = len(self.platforms)
+        for column in self._slot_columns():
+            column.extend([0] * width)
+
+        for platform, deal in deals.items():
+            self.set(product_id, platform, deal)
+        return product_id
+
+    def set(self, product_id, platform, deal):
+        """Replace one platform's deal of a product, or remove it with deal=None"""
+        slot = product_id * len(self.platforms) + self.platform_ids[platform]
+        if not deal:
+            self.flags[slot] = 0
+        else:
+            self.original_price[slot] = deal['original_price']
+            self.discount_price[slot] = deal['discount_price']
+            self.discount[slot] = deal['discount']
+            self.cashback[slot] = deal.get('cashback', 0)
+            self.coupon[slot] = self._intern(deal.get('coupon'))
+            self.bank_offer[slot] = self._intern(deal.get('bank_offer'))
+            self.flags[slot] = PRESENT | (BOGO if deal.get('bogo') else 0)
+            self.savings[slot] = deal['original_price'] - deal['discount_price']
+            self.effective_price[slot] = deal['discount_price'] - deal.get('cashback', 0)
+
+        # Products appended since the last lookup are filled in by the next batch pass
+        if product_id < len(self.best_discount):
+            for best_column, column, lowest in BEST_BY.values():
+                getattr(self, best_column)[product_id] = self.best_platforms(column, lowest, product_id, product_id + 1)[0]
+
+    def deal(self, product_id, platform):
+        """View of one platform's deal, or None"""
+        slot = product_id * len(self.platforms) + self.platform_ids[platform]
+        return DealView(self, slot) if self.flags[slot] & PRESENT else None
+
+    def deals(self, product_id):
+        """{platform: deal view or None} view of a product's deals"""
+        return DealsView(self, product_id)
+
+    def platform_product_ids(self, platform):
+        """Ids of every product with a deal on platform"""
+        flags = self.flags[self.platform_ids[platform]::len(self.platforms)]
+        return {product_id for product_id, flag in enumerate(flags) if flag & PRESENT}
+
+    def best_platforms(self, column='discount', lowest=False, start=0, stop=None):
+        """Platform id with each product's highest (or lowest) column value, -1 where it has no deals.
+
+        One strided pass per platform over products start to stop; ties go
+        to the earlier platform, as max() over a deals dict does.
+        """
+        width = len(self.platforms)
+        stop = len(self) if stop is None else stop
+        values = getattr(self, column)
+        best = array('b', [-1]) * (stop - start)
+        best_values = [0] * (stop - start)
+
+        for platform_id in range(width):
+            first, last = start * width + platform_id, stop * width
+            flags = self.flags[first:last:width]
+            for i, (flag, value) in enumerate(zip(flags, values[first:last:width])):
+                if flag & PRESENT and (
+                    best[i] < 0 or (value < best_values[i] if lowest else value > best_values[i])
+                ):
+                    best[i] = platform_id
+                    best_values[i] = value
+        return best
+
+    def compute_best(self):
+        """Fill the per-product best-deal columns for products appended since the last call"""
+        start = len(self.best_discount)
+        if start < len(self):
+            for best_column, column, lowest in BEST_BY.values():
+                getattr(self, best_column).extend(self.best_platforms(column, lowest, start))
+
+    def best(self, product_id, by='discount'):
+        """(platform, deal view) of a product's biggest discount or lowest effective price, or None"""
+        if product_id >= len(self.best_discount):
+            self.compute_best()
+        platform_id = getattr(self, BEST_BY[by][0])[product_id]
+        if platform_id < 0:
+            return None
+        return self.platforms[platform_id], DealView(self, product_id * len(self.platforms) + platform_id)
+
+    def _slot_columns(self):
+        """Columns with one entry per (product, platform) slot"""
+        return (self.original_price, self.discount_price, self.discount, self.cashback,
+                self.coupon, self.bank_offer, self.flags, self.savings, self.effective_price)
+
+    def nbytes(self):
+        """Bytes held by the deal columns"""
+        columns = (*self._slot_columns(), self.best_discount, self.cheapest)
+        return sum(column.itemsize * len(column) for column in columns)
+
+class DealView(Mapping):
+    """Read-only deal dict backed by one DealStore slot"""
+
+    __slots__ = ('store', 'slot')
+
+    def __init__(self, store, slot):
+        self.store = store
+        self.slot = slot
+
+    def __getitem__(self, key):
+        store, slot = self.store, self.slot
+        if key in ('original_price', 'discount_price', 'discount', 'cashback'):
+            return getattr(store, key)[slot]
+        if key == 'coupon':
+            return store.strings[store.coupon[slot]]
+        if key == 'bogo' and store.flags[slot] & BOGO:
+            return True
+        if key == 'bank_offer' and store.bank_offer[slot]:
+            return store.strings[store.bank_offer[slot]]
+        raise KeyError(key)
+
+    def __iter__(self):
+        yield from ('original_price', 'discount_price', 'discount', 'coupon', 'cashback')
+        if self.store.flags[self.slot] & BOGO:
+            yield 'bogo'
+        if self.store.bank_offer[self.slot]:
+            yield 'bank_offer'
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    @property
+    def savings(self):
+        """Precomputed original_price - discount_price"""
+        return self.store.savings[self.slot]
+
+    @property
+    def effective_price(self):
+        """Precomputed discount_price - cashback"""
+        return self.store.effective_price[self.slot]
+
+class DealsView(Mapping):
+    """Read-only {platform: deal} dict of one product in a DealStore"""
+
+    __slots__ = ('store', 'product_id')
+
+    def __init__(self, store, product_id):
+        self.store = store
+        self.product_id = product_id
+
+    def __getitem__(self, platform):
+        if platform not in self.store.platform_ids:
+            raise KeyError(platform)
+        return self.store.deal(self.product_id, platform)
+
+    def __iter__(self):
+        return iter(self.store.platforms)
+
+    def __len__(self):
+        return len(self.store.platforms)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def best(self, by='discount'):
+        """(platform, deal) with the biggest discount or lowest effective price, or None"""
+        return self.store.best(self.product_id, by)
+
+def best_deal(deals, by='discount'):
+    """(platform, deal) with the biggest discount ('discount') or lowest price after cashback ('price').
+
+    A lookup for DealStore views; plain deal dicts, e.g. from SQLite, are
+    compared on the spot with the same tie-breaking.
+    """
+    if isinstance(deals, DealsView):
+        return deals.best(by)
+
+    available = [(platform, deal) for platform, deal in deals.items() if deal]
+    if not available:
+        return None
+    if by == 'price':
+        return min(available, key=lambda item: effective_price(item[1]))
+    return max(available, key=lambda item: item[1]['discount'])
+
+def deal_savings(deal):
+    """Rupees saved on a deal before cashback"""
+    if isinstance(deal, DealView):
+        return deal.savings
+    return deal['original_price'] - deal['discount_price']
+
+def effective_price(deal):
+    """Price of a deal after cashback"""
+    if isinstance(deal, DealView):
+        return deal.effective_price
+    return deal['discount_price'] - deal.get('cashback', 0)
@@ -0,0 +1,149 @@
+"""
+Delivery of multi-result search replies
+
+Search results are paged in one message: the first result is sent as a
+photo with Prev/Next cursors, and every page after that edits the same
+message in place.
+"""
+import logging
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto, LinkPreviewOptions
+from telegram.constants import ParseMode
+
+from outbound import reply_text, reply_photo, reply_media_group, edit_message_text, edit_message_media
+from trending import record_view
+from utils import create_result_page_keyboard
+
+logger = logging.getLogger(__name__)
+
+# Telegram accepts albums of 2-10 photos with captions up to 1024 characters
+MEDIA_GROUP_MIN = 2
+MEDIA_GROUP_MAX = 10
+CAPTION_LIMIT = 1024
+
+# Deal texts link to the click-tracked /go/ redirect; a preview would fetch it as a click
+NO_LINK_PREVIEW = LinkPreviewOptions(is_disabled=True)
+
+def merge_link_keyboards(results, footer_keyboard=None):
+    """Combine every result's Buy Now buttons, numbered, with the footer keyboard"""
+    rows = []
+    for i, (_, _, keyboard) in enumerate(results, 1):
+        if keyboard is None:
+            continue
+        for row in keyboard.inline_keyboard:
+            rows.append([InlineKeyboardButton(f"{i}. {button.text}", url=button.url) for button in row])
+
+    if footer_keyboard is not None:
+        rows.extend(footer_keyboard.inline_keyboard)
+
+    return InlineKeyboardMarkup(rows) if rows else None
+
+async def send_result(message, caption, product, keyboard=None):
+    """Send one result as a photo, falling back to text if the image fails"""
+    try:
+        if product.get('image_url'):
+            return await reply_photo(
+                message,
+                product['image_url'],
+                caption=caption,
+                reply_markup=keyboard,
+                parse_mode=ParseMode.MARKDOWN
+            )
+    except Exception as e:
+        logger.error(f"Error sending image for {product['name']}: {e}")
+
+    # Fallback to text message
+    return await reply_text(
+        message,
+        caption,
+        reply_markup=keyboard,
+        parse_mode=ParseMode.MARKDOWN,
+        link_preview_options=NO_LINK_PREVIEW
+    )
+
+async def send_album(message, captions, results):
+    """Send results as a single media group, returning False if Telegram rejects it"""
+    media = [
+        InputMediaPhoto(media=product['image_url'], caption=caption, parse_mode=ParseMode.MARKDOWN)
+        for caption, (product, _, _) in zip(captions, results)
+    ]
+
+    try:
+        await reply_media_group(message, media)
+        return True
+    except Exception as e:
+        logger.error(f"Error sending album of {len(media)} deals: {e}")
+        return False
+
+async def send_deal_results(message, results, label, footer_text, footer_keyboard=None):
+    """Send (product, deal_message, keyboard) results followed by a footer.
+
+    Results go out as one album when Telegram allows it.  Albums cannot
+    carry inline keyboards, so the Buy Now buttons move to the footer.  If
+    the album can't be built or is rejected (e.g. a broken image URL), each
+    result is sent on its own with the usual photo → text fallback.
+    """
+    total = len(results)
+    for product, _, _ in results:
+        record_view(product['id'])
+    captions = [
+        f"**{label} {i}/{total}**\n\n{deal_message}"
+        for i, (_, deal_message, _) in enumerate(results, 1)
+    ]
+
+    album = (
+        MEDIA_GROUP_MIN <= total <= MEDIA_GROUP_MAX
+        and all(product.get('image_url') for product, _, _ in results)
+        and all(len(caption) <= CAPTION_LIMIT for caption in captions)
+    )
+
+    if album and await send_album(message, captions, results):
+        footer_keyboard = merge_link_keyboards(results, footer_keyboard)
+    else:
+        for caption, (product, _, keyboard) in zip(captions, results):
+            await send_result(message, caption, product, keyboard)
+
+    await reply_text(
+        message,
+        footer_text,
+        reply_markup=footer_keyboard,
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+def result_page_caption(snapshot, offset, deal_message):
+    """Caption of one result page"""
+    total = len(snapshot.product_ids)
+    return f"🎯 **{snapshot.title}** · {offset + 1}/{total}\n\n{deal_message}"
+
+async def send_result_page(message, snapshot_id, snapshot, page, offset=0):
+    """Send a search's result page as a new message"""
+    product, deal_message, link_keyboard = page
+    record_view(product['id'])
+    keyboard = create_result_page_keyboard(snapshot_id, offset, len(snapshot.product_ids), link_keyboard)
+    return await send_result(message, result_page_caption(snapshot, offset, deal_message), product, keyboard)
+
+async def edit_result_page(message, snapshot_id, snapshot, page, offset):
+    """Show another result page by editing the page message in place"""
+    product, deal_message, link_keyboard = page
+    record_view(product['id'])
+    caption = result_page_caption(snapshot, offset, deal_message)
+    keyboard = create_result_page_keyboard(snapshot_id, offset, len(snapshot.product_ids), link_keyboard)
+
+    if not message.photo:
+        return await edit_message_text(
+            message, caption, reply_markup=keyboard, parse_mode=ParseMode.MARKDOWN, link_preview_options=NO_LINK_PREVIEW
+        )
+
+    if product.get('image_url') and len(caption) <= CAPTION_LIMIT:
+        try:
+            return await edit_message_media(
+                message,
+                InputMediaPhoto(media=product['image_url'], caption=caption, parse_mode=ParseMode.MARKDOWN),
+                reply_markup=keyboard
+            )
+        except Exception as e:
+            logger.error(f"Error editing image for {product['name']}: {e}")
+
+    # A photo message can't turn into text, so this page continues in a new text message
+    return await reply_text(
+        message, caption, reply_markup=keyboard, parse_mode=ParseMode.MARKDOWN, link_preview_options=NO_LINK_PREVIEW
+    )
@@ -0,0 +1,162 @@
+"""
+Typo-tolerant matching for searches that find nothing exactly
+"""
+import time
+from collections import deque
+
+from search_index import tokenize
+
+def max_edits(term):
+    """Number of typos tolerated for a query term of this length"""
+    if len(term) <= 3:
+        return 0
+    if len(term) <= 5:
+        return 1
+    return 2
+
+def levenshtein(a, b, limit=None):
+    """Edit distance between a and b, or limit + 1 once it is exceeded"""
+    if limit is not None and abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    # A shared prefix and suffix never cost an edit
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+    a, b = a[start:end_a], b[start:end_b]
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        left = i
+        for j, char_b in enumerate(b, 1):
+            # Cheapest of substituting, inserting and deleting, without calling min()
+            cost = previous[j - 1] + (char_a != char_b)
+            if left + 1 < cost:
+                cost = left + 1
+            if previous[j] + 1 < cost:
+                cost = previous[j] + 1
+            current.append(cost)
+            left = cost
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous = current
+
+    return previous[-1]
+
+def trigrams(term):
+    """Character trigrams of a term"""
+    return {term[i:i + 3] for i in range(len(term) - 2)}
+
+class SearchBudgetExceeded(Exception):
+    """Raised when a fuzzy lookup runs past its deadline"""
+
+class BKTree:
+    """Burkhard-Keller tree for edit-distance lookups over a vocabulary"""
+
+    def __init__(self, words=()):
+        self.root = None
+        self.size = 0
+        for word in words:
+            self.add(word)
+
+    def add(self, word):
+        """Insert a word into the tree"""
+        if self.root is None:
+            self.root = (word, {})
+            self.size = 1
+            return
+
+        node = self.root
+        while True:
+            distance = levenshtein(word, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (word, {})
+                self.size += 1
+                return
+            node = child
+
+    def search(self, word, max_distance, deadline=None):
+        """Return the words within max_distance edits of word.
+
+        Raises SearchBudgetExceeded if time.perf_counter() passes deadline.
+        """
+        if self.root is None:
+            return []
+
+        matches = []
+        stack = [self.root]
+        while stack:
+            if deadline is not None and time.perf_counter() > deadline:
+                raise SearchBudgetExceeded(word)
+
+            candidate, children = stack.pop()
+            distance = levenshtein(word, candidate)
+            if distance <= max_distance:
+                matches.append(candidate)
+
+            low, high = distance - max_distance, distance + max_distance
+            stack.extend(child for d, child in children.items() if low <= d <= high)
+
+        return matches
+
+class FuzzyIndex:
+    """BK-tree over the tokens of a SearchIndex, built at load time.
+
+    Tokens of products added later wait in a pending list, checked by a
+    plain scan, until index_pending() moves them into the tree a slice at
+    a time; each BK-tree insertion costs several edit distances, too much
+    to pay for every new token of a feed batch on the event loop.
+    """
+
+    def __init__(self, search_index):
+        self.search_index = search_index
+        self.tree = BKTree(search_index.postings)
+        self.pending = deque()
+
+    def add(self, tokens):
+        """Make new tokens fuzzily searchable"""
+        self.pending.extend(tokens)
+
+    def index_pending(self, deadline=None):
+        """Move pending tokens into the tree until deadline; returns whether any are left"""
+        while self.pending:
+            if deadline is not None and time.perf_counter() > deadline:
+                return True
+            self.tree.add(self.pending.popleft())
+        return False
+
+    def match_term(self, term, deadline=None):
+        """Ids of products with a token within max_edits(term) of term"""
+        matches = self.search_index.match_term(term)
+        limit = max_edits(term)
+        tokens = self.tree.search(term, limit, deadline)
+        tokens += [token for token in self.pending if levenshtein(term, token, limit) <= limit]
+        for token in tokens:
+            matches.update(self.search_index.postings[token])
+        return matches
+
+    def search(self, query, platform=None, deadline=None):
+        """Return ids of products fuzzily matching every query term, in catalog order"""
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        ids = None
+        for term in sorted(set(terms), key=len, reverse=True):
+            matches = self.match_term(term, deadline)
+            ids = matches if ids is None else ids & matches
+            if not ids:
+                return []
+
+        if platform and platform != 'all':
+            ids &= self.search_index.platform_postings.get(platform, set())
+
+        return sorted(ids)
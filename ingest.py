@@ -0,0 +1,289 @@
+"""
+Streaming ingestion of per-platform deal feeds
+
+A feed lists one platform's current deals, one product per line, as
+newline-delimited JSON or CSV with a header row:
+
+    {"name": "iPhone 15", "listing": "smartphones", "original_price": 79900,
+     "discount_price": 69900, "coupon": "APPLE10", "cashback": 2000}
+
+'listing' (or 'category') places new products; 'discount' is worked out
+from the prices when missing, and 'bogo', 'bank_offer', 'image' and
+'image_url' are optional.  Rows are read and applied in batches, and only
+deals that differ from the catalog are written, so every index and cache
+updates product by product through the catalog change listeners.  A feed
+is the platform's full list: catalog deals it no longer mentions are
+removed once it has been read to the end.
+
+Apply a feed to the SQLite catalog by hand with:
+
+    CATALOG_BACKEND=sqlite python ingest.py <platform> <path/to/feed.ndjson|feed.csv>
+"""
+import asyncio
+import csv
+import json
+import logging
+import os
+import time
+from itertools import islice
+
+from catalog import PLATFORMS, get_catalog, notify_catalog_changed
+from config import (
+    CATALOG_BACKEND, FEED_DIR, FEED_REFRESH_INTERVAL, INGEST_BATCH_SIZE, INGEST_LOOP_BATCH_SIZE,
+    INGEST_SLICE_SECONDS, CATALOG_CHANGES_POLL_INTERVAL, WORKER_NODES, WORKER_URL
+)
+from persistence import HASH_RING
+
+logger = logging.getLogger(__name__)
+
+# Deal fields compared when diffing a feed row against the catalog
+DEAL_FIELDS = ('original_price', 'discount_price', 'discount', 'coupon', 'cashback', 'bogo', 'bank_offer')
+
+# Feed files looked for in FEED_DIR, per platform
+FEED_EXTENSIONS = ('.ndjson', '.jsonl', '.csv')
+
+def read_ndjson(path):
+    """Yield one dict per non-empty line of a JSON lines file"""
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                logger.warning(f"Skipping line {line_number} of {path}: {e}")
+
+def read_csv(path):
+    """Yield one dict per row of a CSV file with a header"""
+    with open(path, encoding='utf-8', newline='') as f:
+        yield from csv.DictReader(f)
+
+def read_feed(path):
+    """Yield a feed's rows, picking the reader from the file extension"""
+    if path.endswith('.csv'):
+        return read_csv(path)
+    return read_ndjson(path)
+
+def _flag(value):
+    """Feed booleans arrive as JSON booleans or CSV strings"""
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'y')
+    return bool(value)
+
+def parse_row(row):
+    """(listing, product fields, deal) from a feed row; raises ValueError or KeyError if it is malformed"""
+    name = str(row['name']).strip()
+    if not name:
+        raise ValueError("empty product name")
+
+    original_price = int(float(row['original_price']))
+    discount_price = int(float(row['discount_price']))
+    if row.get('discount') not in (None, ''):
+        discount = int(float(row['discount']))
+    else:
+        discount = round((original_price - discount_price) * 100 / original_price) if original_price else 0
+
+    deal = {
+        'original_price': original_price,
+        'discount_price': discount_price,
+        'discount': discount,
+        'coupon': row.get('coupon') or None,
+        'cashback': int(float(row.get('cashback') or 0)),
+    }
+    if _flag(row.get('bogo')):
+        deal['bogo'] = True
+    if row.get('bank_offer'):
+        deal['bank_offer'] = row['bank_offer']
+
+    fields = {
+        'name': name,
+        'category': row.get('category') or None,
+        'image': row.get('image') or '📦',
+        'image_url': row.get('image_url') or None,
+    }
+    listing = (row.get('listing') or row.get('category') or 'other').lower()
+    return listing, fields, deal
+
+def same_deal(current, deal):
+    """Whether a catalog deal already matches a feed deal"""
+    if not current:
+        return False
+    return all(current.get(field) == deal.get(field) for field in DEAL_FIELDS)
+
+def iter_feed_changes(platform, rows, catalog=None, batch_size=INGEST_BATCH_SIZE, remove_missing=True, report=None):
+    """Apply a feed to the catalog batch by batch, yielding the ids changed by each batch.
+
+    Only one batch of rows is held at a time; ids of the products the feed
+    mentions are remembered so deals missing from it can be removed at the
+    end.  report, if given, is a dict filled with row and change counts.
+    """
+    catalog = catalog or get_catalog()
+    report = report if report is not None else {}
+    for key in ('rows', 'skipped', 'added', 'changed', 'removed'):
+        report.setdefault(key, 0)
+
+    seen = set()
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+
+        parsed = {}
+        for row in batch:
+            report['rows'] += 1
+            try:
+                listing, fields, deal = parse_row(row)
+            except (KeyError, TypeError, ValueError) as e:
+                report['skipped'] += 1
+                logger.debug(f"Skipping {platform} feed row {report['rows']}: {e}")
+                continue
+            # A product repeated within a batch keeps its last row
+            parsed[fields['name'].lower()] = (listing, fields, deal)
+
+        known = catalog.find_product_ids(parsed)
+        changed = set()
+
+        new_names = [name for name in parsed if name not in known]
+        if new_names:
+            listed = []
+            for name in new_names:
+                listing, fields, deal = parsed[name]
+                listed.append((listing, {**fields, 'deals': {p: deal if p == platform else None for p in PLATFORMS}}))
+            for name, product_id in zip(new_names, catalog.add_products(listed)):
+                known[name] = [product_id]
+                changed.add(product_id)
+            report['added'] += len(new_names)
+        for product_ids in known.values():
+            seen.update(product_ids)
+
+        updates = []
+        current = catalog.get_products(sorted(set().union(*known.values())) if known else [])
+        for product in current:
+            name = product['name'].lower()
+            if name in parsed and product['id'] not in changed:
+                deal = parsed[name][2]
+                if not same_deal(product['deals'].get(platform), deal):
+                    updates.append((product['id'], platform, deal))
+
+        if updates:
+            catalog.update_deals(updates)
+            report['changed'] += len(updates)
+            changed.update(product_id for product_id, _, _ in updates)
+        if changed:
+            yield sorted(changed)
+
+    if remove_missing:
+        missing = iter(sorted(catalog.platform_product_ids(platform) - seen))
+        while True:
+            batch = list(islice(missing, batch_size))
+            if not batch:
+                break
+            catalog.update_deals([(product_id, platform, None) for product_id in batch])
+            report['removed'] += len(batch)
+            yield batch
+
+    catalog.refresh_rankings()
+
+def _log_report(platform, report):
+    """Log what a feed run changed"""
+    logger.info(
+        f"📥 {platform} feed: {report['rows']} rows, {report['added']} added, {report['changed']} changed, "
+        f"{report['removed']} removed, {report['skipped']} skipped"
+    )
+
+def ingest_feed(platform, rows, catalog=None, batch_size=INGEST_BATCH_SIZE, remove_missing=True):
+    """Apply a whole feed, notifying listeners batch by batch; returns the report"""
+    catalog = catalog or get_catalog()
+    report = {}
+    for product_ids in iter_feed_changes(platform, rows, catalog, batch_size, remove_missing, report):
+        notify_catalog_changed(product_ids)
+    catalog.index_pending()
+    _log_report(platform, report)
+    return report
+
+async def ingest_feed_async(platform, rows, catalog=None, batch_size=INGEST_BATCH_SIZE, remove_missing=True):
+    """Apply a feed from the event loop, notifying listeners on the loop batch by batch.
+
+    Catalogs that allow it (SQLite) read and write each batch, and re-rank
+    at the end, in a worker thread.  The in-memory catalog is updated on the
+    loop in batches of at most INGEST_LOOP_BATCH_SIZE rows, and the typo
+    index catches up on each batch's new tokens in INGEST_SLICE_SECONDS
+    slices, yielding to other updates in between.
+    """
+    catalog = catalog or get_catalog()
+    report = {}
+    if catalog.threaded_writes:
+        changes = iter_feed_changes(platform, rows, catalog, batch_size, remove_missing, report)
+        while (product_ids := await asyncio.to_thread(next, changes, None)) is not None:
+            notify_catalog_changed(product_ids)
+    else:
+        changes = iter_feed_changes(
+            platform, rows, catalog, min(batch_size, INGEST_LOOP_BATCH_SIZE), remove_missing, report
+        )
+        for product_ids in changes:
+            notify_catalog_changed(product_ids)
+            await asyncio.sleep(0)
+            while catalog.index_pending(time.perf_counter() + INGEST_SLICE_SECONDS):
+                await asyncio.sleep(0)
+    _log_report(platform, report)
+    return report
+
+def find_feed(platform, directory=FEED_DIR):
+    """Path of a platform's feed in directory, or None"""
+    for extension in FEED_EXTENSIONS:
+        path = os.path.join(directory, platform + extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+_feed_mtimes = {}
+
+async def ingest_feeds_job(context):
+    """Job: apply every platform feed in FEED_DIR that changed since the last run"""
+    for platform in PLATFORMS:
+        path = find_feed(platform)
+        if path is None:
+            continue
+
+        mtime = os.path.getmtime(path)
+        if _feed_mtimes.get(path) == mtime:
+            continue
+
+        try:
+            await ingest_feed_async(platform, read_feed(path))
+            _feed_mtimes[path] = mtime
+        except Exception as e:
+            logger.error(f"Error ingesting {platform} feed {path}: {e}")
+
+async def follow_catalog_changes_job(context):
+    """Job: pick up deal changes another worker wrote to the shared catalog"""
+    product_ids = await asyncio.to_thread(get_catalog().poll_changes)
+    if product_ids:
+        notify_catalog_changed(product_ids)
+
+def schedule_ingestion(job_queue):
+    """Schedule feed ingestion and, for a shared catalog, following other workers' changes"""
+    if job_queue is None:
+        logger.warning("⚠️ Job queue unavailable, feed ingestion is disabled")
+        return
+
+    if CATALOG_BACKEND == 'sqlite':
+        # Every worker reads the shared database; one of them writes the feeds into it
+        job_queue.run_repeating(follow_catalog_changes_job, CATALOG_CHANGES_POLL_INTERVAL, first=0,
+                                name="catalog-changes")
+        ingests_here = not WORKER_NODES or HASH_RING.node_for('catalog-ingest') == WORKER_URL
+    else:
+        # Each worker keeps its own in-memory catalog up to date
+        ingests_here = True
+
+    if FEED_REFRESH_INTERVAL > 0 and ingests_here:
+        job_queue.run_repeating(ingest_feeds_job, FEED_REFRESH_INTERVAL, first=5, name="feed-ingest")
+        logger.info(f"📥 Checking {FEED_DIR} for deal feeds every {FEED_REFRESH_INTERVAL}s")
+
+if __name__ == '__main__':
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) != 3 or sys.argv[1] not in PLATFORMS:
+        sys.exit(f"usage: python ingest.py <{'|'.join(PLATFORMS)}> <feed file>")
+    ingest_feed(sys.argv[1], read_feed(sys.argv[2]))
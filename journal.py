@@ -0,0 +1,293 @@
+"""
+Durable journal of incoming webhook updates
+
+The webhook appends each raw JSON body to a memory-mapped, append-only file
+and answers Telegram straight away; a consumer pulls batches from the
+journal, hands them to the Application and acknowledges them once they have
+been processed.  Updates that were journaled but not acknowledged when the
+process stopped are replayed on the next start.
+
+File layout (little endian):
+
+    header   magic (4) | padding (4) | acknowledged offset (8) | reserved (16)
+    record   body length (4) | update_id (8) | raw JSON body
+    end      a zero body length
+
+A record's length is written last, so a record torn by a crash reads as the
+end of the journal.  When the file fills up, the unacknowledged tail is
+moved back to the start; if it still doesn't fit the journal is full and
+the webhook refuses updates until the consumer catches up.
+"""
+import asyncio
+import collections
+import fcntl
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+
+from telegram import Update
+
+from config import UPDATE_JOURNAL_SIZE, UPDATE_BATCH_SIZE, UPDATE_DEDUPE_WINDOW
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'SSJ1'
+HEADER = struct.Struct('<4s4xQ16x')
+RECORD = struct.Struct('<IQ')
+END = struct.pack('<I', 0)
+
+# Telegram puts update_id first; reading it this way avoids parsing the body
+UPDATE_ID = re.compile(rb'"update_id"\s*:\s*(\d+)')
+
+class JournalFull(Exception):
+    """No room for another update until the consumer acknowledges some"""
+
+class UpdateJournal:
+    """Append-only, memory-mapped journal of raw update bodies.
+
+    Offsets handed to consumers are logical: they keep increasing when the
+    file is compacted, so acknowledgements stay valid across compactions.
+    """
+
+    def __init__(self, path, size=UPDATE_JOURNAL_SIZE, dedupe_window=UPDATE_DEDUPE_WINDOW):
+        exists = os.path.exists(path) and os.path.getsize(path) >= HEADER.size + len(END)
+        self._file = open(path, 'r+b' if exists else 'w+b')
+        try:
+            # Two workers appending to one journal would corrupt each other's records
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._file.close()
+            raise RuntimeError(f"Update journal {path} is in use by another worker; set UPDATE_JOURNAL_PATH per worker")
+        if not exists:
+            self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self.size = len(self._map)
+
+        self._seen = set()
+        self._recent = collections.deque(maxlen=dedupe_window)
+        self._shift = 0
+        self._available = asyncio.Event()
+        self.appended = 0
+        self.duplicates = 0
+
+        magic, ack = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            ack = HEADER.size
+            HEADER.pack_into(self._map, 0, MAGIC, ack)
+            self._map[ack:ack + len(END)] = END
+        self._ack = ack
+
+        # Find the end of the journal, remembering ids for deduplication
+        offset = HEADER.size
+        while True:
+            record = self._record_at(offset)
+            if record is None:
+                break
+            update_id, end = record[0], record[2]
+            self._remember(update_id)
+            offset = end
+        self._write = offset
+        self._read = self._ack
+        self.replayed = self.pending_records()
+
+    def _record_at(self, offset):
+        """(update_id, body slice, end offset) of the record at offset, or None at the end"""
+        if offset + RECORD.size > self.size:
+            return None
+        length, update_id = RECORD.unpack_from(self._map, offset)
+        end = offset + RECORD.size + length
+        if not length or end > self.size:
+            return None
+        return update_id, slice(offset + RECORD.size, end), end
+
+    def _remember(self, update_id):
+        if len(self._recent) == self._recent.maxlen:
+            self._seen.discard(self._recent[0])
+        self._recent.append(update_id)
+        self._seen.add(update_id)
+
+    def pending_records(self):
+        """Number of records not yet acknowledged"""
+        count, offset = 0, self._ack
+        while offset < self._write:
+            offset = self._record_at(offset)[2]
+            count += 1
+        return count
+
+    @property
+    def backlog(self):
+        """Bytes journaled but not yet acknowledged"""
+        return self._write - self._ack
+
+    def append(self, body):
+        """Journal a raw update body; returns False if the update was already journaled.
+
+        Raises JournalFull when there is no room left.
+        """
+        match = UPDATE_ID.search(body, 0, 64) or UPDATE_ID.search(body)
+        if not match:
+            raise ValueError("Update has no update_id")
+        update_id = int(match.group(1))
+        if update_id in self._seen:
+            self.duplicates += 1
+            return False
+
+        needed = RECORD.size + len(body) + len(END)
+        if self._write + needed > self.size:
+            self._compact()
+            if self._write + needed > self.size:
+                raise JournalFull(f"Update journal full ({self.backlog} bytes unacknowledged)")
+
+        start = self._write + RECORD.size
+        end = start + len(body)
+        self._map[start:end] = body
+        self._map[end:end + len(END)] = END
+        RECORD.pack_into(self._map, self._write, len(body), update_id)
+
+        self._write = end
+        self._remember(update_id)
+        self.appended += 1
+        self._available.set()
+        return True
+
+    def _compact(self):
+        """Move the unacknowledged records to the start of the file"""
+        delta = self._ack - HEADER.size
+        if not delta:
+            return
+        length = self._write - self._ack
+        self._map.move(HEADER.size, self._ack, length)
+        self._write -= delta
+        self._read -= delta
+        self._ack = HEADER.size
+        self._shift += delta
+        self._map[self._write:self._write + len(END)] = END
+        HEADER.pack_into(self._map, 0, MAGIC, self._ack)
+        self._map.flush()
+
+    def read_batch(self, limit=UPDATE_BATCH_SIZE):
+        """Up to limit unread records as (logical end offset, raw body) pairs"""
+        batch = []
+        while len(batch) < limit and self._read < self._write:
+            _, body, end = self._record_at(self._read)
+            batch.append((end + self._shift, self._map[body]))
+            self._read = end
+        if self._read >= self._write:
+            self._available.clear()
+        return batch
+
+    def ack(self, offset):
+        """Acknowledge every record up to a logical offset returned by read_batch"""
+        offset -= self._shift
+        if offset > self._ack:
+            self._ack = offset
+            HEADER.pack_into(self._map, 0, MAGIC, offset)
+
+    async def wait(self, timeout=None):
+        """Wait until there are unread records"""
+        if self._read < self._write:
+            return
+        try:
+            await asyncio.wait_for(self._available.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def flush(self):
+        """Write the mapped pages back to disk"""
+        self._map.flush()
+
+    def close(self):
+        self._map.flush()
+        self._map.close()
+        self._file.close()
+
+    def stats(self):
+        """Counters for monitoring"""
+        return {
+            'backlog_bytes': self.backlog,
+            'size': self.size,
+            'appended': self.appended,
+            'duplicates': self.duplicates,
+            'replayed': self.replayed
+        }
+
+class JournalConsumer:
+    """Feed journaled updates to an Application and acknowledge them in order.
+
+    At most max_pending updates are in flight: each one takes a slot before
+    its task is created and gives it back when the task finishes, so the
+    backlog waits on disk instead of in memory.  A record is acknowledged
+    once it and every record before it have been processed.
+    """
+
+    def __init__(self, application, journal, batch_size=UPDATE_BATCH_SIZE):
+        self.application = application
+        self.journal = journal
+        self.batch_size = batch_size
+        self._inflight = collections.deque()  # (logical end offset, task)
+        self._slots = None
+        self._task = None
+
+    def start(self):
+        self._slots = asyncio.Semaphore(self.application.update_processor.max_pending)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self, timeout=10):
+        """Stop pulling, give running updates time to finish and persist the acknowledgements"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        tasks = [task for _, task in self._inflight]
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+        self._advance()
+        self.journal.flush()
+
+    async def _run(self):
+        processor = self.application.update_processor
+        while True:
+            batch = self.journal.read_batch(self.batch_size)
+            if not batch:
+                await self.journal.wait(timeout=0.05)
+                continue
+
+            for offset, body in batch:
+                try:
+                    update = Update.de_json(json.loads(body), self.application.bot)
+                except Exception as e:
+                    logger.error(f"Dropping malformed journaled update: {e}")
+                    self._inflight.append((offset, None))
+                    continue
+
+                # Wait for a running update to finish once max_pending are in flight
+                await self._slots.acquire()
+                task = asyncio.get_running_loop().create_task(
+                    processor.process_update(update, self.application.process_update(update))
+                )
+                task.add_done_callback(self._done)
+                self._inflight.append((offset, task))
+            self._advance()
+            # Let the updates just started run before pulling the next batch
+            await asyncio.sleep(0)
+
+    def _done(self, task):
+        self._slots.release()
+        if not task.cancelled() and task.exception():
+            logger.error(f"Error processing journaled update: {task.exception()}")
+        self._advance()
+
+    def _advance(self):
+        """Acknowledge the longest prefix of finished records"""
+        offset = None
+        while self._inflight and (self._inflight[0][1] is None or self._inflight[0][1].done()):
+            offset = self._inflight.popleft()[0]
+        if offset is not None:
+            self.journal.ack(offset)
@@ -0,0 +1,25 @@
+"""
+Shared, pre-serialized inline keyboards
+"""
+from telegram import InlineKeyboardMarkup
+
+class StaticInlineKeyboardMarkup(InlineKeyboardMarkup):
+    """InlineKeyboardMarkup that builds its request payload once at construction.
+
+    Telegram objects are frozen after __init__, so the dict python-telegram-bot
+    puts in every sendMessage request (it calls to_dict() and json.dumps()
+    the result) can be reused for every request that sends this keyboard.
+    """
+
+    __slots__ = ('_cached_dict',)
+
+    def __init__(self, inline_keyboard, **kwargs):
+        super().__init__(inline_keyboard, **kwargs)
+        with self._unfrozen():
+            self._cached_dict = super().to_dict()
+
+    def to_dict(self, recursive=True):
+        """Return the payload built at construction"""
+        if not recursive:
+            return super().to_dict(recursive=False)
+        return self._cached_dict
@@ -0,0 +1,169 @@
+"""
+Click-tracked Buy Now links
+
+When CLICK_TRACKING_URL is set, Buy Now buttons point at /go/<link id> on
+the bot's web server instead of straight at the shop.  A link id packs the
+product id, the platform and a short hash of the product name, so any
+worker can resolve any link; resolved links are kept in an in-memory map so
+a popular deal is a dict lookup.  The redirect only appends the click to an
+in-memory buffer, and ClickLog writes the buffer to SQLite in batches off
+the request path.
+"""
+import asyncio
+import base64
+import hashlib
+import logging
+import sqlite3
+import time
+from collections import deque
+
+from cache import TTLCache
+from config import (
+    CLICK_TRACKING_URL, CLICK_DB_PATH, CLICK_LINK_CACHE_SIZE, CLICK_LOG_BATCH_SIZE, CLICK_LOG_FLUSH_INTERVAL,
+    CLICK_LOG_MAX_PENDING
+)
+from deal_store import PLATFORMS
+from metrics import CLICKS
+from trending import record_click
+from utils import get_product_link
+
+logger = logging.getLogger(__name__)
+
+# Resolved links live as long as the deals they point to are likely to
+LINK_TTL = 7 * 24 * 60 * 60
+
+# link id -> (product_id, platform, shop url)
+LINKS = TTLCache(CLICK_LINK_CACHE_SIZE, LINK_TTL)
+
+# User-Agent of Telegram's link preview fetcher, which follows links no user clicked
+PREVIEW_USER_AGENT = 'TelegramBot'
+
+def _name_check(name):
+    """Two bytes of the product name, so ids from an older catalog don't resolve to another product"""
+    return hashlib.blake2b(name.lower().encode(), digest_size=2).digest()
+
+def link_id(product_id, platform, name):
+    """Short URL-safe id of a (product, platform) link"""
+    raw = product_id.to_bytes(4, 'big') + bytes([PLATFORMS.index(platform)]) + _name_check(name)
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+def buy_link(product, platform):
+    """Buy Now URL for a product on a platform, click-tracked when enabled"""
+    url = get_product_link(product['name'], platform)
+    if not CLICK_TRACKING_URL or 'id' not in product:
+        return url
+
+    short_id = link_id(product['id'], platform, product['name'])
+    LINKS.set(short_id, (product['id'], platform, url))
+    return f"{CLICK_TRACKING_URL}/go/{short_id}"
+
+def resolve_link(short_id):
+    """(product_id, platform, shop url) of a link id, or None if it is not a current product"""
+    link = LINKS.get(short_id)
+    if link is not None:
+        return link
+
+    try:
+        raw = base64.urlsafe_b64decode(short_id + '=' * (-len(short_id) % 4))
+    except ValueError:
+        return None
+    if len(raw) != 7 or raw[4] >= len(PLATFORMS):
+        return None
+
+    from catalog import get_catalog
+    product_id, platform = int.from_bytes(raw[:4], 'big'), PLATFORMS[raw[4]]
+    product = get_catalog().get_product(product_id)
+    if product is None or _name_check(product['name']) != raw[5:]:
+        return None
+
+    link = (product_id, platform, get_product_link(product['name'], platform))
+    LINKS.set(short_id, link)
+    return link
+
+def is_link_preview(user_agent):
+    """Whether a request comes from Telegram building a link preview rather than a user"""
+    return PREVIEW_USER_AGENT in (user_agent or '')
+
+def follow_link(short_id, count=True):
+    """Record a click on a link (unless count is False) and return the shop URL, or None for unknown links"""
+    link = resolve_link(short_id)
+    if link is None:
+        return None
+
+    product_id, platform, url = link
+    if not count:
+        return url
+    CLICK_LOG.record(product_id, platform)
+    record_click(product_id)
+    CLICKS.inc(platform)
+    return url
+
+class ClickLog:
+    """Clicks buffered in memory and appended to SQLite in batches"""
+
+    def __init__(self, path=CLICK_DB_PATH, batch_size=CLICK_LOG_BATCH_SIZE,
+                 flush_interval=CLICK_LOG_FLUSH_INTERVAL, max_pending=CLICK_LOG_MAX_PENDING):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # If the disk falls behind, the oldest unwritten clicks are dropped
+        self.pending = deque(maxlen=max_pending)
+        self._full = asyncio.Event()
+        self._stopping = False
+        self._task = None
+        self._conn = None
+
+    def record(self, product_id, platform):
+        """Buffer one click; never blocks"""
+        self.pending.append((time.time(), product_id, platform))
+        if len(self.pending) >= self.batch_size:
+            self._full.set()
+
+    def _write(self, batch):
+        """Append a batch of clicks (runs in a worker thread, one batch at a time)"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS clicks (clicked_at REAL NOT NULL, product_id INTEGER NOT NULL, "
+                "platform TEXT NOT NULL)"
+            )
+        with self._conn:
+            self._conn.executemany("INSERT INTO clicks (clicked_at, product_id, platform) VALUES (?, ?, ?)", batch)
+
+    async def flush(self):
+        """Write every buffered click"""
+        while self.pending:
+            batch = [self.pending.popleft() for _ in range(min(self.batch_size, len(self.pending)))]
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except Exception as e:
+                logger.error(f"Error logging {len(batch)} clicks: {e}")
+                # Retried on the next flush
+                self.pending.extendleft(reversed(batch))
+                return
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            await self.flush()
+
+    def start(self):
+        self._stopping = False
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Write what is buffered and stop; a batch being written is never abandoned"""
+        self._stopping = True
+        self._full.set()
+        if self._task:
+            await self._task
+            self._task = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+CLICK_LOG = ClickLog()
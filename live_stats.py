@@ -0,0 +1,284 @@
+"""
+Streaming aggregates for the live dashboard
+
+Every counter here is updated incrementally as updates arrive and uses a
+fixed amount of memory: sliding windows of time slots for rates and
+latency, HyperLogLog for distinct users and a count-min sketch for the most
+searched queries.  LiveFeed turns them into one JSON snapshot per interval
+that every dashboard viewer shares.
+"""
+import asyncio
+import bisect
+import hashlib
+import json
+import math
+import time
+from datetime import date
+
+from config import DASHBOARD_TOKEN, LIVE_FEED_INTERVAL, TOP_QUERY_COUNT, TOP_QUERY_HALF_LIFE
+
+def _hash64(value):
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+
+class SlidingWindowCounter:
+    """Events in the last window seconds, kept in slots of window / slots seconds"""
+
+    def __init__(self, window=60, slots=60):
+        self.slot_length = window / slots
+        self.counts = [0] * slots
+        self.epochs = [-1] * slots
+
+    def _current(self):
+        return int(time.monotonic() / self.slot_length)
+
+    def add(self, amount=1):
+        epoch = self._current()
+        index = epoch % len(self.counts)
+        if self.epochs[index] != epoch:
+            self.epochs[index] = epoch
+            self.counts[index] = 0
+        self.counts[index] += amount
+
+    def total(self):
+        oldest = self._current() - len(self.counts)
+        return sum(count for count, epoch in zip(self.counts, self.epochs) if epoch > oldest)
+
+# Geometric latency buckets from 1ms to about 60s, 20% apart
+LATENCY_BOUNDS = tuple(0.001 * 1.2 ** i for i in range(61))
+
+class LatencyWindow:
+    """Latency percentiles over a sliding window, from per-slot bucket counts"""
+
+    def __init__(self, window=60, slots=12):
+        self.slot_length = window / slots
+        self.slots = [[0] * (len(LATENCY_BOUNDS) + 1) for _ in range(slots)]
+        self.epochs = [-1] * slots
+
+    def _current(self):
+        return int(time.monotonic() / self.slot_length)
+
+    def observe(self, seconds):
+        epoch = self._current()
+        index = epoch % len(self.slots)
+        if self.epochs[index] != epoch:
+            self.epochs[index] = epoch
+            self.slots[index] = [0] * (len(LATENCY_BOUNDS) + 1)
+        self.slots[index][bisect.bisect_left(LATENCY_BOUNDS, seconds)] += 1
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given percentile, or None without data"""
+        oldest = self._current() - len(self.slots)
+        live = [counts for counts, epoch in zip(self.slots, self.epochs) if epoch > oldest]
+        totals = [sum(column) for column in zip(*live)] if live else []
+        observed = sum(totals)
+        if not observed:
+            return None
+
+        rank = math.ceil(observed * fraction)
+        seen = 0
+        for bound, count in zip(LATENCY_BOUNDS + (float('inf'),), totals):
+            seen += count
+            if seen >= rank:
+                return bound if bound != float('inf') else LATENCY_BOUNDS[-1]
+
+class HyperLogLog:
+    """Approximate distinct count in 2**precision bytes (about 1.6% error at 12)"""
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value):
+        hashed = _hash64(value)
+        index = hashed >> (64 - self.precision)
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate while most registers are empty
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+class CountMinSketch:
+    """Approximate frequencies; estimates never undercount"""
+
+    def __init__(self, width=2048, depth=4):
+        self.width = width
+        self.rows = [[0] * width for _ in range(depth)]
+
+    def _indexes(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        return [(h1 + i * h2) % self.width for i in range(len(self.rows))]
+
+    def add(self, item, amount=1):
+        """Count item and return its new estimate"""
+        estimate = None
+        for row, index in zip(self.rows, self._indexes(item)):
+            row[index] += amount
+            estimate = row[index] if estimate is None else min(estimate, row[index])
+        return estimate
+
+    def estimate(self, item):
+        return min(row[index] for row, index in zip(self.rows, self._indexes(item)))
+
+    def decay(self):
+        """Halve every counter so older activity fades out"""
+        for row in self.rows:
+            row[:] = [count >> 1 for count in row]
+
+class TopQueries:
+    """Most frequent recent search queries, tracked with a count-min sketch.
+
+    Only the current leaders are kept by name; every half_life seconds all
+    counts are halved so the ranking follows what people search now.
+    """
+
+    def __init__(self, k=TOP_QUERY_COUNT, half_life=TOP_QUERY_HALF_LIFE, capacity=None):
+        self.k = k
+        self.capacity = capacity or k * 4
+        self.half_life = half_life
+        self.sketch = CountMinSketch()
+        self.leaders = {}
+        self._decayed = time.monotonic()
+
+    def add(self, query):
+        now = time.monotonic()
+        if now - self._decayed >= self.half_life:
+            self._decayed = now
+            self.sketch.decay()
+            self.leaders = {q: self.sketch.estimate(q) for q in self.leaders}
+
+        estimate = self.sketch.add(query)
+        if query in self.leaders or len(self.leaders) < self.capacity:
+            self.leaders[query] = estimate
+            return
+
+        weakest = min(self.leaders, key=self.leaders.get)
+        if estimate > self.leaders[weakest]:
+            del self.leaders[weakest]
+            self.leaders[query] = estimate
+
+    def top(self):
+        """[(query, estimated count)] most searched first"""
+        return sorted(self.leaders.items(), key=lambda item: item[1], reverse=True)[:self.k]
+
+class LiveStats:
+    """Dashboard aggregates for this worker.
+
+    Users' search text is only counted and published when the dashboard
+    is behind DASHBOARD_TOKEN.
+    """
+
+    def __init__(self, share_queries=bool(DASHBOARD_TOKEN)):
+        self.share_queries = share_queries
+        self.users = HyperLogLog()
+        self.active_today = HyperLogLog()
+        self.today = date.today()
+        self.searches = 0
+        self.searches_per_minute = SlidingWindowCounter()
+        self.top_queries = TopQueries()
+        self.latency = LatencyWindow()
+        self.alerts = 0
+
+    def record_user(self, user_id):
+        if date.today() != self.today:
+            self.today = date.today()
+            self.active_today = HyperLogLog()
+        self.users.add(user_id)
+        self.active_today.add(user_id)
+
+    def record_search(self, query):
+        self.searches += 1
+        self.searches_per_minute.add()
+        if query and self.share_queries:
+            self.top_queries.add(query)
+
+    def record_latency(self, seconds):
+        self.latency.observe(seconds)
+
+    def snapshot(self):
+        """The 'stats' message the dashboard expects"""
+        p95 = self.latency.percentile(0.95)
+        snapshot = {
+            'type': 'stats',
+            'totalUsers': self.users.count(),
+            'activeToday': self.active_today.count() if date.today() == self.today else 0,
+            'searches': self.searches,
+            'searchesPerMinute': self.searches_per_minute.total(),
+            'p95LatencyMs': round(p95 * 1000, 1) if p95 is not None else None,
+            'alerts': self.alerts
+        }
+        if self.share_queries:
+            snapshot['topQueries'] = [{'query': query, 'count': count} for query, count in self.top_queries.top()]
+        return snapshot
+
+LIVE_STATS = LiveStats()
+
+class LiveFeed:
+    """Publishes one serialized snapshot per interval to every subscriber.
+
+    The snapshot is computed and encoded once no matter how many viewers are
+    connected; each viewer only waits for the next version and sends it.
+    Slow viewers simply skip versions instead of queueing them.
+    """
+
+    def __init__(self, stats=LIVE_STATS, interval=LIVE_FEED_INTERVAL):
+        self.stats = stats
+        self.interval = interval
+        self.payload = None
+        self.version = 0
+        self.viewers = 0
+        self._published = asyncio.Event()
+        self._task = None
+
+    def publish(self):
+        self.payload = json.dumps(self.stats.snapshot())
+        self.version += 1
+        published, self._published = self._published, asyncio.Event()
+        published.set()
+
+    async def next(self, version):
+        """Wait for a payload newer than version and return (version, payload)"""
+        while self.version <= version:
+            await self._published.wait()
+        return self.version, self.payload
+
+    async def _run(self):
+        while True:
+            if self.viewers:
+                self.publish()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def subscribe(self):
+        """Yield payloads for one viewer, starting with the latest one"""
+        self.viewers += 1
+        try:
+            if self.payload is None or self.viewers == 1:
+                # Nothing was published while nobody watched
+                self.publish()
+            version, payload = self.version, self.payload
+            while True:
+                yield payload
+                version, payload = await self.next(version)
+        finally:
+            self.viewers -= 1
@@ -3,16 +3,28 @@
 ShopSavvy - Telegram Bot for Finding Deals Across Indian E-commerce Platforms
 """
 import logging
+import os
 from telegram.ext import (
     Application, CommandHandler, CallbackQueryHandler, 
     ConversationHandler, MessageHandler, filters
 )
 
-from config import BOT_TOKEN, PLATFORM_SELECTION, PRODUCT_SEARCH, CATEGORY_SEARCH
+from alerts import PRICE_ALERTS
+from broadcast import schedule_broadcasts
+from cache import prerender_deals
+from config import BOT_TOKEN, PLATFORM_SELECTION, PRODUCT_SEARCH, CATEGORY_SEARCH, DEAL_TYPE_SELECTION, PRICE_ALERT, PRERENDER_DEALS
+from deal_filters import build_deal_type_index
+from ingest import schedule_ingestion
+from trending import schedule_trending
+from outbound import BotTransport, OutboundScheduler, configure_outbound
+from persistence import create_persistence, create_store
+from update_processor import PerChatUpdateProcessor
+from utils import build_static_keyboards
 from bot_handlers import (
     start, help_command, deals_command, button_callback,
     handle_product_search, handle_invalid_input, cancel_conversation,
-    handle_text_message, error_handler
+    handle_text_message, handle_price_alert, alerts_command,
+    subscribe_command, unsubscribe_command, error_handler
 )
 
 # Enable logging
@@ -22,6 +34,13 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def post_init(application):
+    """Load saved price alerts and schedule broadcasts, feed ingestion and trending sync once the bot is initialized"""
+    await PRICE_ALERTS.load(create_store())
+    schedule_broadcasts(application.job_queue)
+    schedule_ingestion(application.job_queue)
+    schedule_trending(application.job_queue)
+
 def main():
     """Main function to run the bot"""
     
@@ -30,43 +49,70 @@ def main():
         logger.error("Please set TELEGRAM_BOT_TOKEN environment variable")
         return
     
-    # Create application
-    app = Application.builder().token(BOT_TOKEN).build()
+    # Create application; chats are processed concurrently, each chat's updates in order
+    builder = Application.builder().token(BOT_TOKEN).concurrent_updates(PerChatUpdateProcessor()).post_init(post_init)
+    
+    # Share conversation state and user_data with the other workers
+    persistence = create_persistence()
+    if persistence:
+        builder.persistence(persistence)
+    app = builder.build()
+    
+    # Every message, including price alerts, goes through one rate-limited scheduler
+    configure_outbound(OutboundScheduler(BotTransport(app.bot)))
     
     # Create conversation handler
     conversation_handler = ConversationHandler(
         entry_points=[
             CommandHandler('start', start),
-            CallbackQueryHandler(button_callback, pattern='^(search_products|browse_categories|platform_|category_).*$')
+            CallbackQueryHandler(button_callback, pattern='^(search_products|browse_categories|price_alert|deal_types|platform_|category_).*$')
         ],
         states={
             PLATFORM_SELECTION: [
                 CallbackQueryHandler(button_callback, pattern='^platform_.*$')
             ],
             PRODUCT_SEARCH: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_product_search)
+                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_product_search),
+                CallbackQueryHandler(button_callback, pattern='^(dealtype_|catpage_).*$')
             ],
             CATEGORY_SEARCH: [
                 CallbackQueryHandler(button_callback, pattern='^category_.*$')
+            ],
+            DEAL_TYPE_SELECTION: [
+                CallbackQueryHandler(button_callback, pattern='^dealtype_.*$')
+            ],
+            PRICE_ALERT: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_price_alert)
             ]
         },
         fallbacks=[
             CommandHandler('cancel', cancel_conversation),
             MessageHandler(filters.TEXT, handle_invalid_input)
         ],
-        allow_reentry=True
+        allow_reentry=True,
+        name='shopsavvy',
+        persistent=persistence is not None
     )
     
     # Add handlers
     app.add_handler(conversation_handler)
     app.add_handler(CommandHandler('help', help_command))
     app.add_handler(CommandHandler('deals', deals_command))
+    app.add_handler(CommandHandler('alerts', alerts_command))
+    app.add_handler(CommandHandler('subscribe', subscribe_command))
+    app.add_handler(CommandHandler('unsubscribe', unsubscribe_command))
     app.add_handler(CallbackQueryHandler(button_callback))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
     
     # Add error handler
     app.add_error_handler(error_handler)
     
+    # Build shared keyboards and render every deal once so handlers only look them up
+    build_static_keyboards()
+    if PRERENDER_DEALS:
+        logger.info(f"🖼️ Pre-rendered {prerender_deals()} deal messages")
+    build_deal_type_index()
+    
     logger.info("🤖 ShopSavvy Bot is starting...")
     logger.info("🔍 Ready to help users find the best deals!")
     
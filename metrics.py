@@ -0,0 +1,181 @@
+"""
+Prometheus-style metrics for one worker
+
+Metrics are updated from the event loop thread only, so plain dicts and
+lists are enough: no locks on the hot path.  Values that already live
+elsewhere (cache statistics, queue depths) are read by collectors when
+/metrics is scraped instead of being copied on every update.
+"""
+import bisect
+import functools
+import time
+
+from live_stats import LIVE_STATS
+
+# Seconds; covers everything from a cached lookup to a slow Bot API call
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic counter, optionally split by labels"""
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield self.name, _labels(self.labelnames, labels), value
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, optionally split by labels"""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, value, *labels):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        entry[bisect.bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+    def samples(self):
+        for labels, entry in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), entry):
+                cumulative += count
+                yield (
+                    f"{self.name}_bucket",
+                    _labels(self.labelnames, labels, [('le', _number(bound))]),
+                    cumulative
+                )
+            yield f"{self.name}_sum", _labels(self.labelnames, labels), entry[-1]
+            yield f"{self.name}_count", _labels(self.labelnames, labels), cumulative
+
+class Gauge:
+    """Value read from a callback at scrape time.
+
+    The callback returns a number, or a dict mapping label tuples to numbers.
+    Use metric_type='counter' for totals kept elsewhere, e.g. cache hits.
+    """
+
+    def __init__(self, name, documentation, read, labelnames=(), metric_type='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.read = read
+        self.type = metric_type
+
+    def samples(self):
+        try:
+            value = self.read()
+        except Exception:
+            return
+        if value is None:
+            return
+        if not isinstance(value, dict):
+            value = {(): value}
+        for labels, number in value.items():
+            yield self.name, _labels(self.labelnames, labels), number
+
+class Registry:
+    """Metrics exposed by this worker"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, read, labelnames=(), metric_type='gauge'):
+        return self.register(Gauge(name, documentation, read, labelnames, metric_type))
+
+    def render(self):
+        """Metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = REGISTRY.histogram(
+    'shopsavvy_handler_seconds', 'Time spent in each update handler', ('handler',)
+)
+HANDLER_ERRORS = REGISTRY.counter(
+    'shopsavvy_handler_errors_total', 'Handler calls that raised', ('handler',)
+)
+TELEGRAM_API_SECONDS = REGISTRY.histogram(
+    'shopsavvy_telegram_api_seconds', 'Duration of outbound Bot API calls', ('method',)
+)
+TELEGRAM_API_CALLS = REGISTRY.counter(
+    'shopsavvy_telegram_api_calls_total', 'Outbound Bot API calls by result', ('method', 'result')
+)
+SEARCH_SECONDS = REGISTRY.histogram(
+    'shopsavvy_search_seconds', 'Time to answer a search, by query cache result', ('cache',)
+)
+SEARCHES = REGISTRY.counter(
+    'shopsavvy_searches_total', 'Searches by whether any deal was found', ('result',)
+)
+CLICKS = REGISTRY.counter(
+    'shopsavvy_clicks_total', 'Buy Now redirects followed, by platform', ('platform',)
+)
+
+def instrumented(handler):
+    """Record the latency, errors and user of an async update handler"""
+    name = handler.__name__
+
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        user = getattr(args[0], 'effective_user', None) if args else None
+        if user:
+            LIVE_STATS.record_user(user.id)
+
+        start = time.perf_counter()
+        try:
+            return await handler(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            HANDLER_SECONDS.observe(elapsed, name)
+            LIVE_STATS.record_latency(elapsed)
+
+    return wrapper
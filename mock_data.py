@@ -4,6 +4,8 @@ Mock data for e-commerce deals across Indian platforms
 import random
 from datetime import datetime, timedelta
 
+from search_index import SearchIndex
+
 # Mock product database
 MOCK_PRODUCTS = {
     'mobile': [
@@ -305,22 +307,17 @@ FESTIVAL_DEALS = {
     'End of Reason Sale': {'date': '2025-12-26', 'platforms': ['myntra'], 'description': 'Myntra\'s year-end fashion sale'}
 }
 
+# Inverted index over MOCK_PRODUCTS, built once at load time
+SEARCH_INDEX = SearchIndex(MOCK_PRODUCTS)
+
 def search_products(query, platform=None):
     """Search for products based on query and platform"""
-    results = []
-    query_lower = query.lower()
+    product_ids = SEARCH_INDEX.search(query, platform, limit=5)  # Limit to 5 results
     
-    for category, products in MOCK_PRODUCTS.items():
-        if query_lower in category or any(query_lower in product['name'].lower() for product in products):
-            for product in products:
-                if query_lower in product['name'].lower() or query_lower in category:
-                    if platform and platform != 'all':
-                        if product['deals'].get(platform):
-                            results.append({**product, 'platform_filter': platform})
-                    else:
-                        results.append(product)
+    if platform and platform != 'all':
+        return [{**SEARCH_INDEX.products[i], 'platform_filter': platform} for i in product_ids]
     
-    return results[:5]  # Limit to 5 results
+    return [SEARCH_INDEX.products[i] for i in product_ids]
 
 def get_trending_deals():
     """Get trending deals"""
@@ -329,11 +326,3 @@ def get_trending_deals():
 def get_festival_deals():
     """Get upcoming festival deals"""
     return FESTIVAL_DEALS
-
-def format_price(price):
-    """Format price in Indian currency format"""
-    return f"₹{price:,}"
-
-def calculate_savings(original, discounted):
-    """Calculate savings amount"""
-    return original - discounted
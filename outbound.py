@@ -0,0 +1,297 @@
+"""
+Central outbound message scheduler
+
+Every message the bot sends goes through one OutboundScheduler per worker.
+It keeps a priority queue (interactive replies before notifications before
+broadcasts), paces sends with a global and a per-chat token bucket, keeps
+each chat's messages in order, and retries after Telegram's 429 responses.
+
+The scheduler talks to Telegram through a transport:
+
+- BotTransport calls python-telegram-bot's Bot methods (used in production)
+- HTTPTransport posts JSON to any Bot API compatible server, e.g. a local fake
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import re
+import time
+from datetime import timedelta
+
+from config import OUTBOUND_MAX_RETRIES, TELEGRAM_API_URL
+from metrics import TELEGRAM_API_CALLS, TELEGRAM_API_SECONDS
+from rate_limit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first
+INTERACTIVE = 0
+NOTIFICATION = 5
+BROADCAST = 10
+
+class FloodWait(Exception):
+    """Telegram asked us to slow down for retry_after seconds"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Flood control exceeded, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+def _snake_case(method):
+    return re.sub(r'(?<!^)(?=[A-Z])', '_', method).lower()
+
+class BotTransport:
+    """Send Bot API calls through a python-telegram-bot Bot"""
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    async def call(self, method, params):
+        """Call a Bot API method (e.g. 'sendMessage') with its parameters"""
+        from telegram.error import RetryAfter
+
+        try:
+            return await getattr(self.bot, _snake_case(method))(**params)
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            if isinstance(retry_after, timedelta):
+                retry_after = retry_after.total_seconds()
+            raise FloodWait(retry_after) from e
+
+def _to_json(value):
+    """Convert Telegram objects inside params to plain JSON values"""
+    if hasattr(value, 'to_dict'):
+        return value.to_dict()
+    if isinstance(value, (list, tuple)):
+        return [_to_json(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _to_json(item) for key, item in value.items()}
+    return value
+
+class HTTPTransport:
+    """Send Bot API calls as JSON POSTs, e.g. to a local fake Bot API server"""
+
+    def __init__(self, token, base_url=TELEGRAM_API_URL, client=None):
+        import httpx
+
+        self.url = f"{base_url.rstrip('/')}/bot{token}"
+        self.client = client or httpx.AsyncClient(timeout=30)
+
+    async def call(self, method, params):
+        """Call a Bot API method and return its 'result'"""
+        response = await self.client.post(
+            f"{self.url}/{method}",
+            content=json.dumps(_to_json(params)),
+            headers={'Content-Type': 'application/json'}
+        )
+        payload = response.json()
+
+        if payload.get('ok'):
+            return payload.get('result')
+        if payload.get('error_code') == 429:
+            raise FloodWait(payload.get('parameters', {}).get('retry_after', 1))
+        raise RuntimeError(f"{method} failed: {payload.get('description', response.status_code)}")
+
+class OutboundScheduler:
+    """Priority queue of Bot API calls paced by global and per-chat buckets"""
+
+    def __init__(self, transport, limiter=None, max_retries=OUTBOUND_MAX_RETRIES):
+        self.transport = transport
+        self.limiter = limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self._counter = itertools.count()
+        self._chats = {}      # chat_id -> heap of pending jobs
+        self._busy = set()    # chats with a call in flight
+        self._ready = []      # heap of (priority, seq, chat_id) for chats with work
+        self._paused_until = 0.0
+        self._wakeup = None
+        self._dispatcher = None
+        self._senders = set()
+
+    @property
+    def depth(self):
+        """Number of calls waiting to be sent"""
+        return sum(len(jobs) for jobs in self._chats.values())
+
+    def stats(self):
+        """Counters for monitoring"""
+        return {
+            'depth': self.depth,
+            'sent': self.sent,
+            'retried': self.retried,
+            'failed': self.failed,
+            'active_chats': len(self._chats)
+        }
+
+    def submit(self, method, params, priority=INTERACTIVE, messages=1):
+        """Queue a call and return a future with its result"""
+        self._ensure_started()
+
+        chat_id = params.get('chat_id')
+        future = asyncio.get_running_loop().create_future()
+        job = (priority, next(self._counter), method, params, messages, future)
+
+        jobs = self._chats.setdefault(chat_id, [])
+        heapq.heappush(jobs, job)
+        if chat_id not in self._busy and jobs[0] is job:
+            heapq.heappush(self._ready, (priority, job[1], chat_id))
+            self._wakeup.set()
+
+        return future
+
+    async def send(self, method, params, priority=INTERACTIVE, messages=1):
+        """Queue a call and wait for its result"""
+        return await self.submit(method, params, priority, messages)
+
+    def _ensure_started(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def stop(self):
+        """Stop dispatching; calls still queued are cancelled"""
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+        for jobs in self._chats.values():
+            for job in jobs:
+                job[-1].cancel()
+        self._chats.clear()
+        self._ready.clear()
+
+    async def _dispatch(self):
+        """Hand the highest-priority idle chat's next call to a sender task"""
+        while True:
+            while not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+
+            _, _, chat_id = heapq.heappop(self._ready)
+            jobs = self._chats.get(chat_id)
+            if chat_id in self._busy or not jobs:
+                # Stale entry left behind when a higher-priority call jumped the queue
+                continue
+            job = heapq.heappop(jobs)
+            self._busy.add(chat_id)
+
+            # The global bucket gates dispatch; the chat bucket only delays this chat
+            await self.limiter.global_bucket.acquire(job[4])
+            sender = asyncio.get_running_loop().create_task(self._run(chat_id, job))
+            self._senders.add(sender)
+            sender.add_done_callback(self._senders.discard)
+
+    async def _run(self, chat_id, job):
+        """Send one call, honouring the chat's bucket and any retry_after"""
+        _, _, method, params, _, future = job
+
+        try:
+            if chat_id is not None:
+                await self.limiter.chat_bucket(chat_id).acquire(1)
+
+            for attempt in range(self.max_retries + 1):
+                start = time.perf_counter()
+                try:
+                    result = await self.transport.call(method, params)
+                except FloodWait as e:
+                    self._record_call(method, 'flood_wait', start)
+                    if attempt == self.max_retries:
+                        raise
+                    self.retried += 1
+                    logger.warning(f"⏳ {method} to {chat_id} hit flood control, retrying in {e.retry_after}s")
+                    self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                    await asyncio.sleep(e.retry_after)
+                except Exception:
+                    self._record_call(method, 'error', start)
+                    raise
+                else:
+                    self._record_call(method, 'ok', start)
+                    self.sent += 1
+                    if not future.done():
+                        future.set_result(result)
+                    break
+        except Exception as e:
+            self.failed += 1
+            if not future.done():
+                future.set_exception(e)
+        finally:
+            self._release(chat_id)
+
+    @staticmethod
+    def _record_call(method, result, start):
+        TELEGRAM_API_SECONDS.observe(time.perf_counter() - start, method)
+        TELEGRAM_API_CALLS.inc(method, result)
+
+    def _release(self, chat_id):
+        """Let the chat's next call be dispatched"""
+        self._busy.discard(chat_id)
+        jobs = self._chats.get(chat_id)
+        if jobs:
+            heapq.heappush(self._ready, (jobs[0][0], jobs[0][1], chat_id))
+            self._wakeup.set()
+        elif jobs is not None:
+            del self._chats[chat_id]
+
+_scheduler = None
+
+def configure_outbound(scheduler):
+    """Use scheduler for every outbound call in this worker"""
+    global _scheduler
+    _scheduler = scheduler
+
+def get_scheduler(bot=None):
+    """Get the worker's scheduler, creating one around bot if needed"""
+    global _scheduler
+    if _scheduler is None:
+        if bot is None:
+            raise RuntimeError("Outbound scheduler is not configured")
+        _scheduler = OutboundScheduler(BotTransport(bot))
+    return _scheduler
+
+async def reply_text(message, text, priority=INTERACTIVE, **kwargs):
+    """Queue a text message to the chat of message"""
+    return await get_scheduler(message.get_bot()).send(
+        'sendMessage', {'chat_id': message.chat_id, 'text': text, **kwargs}, priority
+    )
+
+async def reply_photo(message, photo, priority=INTERACTIVE, **kwargs):
+    """Queue a photo to the chat of message"""
+    return await get_scheduler(message.get_bot()).send(
+        'sendPhoto', {'chat_id': message.chat_id, 'photo': photo, **kwargs}, priority
+    )
+
+async def reply_media_group(message, media, priority=INTERACTIVE, **kwargs):
+    """Queue an album to the chat of message"""
+    return await get_scheduler(message.get_bot()).send(
+        'sendMediaGroup', {'chat_id': message.chat_id, 'media': media, **kwargs}, priority,
+        messages=len(media)
+    )
+
+async def edit_message_text(message, text, priority=INTERACTIVE, **kwargs):
+    """Queue an edit of a message the bot sent"""
+    return await get_scheduler(message.get_bot()).send(
+        'editMessageText',
+        {'chat_id': message.chat_id, 'message_id': message.message_id, 'text': text, **kwargs},
+        priority
+    )
+
+async def edit_message_media(message, media, priority=INTERACTIVE, **kwargs):
+    """Queue a replacement of the photo and caption of a message the bot sent"""
+    return await get_scheduler(message.get_bot()).send(
+        'editMessageMedia',
+        {'chat_id': message.chat_id, 'message_id': message.message_id, 'media': media, **kwargs},
+        priority
+    )
@@ -0,0 +1,317 @@
+"""
+Shared conversation and user_data persistence for multi-worker deployments
+
+State lives in a store with a Redis-compatible interface (the hash commands
+and pipeline() of redis-py), so the same code runs against:
+
+- SQLiteStore, a SQLite file on the /data disk (or ':memory:' for tests)
+- a real redis.Redis client when REDIS_URL is set
+
+Each worker owns the chats that consistent-hash to it (see HashRing), so its
+in-memory copy is authoritative while it owns them.  Writes are buffered and
+flushed in one pipeline shortly after python-telegram-bot hands them over.
+"""
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from config import (
+    PERSISTENCE_BACKEND, PERSISTENCE_PATH, PERSISTENCE_FLUSH_DELAY, PERSISTENCE_SEEN_CACHE_SIZE, REDIS_URL,
+    WORKER_URL, WORKER_NODES
+)
+
+logger = logging.getLogger(__name__)
+
+class SQLiteStore:
+    """The subset of redis-py's hash API the bot needs, stored in SQLite"""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS hashes ("
+                "name TEXT NOT NULL, field TEXT NOT NULL, value TEXT NOT NULL, "
+                "PRIMARY KEY (name, field)) WITHOUT ROWID"
+            )
+
+    def hget(self, name, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM hashes WHERE name = ? AND field = ?", (name, str(key))
+            ).fetchone()
+        return row[0] if row else None
+
+    def hgetall(self, name):
+        with self._lock:
+            rows = self._conn.execute("SELECT field, value FROM hashes WHERE name = ?", (name,)).fetchall()
+        return dict(rows)
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        items = dict(mapping or {})
+        if key is not None:
+            items[key] = value
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO hashes (name, field, value) VALUES (?, ?, ?)",
+                [(name, str(k), v) for k, v in items.items()]
+            )
+        return len(items)
+
+    def hdel(self, name, *keys):
+        with self._lock, self._conn:
+            cursor = self._conn.executemany(
+                "DELETE FROM hashes WHERE name = ? AND field = ?", [(name, str(k)) for k in keys]
+            )
+        return cursor.rowcount
+
+    def pipeline(self):
+        return SQLiteStorePipeline(self)
+
+class SQLiteStorePipeline:
+    """Queues hset/hdel calls and applies them in one transaction on execute()"""
+
+    def __init__(self, store):
+        self.store = store
+        self.commands = []
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        items = dict(mapping or {})
+        if key is not None:
+            items[key] = value
+        self.commands.extend(("set", name, str(k), v) for k, v in items.items())
+        return self
+
+    def hdel(self, name, *keys):
+        self.commands.extend(("del", name, str(k), None) for k in keys)
+        return self
+
+    def execute(self):
+        store = self.store
+        with store._lock, store._conn:
+            for op, name, field, value in self.commands:
+                if op == "set":
+                    store._conn.execute(
+                        "INSERT OR REPLACE INTO hashes (name, field, value) VALUES (?, ?, ?)",
+                        (name, field, value)
+                    )
+                else:
+                    store._conn.execute("DELETE FROM hashes WHERE name = ? AND field = ?", (name, field))
+        results = [True] * len(self.commands)
+        self.commands = []
+        return results
+
+class HashRing:
+    """Consistent hash ring mapping chat ids to worker nodes"""
+
+    def __init__(self, nodes, replicas=100):
+        self.nodes = list(nodes)
+        self._ring = sorted(
+            (self._hash(f"{node}#{i}"), node) for node in self.nodes for i in range(replicas)
+        )
+        self._keys = [h for h, _ in self._ring]
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.md5(str(value).encode()).digest()[:8], 'big')
+
+    def node_for(self, key):
+        """The node owning key, or None when the ring is empty"""
+        if not self._ring:
+            return None
+        index = bisect.bisect(self._keys, self._hash(key)) % len(self._ring)
+        return self._ring[index][1]
+
+# Shared by the webhook router and the persistence
+HASH_RING = HashRing(WORKER_NODES)
+
+def owns_chat(chat_id):
+    """Whether this worker is responsible for chat_id"""
+    return not WORKER_NODES or HASH_RING.node_for(chat_id) == WORKER_URL
+
+def update_chat_id(data):
+    """Chat id of a raw update dict, or None if it has no chat"""
+    callback_query = data.get('callback_query')
+    if callback_query:
+        message = callback_query.get('message')
+        return message['chat']['id'] if message else callback_query['from']['id']
+    for key in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        if data.get(key):
+            return data[key]['chat']['id']
+    return None
+
+def _decode(value):
+    if isinstance(value, bytes):
+        value = value.decode()
+    return json.loads(value) if value is not None else None
+
+class SharedPersistence(BasePersistence):
+    """BasePersistence storing user_data, chat_data and conversations in a shared store.
+
+    Data is loaded lazily: the first update from a user or chat this worker
+    hasn't seen refreshes it from the store, so chats handed over after a
+    ring change pick up where the previous owner left off.  Only the most
+    recently seen users and chats are remembered; one that was forgotten is
+    loaded again unless this worker still has unwritten changes for it.
+    """
+
+    USER_DATA = "shopsavvy:user_data"
+    CHAT_DATA = "shopsavvy:chat_data"
+    BOT_DATA = "shopsavvy:bot_data"
+    CONVERSATIONS = "shopsavvy:conversations:"
+
+    def __init__(self, store, flush_delay=PERSISTENCE_FLUSH_DELAY, update_interval=5):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, callback_data=False),
+            update_interval=update_interval
+        )
+        self.store = store
+        self.flush_delay = flush_delay
+        self._pending = {}     # (hash name, field) -> JSON value, or None to delete
+        self._flushing = {}    # The pending changes being written right now
+        self._seen_users = OrderedDict()
+        self._seen_chats = OrderedDict()
+        self._flush_task = None
+
+    # Loading
+
+    async def get_user_data(self):
+        return {}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        """Load the conversations of chats this worker owns"""
+        raw = await asyncio.to_thread(self.store.hgetall, self.CONVERSATIONS + name)
+        conversations = {}
+        for field, state in raw.items():
+            key = tuple(_decode(field))
+            if owns_chat(key[0]):
+                conversations[key] = _decode(state)
+        return conversations
+
+    def _first_sight(self, seen, name, key):
+        """Whether data for key should be loaded from the store, remembering that it was"""
+        if key in seen:
+            seen.move_to_end(key)
+            return False
+        seen[key] = None
+        if len(seen) > PERSISTENCE_SEEN_CACHE_SIZE:
+            seen.popitem(last=False)
+        # Unwritten changes are newer than what the store holds
+        field = (name, str(key))
+        return field not in self._pending and field not in self._flushing
+
+    async def refresh_user_data(self, user_id, user_data):
+        if not self._first_sight(self._seen_users, self.USER_DATA, user_id):
+            return
+        stored = await asyncio.to_thread(self.store.hget, self.USER_DATA, user_id)
+        if stored is not None:
+            user_data.update(_decode(stored))
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        if not self._first_sight(self._seen_chats, self.CHAT_DATA, chat_id):
+            return
+        stored = await asyncio.to_thread(self.store.hget, self.CHAT_DATA, chat_id)
+        if stored is not None:
+            chat_data.update(_decode(stored))
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    # Write-behind buffering
+
+    def _buffer(self, name, field, value):
+        self._pending[(name, str(field))] = None if value is None else json.dumps(value)
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        """Start a delayed flush unless one is already waiting"""
+        if self._flush_task is None or self._flush_task.done() or self._flush_task is asyncio.current_task():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_delay)
+        await self.flush()
+
+    async def update_user_data(self, user_id, data):
+        self._buffer(self.USER_DATA, user_id, data)
+
+    async def update_chat_data(self, chat_id, data):
+        self._buffer(self.CHAT_DATA, chat_id, data)
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def update_conversation(self, name, key, new_state):
+        self._buffer(self.CONVERSATIONS + name, json.dumps(list(key)), new_state)
+
+    async def drop_user_data(self, user_id):
+        self._buffer(self.USER_DATA, user_id, None)
+
+    async def drop_chat_data(self, chat_id):
+        self._buffer(self.CHAT_DATA, chat_id, None)
+
+    async def flush(self):
+        """Write every buffered change in a single pipeline"""
+        if not self._pending:
+            return
+
+        pending, self._pending = self._pending, {}
+
+        def write():
+            pipe = self.store.pipeline()
+            for (name, field), value in pending.items():
+                if value is None:
+                    pipe.hdel(name, field)
+                else:
+                    pipe.hset(name, field, value)
+            pipe.execute()
+
+        self._flushing = pending
+        try:
+            await asyncio.to_thread(write)
+        except Exception as e:
+            logger.error(f"Error flushing {len(pending)} persistence writes: {e}")
+            # Retry later, keeping newer changes made meanwhile
+            self._pending = {**pending, **self._pending}
+        finally:
+            self._flushing = {}
+        # Changes buffered during the write, or kept after a failure, get their own flush
+        if self._pending:
+            self._schedule_flush()
+
+def create_store():
+    """Create the configured state store, or None for in-process state only"""
+    if PERSISTENCE_BACKEND == 'redis':
+        import redis
+        return redis.Redis.from_url(REDIS_URL)
+    if PERSISTENCE_BACKEND == 'sqlite':
+        return SQLiteStore(PERSISTENCE_PATH)
+    return None
+
+def create_persistence():
+    """Create the configured persistence, or None to keep state in process memory"""
+    store = create_store()
+    if store is None:
+        return None
+    logger.info(f"💾 Persisting conversations with {type(store).__name__}")
+    return SharedPersistence(store)
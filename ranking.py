@@ -0,0 +1,86 @@
+"""
+Relevance and deal-quality ranking for search results
+"""
+import heapq
+import math
+
+from config import RANKING_WEIGHTS
+from deal_store import best_deal as best_platform_deal, deal_savings
+from search_index import tokenize
+
+# Savings are log-scaled against this amount so a ₹1 lakh saving scores 1.0
+SAVINGS_SCALE = math.log1p(100000)
+
+def match_score(query_terms, product):
+    """Score how well the query terms match the product name (0 to 1)"""
+    if not query_terms:
+        return 0.0
+
+    name_tokens = tokenize(product['name'])
+    score = 0.0
+
+    for term in query_terms:
+        if term in name_tokens:
+            score += 1.0
+        elif any(token.startswith(term) for token in name_tokens):
+            score += 0.75
+        elif any(term in token for token in name_tokens):
+            score += 0.5
+        else:
+            # Matched through the catalog category only
+            score += 0.25
+
+    return score / len(query_terms)
+
+def best_deal(product, platform=None):
+    """Get the deal to rank a product by: the platform's, or the biggest discount"""
+    if platform and platform != 'all':
+        return product['deals'].get(platform)
+
+    best = best_platform_deal(product['deals'])
+    return best[1] if best else None
+
+def deal_score(deal, weights):
+    """Score a deal on discount, cashback and savings"""
+    if not deal:
+        return 0.0
+
+    savings = deal_savings(deal)
+    cashback_ratio = deal['cashback'] / deal['original_price'] if deal['original_price'] else 0.0
+
+    return (
+        weights['discount'] * deal['discount'] / 100
+        + weights['cashback'] * cashback_ratio
+        + weights['savings'] * math.log1p(max(savings, 0)) / SAVINGS_SCALE
+    )
+
+def score_product(product, query_terms, platform=None, weights=None):
+    """Combined relevance and deal-quality score for one product"""
+    weights = {**RANKING_WEIGHTS, **(weights or {})}
+    return (
+        weights['relevance'] * match_score(query_terms, product)
+        + deal_score(best_deal(product, platform), weights)
+    )
+
+def rank_products(products, query, platform=None, k=5, weights=None):
+    """Return the k best products, keeping at most k candidates in memory.
+
+    products can be any iterable (including a generator over the matches);
+    ties keep the order in which products were produced.
+    """
+    if k <= 0:
+        return []
+
+    weights = {**RANKING_WEIGHTS, **(weights or {})}
+    query_terms = tokenize(query)
+    heap = []
+
+    for position, product in enumerate(products):
+        entry = (score_product(product, query_terms, platform, weights), -position, product)
+
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        elif entry[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, entry)
+
+    return [product for _, _, product in sorted(heap, key=lambda e: e[:2], reverse=True)]
@@ -0,0 +1,82 @@
+"""
+Token buckets for pacing outgoing Telegram API calls
+"""
+import asyncio
+import time
+
+from config import TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST
+
+class TokenBucket:
+    """Token bucket that lets callers reserve tokens ahead of time.
+
+    reserve() takes the tokens immediately (the balance may go negative) and
+    returns how long the caller has to wait, so concurrent senders queue up
+    behind each other instead of all waking at once.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, tokens=1):
+        """Take tokens now, returning the seconds to wait before using them"""
+        self._refill(time.monotonic())
+        self.tokens -= tokens
+        return max(0.0, -self.tokens / self.rate)
+
+    def delay(self, tokens=1):
+        """Seconds until tokens would be available, without taking them"""
+        self._refill(time.monotonic())
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+    def idle(self):
+        """Whether the bucket is full again and can be forgotten"""
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+    async def acquire(self, tokens=1):
+        """Wait until tokens are available"""
+        wait = self.reserve(tokens)
+        if wait:
+            await asyncio.sleep(wait)
+
+class RateLimiter:
+    """Global and per-chat token buckets matching Telegram's flood limits"""
+
+    # Forget idle per-chat buckets once this many are tracked
+    MAX_CHAT_BUCKETS = 10000
+
+    def __init__(self, global_rate=TELEGRAM_GLOBAL_RATE, chat_rate=TELEGRAM_CHAT_RATE, chat_burst=TELEGRAM_CHAT_BURST):
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets = {}
+
+    def chat_bucket(self, chat_id):
+        """Get (or create) the bucket for one chat"""
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= self.MAX_CHAT_BUCKETS:
+                self.chat_buckets = {c: b for c, b in self.chat_buckets.items() if not b.idle()}
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def reserve(self, chat_id=None, messages=1):
+        """Reserve room for messages, returning the seconds to wait"""
+        wait = self.global_bucket.reserve(messages)
+        if chat_id is not None:
+            # An album shows up as a single burst in the chat
+            wait = max(wait, self.chat_bucket(chat_id).reserve(1))
+        return wait
+
+    async def wait(self, chat_id=None, messages=1):
+        """Wait until messages can be sent to chat_id without hitting flood limits"""
+        wait = self.reserve(chat_id, messages)
+        if wait:
+            await asyncio.sleep(wait)
@@ -3,20 +3,42 @@
 ShopSavvy - Telegram Bot for Finding Deals Across Indian E-commerce Platforms
 Render.com deployment version with webhook support
 """
+import asyncio
+import hmac
+import json
 import logging
 import os
-from flask import Flask, request
-from telegram import Update
+import signal
+from contextlib import aclosing
+from aiohttp import ClientSession, ClientTimeout, WSMsgType, web
 from telegram.ext import (
     Application, CommandHandler, CallbackQueryHandler, 
     ConversationHandler, MessageHandler, filters
 )
 
-from config import BOT_TOKEN, PLATFORM_SELECTION, PRODUCT_SEARCH, CATEGORY_SEARCH
+from alerts import PRICE_ALERTS
+from broadcast import schedule_broadcasts
+from cache import QUERY_CACHE, prerender_deals
+from config import (
+    BOT_TOKEN, PLATFORM_SELECTION, PRODUCT_SEARCH, CATEGORY_SEARCH, DEAL_TYPE_SELECTION, PRICE_ALERT, PRERENDER_DEALS,
+    DASHBOARD_TOKEN, UPDATE_JOURNAL_PATH, WEBAPP_HOST, WEBAPP_PORT, WEBHOOK_SECRET, WORKER_NODES, WORKER_URL
+)
+from deal_filters import build_deal_type_index
+from ingest import schedule_ingestion
+from trending import schedule_trending
+from journal import JournalConsumer, JournalFull, UpdateJournal
+from links import CLICK_LOG, follow_link, is_link_preview
+from live_stats import LiveFeed
+from metrics import REGISTRY
+from outbound import BotTransport, OutboundScheduler, configure_outbound, get_scheduler
+from persistence import HASH_RING, create_persistence, create_store, owns_chat, update_chat_id
+from update_processor import PerChatUpdateProcessor
+from utils import build_static_keyboards
 from bot_handlers import (
     start, help_command, deals_command, button_callback,
     handle_product_search, handle_invalid_input, cancel_conversation,
-    handle_text_message, error_handler
+    handle_text_message, handle_price_alert, alerts_command,
+    subscribe_command, unsubscribe_command, error_handler
 )
 
 # Enable logging
@@ -26,12 +48,28 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Flask app for webhook
-app = Flask(__name__)
+# aiohttp web server for the webhook, sharing the Application's event loop
+routes = web.RouteTableDef()
 
 # Global application instance
 telegram_app = None
 
+# Durable queue between the webhook and the Application
+update_journal = None
+
+# One stats broadcast shared by every dashboard viewer
+live_feed = LiveFeed()
+
+# Client used to hand updates to the worker owning their chat
+forward_session = None
+
+async def post_init(application):
+    """Load saved price alerts and schedule broadcasts, feed ingestion and trending sync once the bot is initialized"""
+    await PRICE_ALERTS.load(create_store())
+    schedule_broadcasts(application.job_queue)
+    schedule_ingestion(application.job_queue)
+    schedule_trending(application.job_queue)
+
 def create_telegram_app():
     """Create and configure the Telegram application"""
     global telegram_app
@@ -41,37 +79,58 @@ def create_telegram_app():
         logger.error("Please set TELEGRAM_BOT_TOKEN environment variable")
         return None
     
-    # Create application
-    telegram_app = Application.builder().token(BOT_TOKEN).build()
+    # Create application; chats are processed concurrently, each chat's updates in order
+    builder = Application.builder().token(BOT_TOKEN).concurrent_updates(PerChatUpdateProcessor()).post_init(post_init)
+    
+    # Share conversation state and user_data with the other workers
+    persistence = create_persistence()
+    if persistence:
+        builder.persistence(persistence)
+    telegram_app = builder.build()
+    
+    # Every message, including price alerts, goes through one rate-limited scheduler
+    configure_outbound(OutboundScheduler(BotTransport(telegram_app.bot)))
     
     # Create conversation handler
     conversation_handler = ConversationHandler(
         entry_points=[
             CommandHandler('start', start),
-            CallbackQueryHandler(button_callback, pattern='^(search_products|browse_categories|platform_|category_).*$')
+            CallbackQueryHandler(button_callback, pattern='^(search_products|browse_categories|price_alert|deal_types|platform_|category_).*$')
         ],
         states={
             PLATFORM_SELECTION: [
                 CallbackQueryHandler(button_callback, pattern='^platform_.*$')
             ],
             PRODUCT_SEARCH: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_product_search)
+                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_product_search),
+                CallbackQueryHandler(button_callback, pattern='^(dealtype_|catpage_).*$')
             ],
             CATEGORY_SEARCH: [
                 CallbackQueryHandler(button_callback, pattern='^category_.*$')
+            ],
+            DEAL_TYPE_SELECTION: [
+                CallbackQueryHandler(button_callback, pattern='^dealtype_.*$')
+            ],
+            PRICE_ALERT: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_price_alert)
             ]
         },
         fallbacks=[
             CommandHandler('cancel', cancel_conversation),
             MessageHandler(filters.TEXT, handle_invalid_input)
         ],
-        allow_reentry=True
+        allow_reentry=True,
+        name='shopsavvy',
+        persistent=persistence is not None
     )
     
     # Add handlers
     telegram_app.add_handler(conversation_handler)
     telegram_app.add_handler(CommandHandler('help', help_command))
     telegram_app.add_handler(CommandHandler('deals', deals_command))
+    telegram_app.add_handler(CommandHandler('alerts', alerts_command))
+    telegram_app.add_handler(CommandHandler('subscribe', subscribe_command))
+    telegram_app.add_handler(CommandHandler('unsubscribe', unsubscribe_command))
     telegram_app.add_handler(CallbackQueryHandler(button_callback))
     telegram_app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
     
@@ -80,63 +139,247 @@ def create_telegram_app():
     
     return telegram_app
 
-@app.route('/webhook', methods=['POST'])
-def webhook():
+@routes.post('/webhook')
+async def webhook(request):
     """Handle incoming webhook updates"""
-    if telegram_app is None:
-        return "Bot not initialized", 500
-        
+    if telegram_app is None or update_journal is None:
+        return web.Response(text="Bot not initialized", status=500)
+    
+    # Only Telegram knows the secret token we registered with set_webhook
+    if WEBHOOK_SECRET and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != WEBHOOK_SECRET:
+        return web.Response(text="Forbidden", status=403)
+    
     try:
-        # Get the JSON data
-        json_data = request.get_json()
+        body = await request.read()
         
-        # Create Update object
-        update = Update.de_json(json_data, telegram_app.bot)
+        # Each chat is handled by the worker it hashes to, so its state stays in one place
+        if WORKER_NODES:
+            json_data = json.loads(body)
+            chat_id = update_chat_id(json_data)
+            if chat_id is not None and not owns_chat(chat_id):
+                return await forward_update(HASH_RING.node_for(chat_id), body)
         
-        # Process the update
-        telegram_app.update_queue.put_nowait(update)
+        # Journal the raw update and acknowledge straight away; the consumer processes it
+        update_journal.append(body)
         
-        return "OK", 200
+        return web.Response(text="OK")
+    except JournalFull as e:
+        # Telegram redelivers refused updates once the backlog drains
+        logger.warning(f"⏳ {e}")
+        return web.Response(text="Busy", status=503)
     except Exception as e:
         logger.error(f"Error processing webhook: {e}")
-        return "Error", 500
+        return web.Response(text="Error", status=500)
+
+async def forward_update(node, body):
+    """Pass a raw update to the worker that owns its chat and relay the answer"""
+    global forward_session
+    if forward_session is None:
+        forward_session = ClientSession(timeout=ClientTimeout(total=10))
+    
+    headers = {'Content-Type': 'application/json'}
+    if WEBHOOK_SECRET:
+        headers['X-Telegram-Bot-Api-Secret-Token'] = WEBHOOK_SECRET
+    try:
+        async with forward_session.post(f"{node}/webhook", data=body, headers=headers) as response:
+            return web.Response(text=await response.text(), status=response.status)
+    except Exception as e:
+        # Telegram redelivers the update, by which time the worker may be back
+        logger.error(f"Error forwarding update to {node}: {e}")
+        return web.Response(text="Worker unavailable", status=502)
 
-@app.route('/health')
-def health():
+@routes.get('/health')
+async def health(request):
     """Health check endpoint for Render.com"""
-    return {
+    return web.json_response({
         "status": "healthy",
         "bot": "ShopSavvy",
         "version": "1.0.0",
         "mode": "webhook" if os.getenv('RENDER') else "polling"
-    }
+    })
 
-@app.route('/status')
-def status():
+@routes.get('/status')
+async def status(request):
     """Bot status endpoint"""
-    return {
-        "bot_status": "running" if telegram_app else "not_initialized",
+    return web.json_response({
+        "bot_status": "running" if telegram_app and telegram_app.running else "not_initialized",
         "platform": "render.com" if os.getenv('RENDER') else "local",
-        "webhook_url": f"https://{os.getenv('RENDER_EXTERNAL_HOSTNAME', 'localhost')}/webhook" if os.getenv('RENDER') else None
+        "webhook_url": f"https://{os.getenv('RENDER_EXTERNAL_HOSTNAME', 'localhost')}/webhook" if os.getenv('RENDER') else None,
+        "search_cache": QUERY_CACHE.stats(),
+        "updates": telegram_app.update_processor.stats() if telegram_app else None,
+        "journal": update_journal.stats() if update_journal else None,
+        "worker": WORKER_URL or None
+    })
+
+@routes.get('/metrics')
+async def metrics(request):
+    """Prometheus metrics for this worker"""
+    return web.Response(
+        body=REGISTRY.render().encode(),
+        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+    )
+
+def status_message():
+    """The 'status' message the dashboard expects"""
+    return {
+        "type": "status",
+        "status": "online" if telegram_app and telegram_app.running else "offline",
+        "webhook": bool(os.getenv('RENDER'))
     }
 
-@app.route('/')
-def home():
+def dashboard_allowed(request):
+    """Whether a dashboard request carries DASHBOARD_TOKEN, when one is set"""
+    if not DASHBOARD_TOKEN:
+        return True
+    token = request.query.get('token') or request.headers.get('Authorization', '').removeprefix('Bearer ')
+    return hmac.compare_digest(token.encode(), DASHBOARD_TOKEN.encode())
+
+@routes.get('/ws')
+async def live_websocket(request):
+    """Push live stats to a dashboard over a WebSocket"""
+    if not dashboard_allowed(request):
+        return web.Response(text="Unauthorized", status=401)
+    ws = web.WebSocketResponse(heartbeat=30)
+    await ws.prepare(request)
+    await ws.send_json(status_message())
+    
+    async def answer_requests():
+        async for message in ws:
+            if message.type == WSMsgType.TEXT and json.loads(message.data).get('data') == 'status':
+                await ws.send_json(status_message())
+    
+    reader = asyncio.create_task(answer_requests())
+    try:
+        async with aclosing(live_feed.subscribe()) as payloads:
+            async for payload in payloads:
+                if ws.closed or reader.done():
+                    break
+                await ws.send_str(payload)
+    except ConnectionResetError:
+        pass
+    finally:
+        reader.cancel()
+        await ws.close()
+    return ws
+
+@routes.get('/events')
+async def live_events(request):
+    """Push live stats to a dashboard as Server-Sent Events"""
+    if not dashboard_allowed(request):
+        return web.Response(text="Unauthorized", status=401)
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    await response.prepare(request)
+    try:
+        await response.write(f"data: {json.dumps(status_message())}\n\n".encode())
+        async with aclosing(live_feed.subscribe()) as payloads:
+            async for payload in payloads:
+                await response.write(f"data: {payload}\n\n".encode())
+    except ConnectionResetError:
+        pass
+    return response
+
+@routes.get('/go/{link_id}')
+async def go(request):
+    """Count a Buy Now click and redirect to the shop"""
+    url = follow_link(request.match_info['link_id'], count=not is_link_preview(request.headers.get('User-Agent')))
+    if url is None:
+        return web.Response(text="Link not found", status=404)
+    return web.Response(status=302, headers={'Location': url, 'Cache-Control': 'no-store'})
+
+@routes.get('/dashboard')
+async def dashboard(request):
+    """Live dashboard page"""
+    if not dashboard_allowed(request):
+        return web.Response(text="Unauthorized", status=401)
+    return web.FileResponse(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'index.html'))
+
+# Queue depths and cache counters are read when /metrics is scraped
+REGISTRY.gauge(
+    'shopsavvy_query_cache_requests_total', 'Query cache lookups by result',
+    lambda: {('hit',): QUERY_CACHE.hits, ('miss',): QUERY_CACHE.misses}, ('result',), 'counter'
+)
+REGISTRY.gauge('shopsavvy_query_cache_entries', 'Searches held in the query cache', lambda: len(QUERY_CACHE))
+REGISTRY.gauge(
+    'shopsavvy_updates_pending', 'Updates accepted by the update processor but not finished',
+    lambda: telegram_app.update_processor.pending
+)
+REGISTRY.gauge('shopsavvy_outbound_queue_depth', 'Bot API calls waiting to be sent', lambda: get_scheduler().depth)
+REGISTRY.gauge(
+    'shopsavvy_journal_backlog_bytes', 'Journaled updates not yet acknowledged',
+    lambda: update_journal.backlog if update_journal else None
+)
+
+@routes.get('/')
+async def home(request):
     """Root endpoint"""
-    return {
+    return web.json_response({
         "message": "ShopSavvy Telegram Bot is running!",
         "bot": "@" + telegram_app.bot.username if telegram_app and telegram_app.bot else "Not initialized",
         "status": "Visit /status for bot status",
+        "dashboard": "Visit /dashboard for live stats",
         "health": "Visit /health for health check"
-    }
+    })
+
+def create_web_app():
+    """Create the aiohttp application serving the webhook and status routes"""
+    web_app = web.Application()
+    web_app.add_routes(routes)
+    return web_app
 
 async def setup_webhook():
     """Set up webhook for production deployment"""
     if telegram_app and os.getenv('RENDER'):
         webhook_url = f"https://{os.getenv('RENDER_EXTERNAL_HOSTNAME')}/webhook"
-        await telegram_app.bot.set_webhook(webhook_url)
+        await telegram_app.bot.set_webhook(
+            webhook_url,
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=['message', 'callback_query']
+        )
         logger.info(f"Webhook set to: {webhook_url}")
 
+async def run_webhook_server():
+    """Run the Telegram application and the web server in one event loop"""
+    global update_journal
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    
+    update_journal = UpdateJournal(UPDATE_JOURNAL_PATH)
+    if update_journal.replayed:
+        logger.info(f"📼 Replaying {update_journal.replayed} journaled updates")
+    
+    async with telegram_app:
+        await post_init(telegram_app)
+        await telegram_app.start()
+        consumer = JournalConsumer(telegram_app, update_journal)
+        consumer.start()
+        live_feed.start()
+        CLICK_LOG.start()
+        await setup_webhook()
+        
+        runner = web.AppRunner(create_web_app())
+        await runner.setup()
+        await web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT).start()
+        logger.info(f"🌐 Listening on {WEBAPP_HOST}:{WEBAPP_PORT}")
+        
+        try:
+            await stop.wait()
+        finally:
+            logger.info("🛑 Shutting down...")
+            await live_feed.stop()
+            await runner.cleanup()
+            await CLICK_LOG.stop()
+            if forward_session:
+                await forward_session.close()
+            await consumer.stop()
+            update_journal.close()
+            await telegram_app.stop()
+
 def main():
     """Main function to run the bot"""
     
@@ -147,20 +390,19 @@ def main():
         logger.error("Failed to create Telegram application")
         return
     
+    # Build shared keyboards and render every deal once so handlers only look them up
+    build_static_keyboards()
+    if PRERENDER_DEALS:
+        logger.info(f"🖼️ Pre-rendered {prerender_deals()} deal messages")
+    build_deal_type_index()
+    
     logger.info("🤖 ShopSavvy Bot is starting...")
     logger.info("🔍 Ready to help users find the best deals!")
     
     # Check if running on Render.com
     if os.getenv('RENDER'):
         logger.info("🚀 Running in production mode (webhook)")
-        # Initialize the application
-        import asyncio
-        asyncio.run(telegram_app.initialize())
-        asyncio.run(setup_webhook())
-        
-        # Start Flask server
-        port = int(os.getenv('PORT', 5000))
-        app.run(host='0.0.0.0', port=port)
+        asyncio.run(run_webhook_server())
     else:
         logger.info("🔧 Running in development mode (polling)")
         try:
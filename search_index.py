@@ -0,0 +1,157 @@
+"""
+In-memory inverted index over the product catalog
+"""
+import re
+from bisect import bisect_left, bisect_right
+from itertools import islice
+
+from deal_store import DealStore
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+def tokenize(text):
+    """Split text into normalized lowercase tokens"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+def merge_sorted(items, new_items):
+    """Sorted list of items (already sorted) plus new_items.
+
+    Finds each new item's place by bisection and copies the runs in
+    between, so merging a small batch into a long list costs pointer
+    copies rather than the O(n) comparisons of re-sorting it.
+    """
+    merged = []
+    start = 0
+    for item in sorted(new_items):
+        end = bisect_right(items, item, start)
+        merged += items[start:end]
+        merged.append(item)
+        start = end
+    merged += items[start:]
+    return merged
+
+class SearchIndex:
+    """Inverted index from name and category tokens to product ids.
+
+    Every product listed under a catalog category gets a product id in
+    catalog order, so sorting matched ids reproduces the order of the
+    original linear scan.  Query terms are looked up as prefixes of token
+    suffixes, which keeps the substring behaviour users already rely on
+    ('phone' still finds 'iPhone') without touching the products.  Deals
+    live in a columnar DealStore and each product's 'deals' is a view of it.
+    """
+
+    def __init__(self, catalog):
+        self.products = []
+        self.deals = DealStore()
+        self.categories = []
+        self.search_text = []
+        self.postings = {}
+        self.platform_postings = {}
+        self.names = {}
+
+        for category, products in catalog.items():
+            for product in products:
+                self._add_product(category, product)
+
+        self.deals.compute_best()
+        self._build_suffixes()
+
+    def _add_product(self, category, product):
+        """Assign the next product id and add its tokens to the index"""
+        product_id = self.deals.append(product['deals'])
+        name = product['name'].lower()
+
+        self.products.append({**product, 'deals': self.deals.deals(product_id)})
+        self.categories.append(category)
+        self.search_text.append((name, category.lower()))
+        self.names.setdefault(name, []).append(product_id)
+
+        for token in set(tokenize(name)) | set(tokenize(category)):
+            self.postings.setdefault(token, []).append(product_id)
+
+        for platform, deal in product['deals'].items():
+            if deal:
+                self.platform_postings.setdefault(platform, set()).add(product_id)
+
+        return product_id
+
+    def add_products(self, listed):
+        """Index [(category, product)] added after load, returning (product ids, new tokens).
+
+        The new tokens' suffixes are merged into the suffix list in one pass,
+        instead of one O(n) insertion per suffix.
+        """
+        product_ids = []
+        new_tokens = set()
+        for category, product in listed:
+            tokens = set(tokenize(product['name'])) | set(tokenize(category))
+            new_tokens.update(token for token in tokens if token not in self.postings)
+            product_ids.append(self._add_product(category, product))
+        self.deals.compute_best()
+
+        if new_tokens:
+            self._suffixes = merge_sorted(
+                self._suffixes, [(token[i:], token) for token in new_tokens for i in range(len(token))]
+            )
+        return product_ids, sorted(new_tokens)
+
+    def set_deal(self, product_id, platform, deal):
+        """Replace one platform's deal of a product, or remove it with deal=None"""
+        self.deals.set(product_id, platform, deal)
+        if deal:
+            self.platform_postings.setdefault(platform, set()).add(product_id)
+        else:
+            self.platform_postings.get(platform, set()).discard(product_id)
+
+    def _build_suffixes(self):
+        """Build the sorted (suffix, token) list used for term lookups"""
+        self._suffixes = sorted(
+            (token[i:], token)
+            for token in self.postings
+            for i in range(len(token))
+        )
+
+    def match_term(self, term):
+        """Return the ids of products with a token containing term"""
+        matches = set()
+        start = bisect_left(self._suffixes, (term,))
+
+        for suffix, token in self._suffixes[start:]:
+            if not suffix.startswith(term):
+                break
+            matches.update(self.postings[token])
+
+        return matches
+
+    def candidates(self, query, platform=None, within=None):
+        """AND together the posting lists of every query token, optionally within a set of ids"""
+        terms = tokenize(query)
+
+        if terms:
+            sets = sorted((self.match_term(term) for term in set(terms)), key=len)
+            ids = sets[0].intersection(*sets[1:])
+        elif within is not None:
+            ids = set(within)
+        else:
+            ids = set(range(len(self.products)))
+
+        if platform and platform != 'all':
+            ids &= self.platform_postings.get(platform, set())
+        if within is not None:
+            ids &= within
+
+        return sorted(ids)
+
+    def iter_matches(self, query, platform=None, within=None):
+        """Yield matching product ids in catalog order"""
+        query_lower = query.lower()
+
+        for product_id in self.candidates(query_lower, platform, within):
+            name, category = self.search_text[product_id]
+            if query_lower in name or query_lower in category:
+                yield product_id
+
+    def search(self, query, platform=None, limit=None):
+        """Return matching product ids in catalog order"""
+        return list(islice(self.iter_matches(query, platform), limit))
@@ -0,0 +1,225 @@
+"""
+Trending deals from live engagement
+
+Searches, result views and Buy Now clicks are counted per product in a
+time-decayed space-saving summary: each event is one dict update, only
+the heaviest products are kept, and the trending list is read off the
+summary without looking at past events.  Counts use forward decay (newer
+events weigh 2x more every TRENDING_HALF_LIFE seconds) so old counters
+never need touching as time passes.
+
+Every worker keeps its own summary and publishes it to the shared state
+store; summaries merge, so each worker's trending list covers them all.
+Until enough products have been engaged with, the catalog's curated list
+fills the remaining places.
+"""
+import asyncio
+import heapq
+import json
+import logging
+import time
+from operator import itemgetter
+
+from catalog import get_catalog
+from config import (
+    TRENDING_CAPACITY, TRENDING_HALF_LIFE, TRENDING_LIMIT, TRENDING_SEARCH_DEPTH, TRENDING_SYNC_INTERVAL,
+    TRENDING_WEIGHTS, WORKER_URL
+)
+from deal_store import best_deal
+from persistence import create_store
+
+logger = logging.getLogger(__name__)
+
+# Hash in the shared state store; one field per worker holding its summary as JSON
+STORE_KEY = "shopsavvy:trending"
+
+# Counts are rescaled to a new landmark before 2 ** exponent loses precision
+RESCALE_EXPONENT = 64
+
+class DecayedTopK:
+    """Space-saving heavy hitters over forward-decayed event weights.
+
+    Counts are in units of 2 ** ((t - landmark) / half_life), so adding an
+    event never touches other counters.  Up to 2 * capacity keys are kept;
+    when that fills up the lighter half is dropped and the heaviest dropped
+    count becomes the floor new keys start from, so counts overestimate by
+    at most the floor, as in space-saving.
+    """
+
+    def __init__(self, capacity=TRENDING_CAPACITY, half_life=TRENDING_HALF_LIFE, landmark=None):
+        self.capacity = capacity
+        self.half_life = half_life
+        self.landmark = time.time() if landmark is None else landmark
+        self.counts = {}
+        self.floor = 0.0
+
+    def __len__(self):
+        return len(self.counts)
+
+    def add(self, key, weight=1.0, now=None):
+        """Count one event of weight for key"""
+        now = time.time() if now is None else now
+        exponent = (now - self.landmark) / self.half_life
+        if exponent > RESCALE_EXPONENT:
+            self.rescale(now)
+            exponent = 0.0
+
+        count = self.counts.get(key)
+        if count is None:
+            if len(self.counts) >= 2 * self.capacity:
+                self._compact(self.capacity)
+            count = self.floor
+        self.counts[key] = count + weight * 2.0 ** exponent
+
+    def _compact(self, size):
+        """Keep the size heaviest keys, raising the floor to the heaviest one dropped"""
+        kept = heapq.nlargest(size + 1, self.counts.items(), key=itemgetter(1))
+        if len(kept) > size:
+            self.floor = max(self.floor, kept.pop()[1])
+        self.counts = dict(kept)
+
+    def rescale(self, landmark):
+        """Move the landmark forward, shrinking every count to match"""
+        factor = 2.0 ** ((self.landmark - landmark) / self.half_life)
+        self.counts = {key: count * factor for key, count in self.counts.items()}
+        self.floor *= factor
+        self.landmark = landmark
+
+    def top(self, k, now=None):
+        """[(key, decayed count)] of the k heaviest keys, heaviest first"""
+        now = time.time() if now is None else now
+        decay = 2.0 ** ((self.landmark - now) / self.half_life)
+        return [(key, count * decay) for key, count in heapq.nlargest(k, self.counts.items(), key=itemgetter(1))]
+
+    def merge(self, other):
+        """Summary of the events of both summaries, keeping this one's capacity"""
+        merged = DecayedTopK(self.capacity, self.half_life, max(self.landmark, other.landmark))
+        mine, theirs = self.copy(), other.copy()
+        mine.rescale(merged.landmark)
+        theirs.rescale(merged.landmark)
+
+        # A key missing from a summary may still have counted up to its floor there
+        for key in mine.counts.keys() | theirs.counts.keys():
+            merged.counts[key] = mine.counts.get(key, mine.floor) + theirs.counts.get(key, theirs.floor)
+        merged.floor = mine.floor + theirs.floor
+        if len(merged.counts) > 2 * merged.capacity:
+            merged._compact(merged.capacity)
+        return merged
+
+    def copy(self):
+        """Independent copy of the summary"""
+        summary = DecayedTopK(self.capacity, self.half_life, self.landmark)
+        summary.counts = dict(self.counts)
+        summary.floor = self.floor
+        return summary
+
+    def to_dict(self):
+        """JSON-ready form of the summary"""
+        return {
+            'landmark': self.landmark,
+            'half_life': self.half_life,
+            'floor': self.floor,
+            'counts': list(self.counts.items()),
+        }
+
+    @classmethod
+    def from_dict(cls, data, capacity=TRENDING_CAPACITY):
+        """Rebuild a summary written by to_dict()"""
+        summary = cls(capacity, data['half_life'], data['landmark'])
+        summary.counts = {key: count for key, count in data['counts']}
+        summary.floor = data['floor']
+        return summary
+
+class TrendingTracker:
+    """This worker's engagement summary plus the latest ones published by the others"""
+
+    def __init__(self):
+        self.local = DecayedTopK()
+        self.remote = None  # Merged summaries of the other workers
+        self.store = None
+
+    def record(self, product_id, signal):
+        """Count one 'search', 'view' or 'click' of a product"""
+        self.local.add(product_id, TRENDING_WEIGHTS[signal])
+
+    def summary(self):
+        """Engagement across every worker seen so far"""
+        return self.local if self.remote is None else self.local.merge(self.remote)
+
+    async def sync(self):
+        """Publish this worker's summary and merge in everyone else's"""
+        if self.store is None:
+            return
+
+        field = WORKER_URL or 'local'
+        await asyncio.to_thread(self.store.hset, STORE_KEY, field, json.dumps(self.local.to_dict()))
+        raw = await asyncio.to_thread(self.store.hgetall, STORE_KEY)
+
+        remote = None
+        for worker, data in raw.items():
+            worker = worker.decode() if isinstance(worker, bytes) else worker
+            if worker == field:
+                continue
+            summary = DecayedTopK.from_dict(json.loads(data))
+            remote = summary if remote is None else remote.merge(summary)
+        self.remote = remote
+
+TRENDING = TrendingTracker()
+
+def record_search(product_ids):
+    """Count a search's top results"""
+    for product_id in product_ids[:TRENDING_SEARCH_DEPTH]:
+        TRENDING.record(product_id, 'search')
+
+def record_view(product_id):
+    """Count a deal shown to a user"""
+    TRENDING.record(product_id, 'view')
+
+def record_click(product_id):
+    """Count a Buy Now click"""
+    TRENDING.record(product_id, 'click')
+
+def trending_deals(limit=TRENDING_LIMIT):
+    """Trending deals as [{'product', 'platform', 'discount'}], most engaged first.
+
+    Slots engagement doesn't fill yet are topped up from the catalog's
+    curated list.
+    """
+    catalog = get_catalog()
+    # A few spare candidates in case products dropped out of the catalog or lost their deals
+    top = TRENDING.summary().top(2 * limit)
+
+    deals = {}
+    for product in catalog.get_products([product_id for product_id, _ in top]):
+        best = best_deal(product['deals'])
+        # A product listed under two catalog listings trends once
+        if best and product['name'] not in deals:
+            platform, deal = best
+            deals[product['name']] = {'product': product['name'], 'platform': platform, 'discount': deal['discount']}
+        if len(deals) >= limit:
+            break
+
+    for item in catalog.get_trending_deals():
+        if len(deals) >= limit:
+            break
+        deals.setdefault(item['product'], item)
+    return list(deals.values())
+
+async def sync_trending_job(context):
+    """Job: exchange engagement summaries with the other workers"""
+    try:
+        await TRENDING.sync()
+    except Exception as e:
+        logger.error(f"Error syncing trending summaries: {e}")
+
+def schedule_trending(job_queue):
+    """Share trending summaries through the state store when there is one"""
+    TRENDING.store = create_store()
+    if TRENDING.store is None:
+        return
+    if job_queue is None:
+        logger.warning("⚠️ Job queue unavailable, trending deals cover this worker only")
+        return
+
+    job_queue.run_repeating(sync_trending_job, TRENDING_SYNC_INTERVAL, first=TRENDING_SYNC_INTERVAL, name="trending-sync")
+    logger.info(f"🔥 Sharing trending summaries every {TRENDING_SYNC_INTERVAL}s")
@@ -0,0 +1,83 @@
+"""
+Concurrent update processing that keeps each chat's updates in order
+"""
+import asyncio
+import logging
+
+from telegram.ext import BaseUpdateProcessor
+
+from config import MAX_CONCURRENT_UPDATES, MAX_PENDING_UPDATES
+
+logger = logging.getLogger(__name__)
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Process updates from different chats in parallel, one at a time per chat.
+
+    Updates for the same chat wait on that chat's lock in arrival order, so
+    ConversationHandler state and user_data see them sequentially.  Only
+    updates holding their chat's lock count towards max_concurrent, so a
+    busy chat can't starve the others.  pending counts every update
+    accepted but not yet finished; the journal consumer stops pulling
+    updates while it reaches max_pending instead of queueing without bound.
+    """
+
+    __slots__ = ('max_concurrent', 'max_pending', 'pending', '_running', '_chat_locks')
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_UPDATES, max_pending=MAX_PENDING_UPDATES):
+        # The base semaphore bounds accepted updates; ours bounds running ones
+        super().__init__(max_pending)
+        self.max_concurrent = max_concurrent
+        self.max_pending = max_pending
+        self.pending = 0
+        self._running = asyncio.BoundedSemaphore(max_concurrent)
+        self._chat_locks = {}
+
+    @property
+    def overloaded(self):
+        """Whether new updates should be refused until the backlog drains"""
+        return self.pending >= self.max_pending
+
+    @staticmethod
+    def chat_key(update):
+        """Chat whose updates must stay ordered, or None"""
+        chat = getattr(update, 'effective_chat', None)
+        return chat.id if chat else None
+
+    async def do_process_update(self, update, coroutine):
+        """Run the update once its chat is free and a worker slot is available"""
+        key = self.chat_key(update)
+        self.pending += 1
+
+        try:
+            if key is None:
+                async with self._running:
+                    await coroutine
+                return
+
+            entry = self._chat_locks.setdefault(key, [asyncio.Lock(), 0])
+            entry[1] += 1
+            try:
+                async with entry[0]:
+                    async with self._running:
+                        await coroutine
+            finally:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._chat_locks[key]
+        finally:
+            self.pending -= 1
+
+    async def initialize(self):
+        """Nothing to set up"""
+
+    async def shutdown(self):
+        """Nothing to tear down"""
+
+    def stats(self):
+        """Counters for monitoring"""
+        return {
+            'pending': self.pending,
+            'active_chats': len(self._chat_locks),
+            'max_concurrent': self.max_concurrent,
+            'max_pending': self.max_pending
+        }
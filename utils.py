@@ -2,9 +2,18 @@
 Utility functions for the Telegram bot
 """
 from datetime import datetime, timedelta
+from functools import lru_cache
 import random
 from config import PLATFORM_EMOJIS
-from mock_data import format_price, calculate_savings
+from deal_store import best_deal, deal_savings
+
+def format_price(price):
+    """Format price in Indian currency format"""
+    return f"₹{price:,}"
+
+def calculate_savings(original, discounted):
+    """Calculate savings amount"""
+    return original - discounted
 
 def format_deal_message(product, platform=None):
     """Format a deal message for display"""
@@ -16,8 +25,10 @@ def format_deal_message(product, platform=None):
         if not deal:
             return f"❌ No deals found for {product['name']} on {platform.title()}"
         
+        from links import buy_link
+        
         emoji = PLATFORM_EMOJIS.get(platform, '🛒')
-        savings = calculate_savings(deal['original_price'], deal['discount_price'])
+        savings = deal_savings(deal)
         
         message = f"""
 {product['image']} **{product['name']}**
@@ -30,7 +41,7 @@ def format_deal_message(product, platform=None):
 💳 **Cashback:** {format_price(deal['cashback'])}
 ⏰ **Valid till:** {get_offer_validity()}
 🚚 **Free Delivery:** Yes
-🔗 **[Buy Now]({get_product_link(product['name'], platform)})**
+🔗 **[Buy Now]({buy_link(product, platform)})**
         """
         return message.strip()
     
@@ -43,12 +54,12 @@ def format_deal_message(product, platform=None):
         if not available_deals:
             return f"❌ No deals found for {product['name']}"
         
-        # Sort by discount percentage
+        # List by discount percentage; the best deal itself is looked up below
         available_deals.sort(key=lambda x: x[1]['discount'], reverse=True)
         
         for platform, deal in available_deals:
             emoji = PLATFORM_EMOJIS.get(platform, '🛒')
-            savings = calculate_savings(deal['original_price'], deal['discount_price'])
+            savings = deal_savings(deal)
             
             message += f"""
 {emoji} **{platform.title()}**
@@ -58,11 +69,83 @@ def format_deal_message(product, platform=None):
 
 """
         
-        best_deal = available_deals[0]
-        message += f"🏆 **Best Deal:** {best_deal[0].title()} with {best_deal[1]['discount']}% OFF"
+        best_platform, best = best_deal(product['deals'])
+        message += f"🏆 **Best Deal:** {best_platform.title()} with {best['discount']}% OFF"
         
         return message.strip()
 
+def format_price_alert(product, platform, price, target):
+    """Format the message sent when a price alert triggers"""
+    emoji = PLATFORM_EMOJIS.get(platform, '🛒')
+    return (
+        f"🔔 **Price Alert!** 🔔\n\n"
+        f"{product['image']} **{product['name']}**\n"
+        f"{emoji} **{platform.title()}** is now **{format_price(price)}**\n"
+        f"🎯 Your target: {format_price(target)}\n\n"
+        f"Grab it before the price goes back up!"
+    )
+
+def format_price_alert_list(alerts, products):
+    """Format a chat's active price alerts"""
+    if not alerts:
+        return "🔔 You have no price alerts.\n\nUse **Price Alerts** in the menu to create one."
+    
+    message = "🔔 **Your Price Alerts** 🔔\n\n"
+    for i, ((product_id, platform), target) in enumerate(alerts.items(), 1):
+        product = products.get(product_id)
+        name = product['name'] if product else f"Product #{product_id}"
+        message += f"{i}. **{name}** on {platform.title()} at {format_price(target)} or less\n"
+    return message.strip()
+
+def create_price_alert_keyboard(alerts):
+    """Create inline keyboard with a remove button per price alert"""
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+    
+    keyboard = [
+        [InlineKeyboardButton(f"❌ Remove #{i}", callback_data=f'unalert_{product_id}_{platform}')]
+        for i, (product_id, platform) in enumerate(alerts, 1)
+    ]
+    keyboard.extend(create_main_menu_keyboard().inline_keyboard)
+    return InlineKeyboardMarkup(keyboard)
+
+def result_page_callback(snapshot_id, offset):
+    """callback_data cursor for one page of a search snapshot, e.g. 'pg_Ab3dEf-h_5'"""
+    return f"pg_{snapshot_id}_{offset}"
+
+def create_result_page_keyboard(snapshot_id, offset, total, link_keyboard=None):
+    """Create inline keyboard with a result's Buy Now buttons, Prev/Next cursors and the main menu"""
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+    
+    keyboard = list(link_keyboard.inline_keyboard) if link_keyboard is not None else []
+    
+    navigation = []
+    if offset > 0:
+        navigation.append(InlineKeyboardButton("⬅️ Prev", callback_data=result_page_callback(snapshot_id, offset - 1)))
+    if offset + 1 < total:
+        navigation.append(InlineKeyboardButton("Next ➡️", callback_data=result_page_callback(snapshot_id, offset + 1)))
+    if navigation:
+        keyboard.append(navigation)
+    
+    keyboard.extend(create_main_menu_keyboard().inline_keyboard)
+    return InlineKeyboardMarkup(keyboard)
+
+def category_page_callback(category, platform, offset):
+    """callback_data for a page of a category, e.g. 'catpage_all_5_home_&_kitchen'"""
+    return f"catpage_{platform}_{offset}_{category.replace(' ', '_')}"
+
+def create_category_page_keyboard(category, platform, next_offset=None):
+    """Create inline keyboard with a button for the next page of a category and the main menu"""
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+    
+    keyboard = []
+    if next_offset is not None:
+        keyboard.append([InlineKeyboardButton(
+            f"➡️ More {category.title()}",
+            callback_data=category_page_callback(category, platform, next_offset)
+        )])
+    keyboard.extend(create_main_menu_keyboard().inline_keyboard)
+    return InlineKeyboardMarkup(keyboard)
+
 def get_product_link(product_name, platform):
     """Generate product links for different platforms"""
     # Platform base URLs
@@ -87,14 +170,16 @@ def get_offer_validity():
 
 def create_product_link_keyboard(product, platform=None):
     """Create inline keyboard with product links"""
-    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+    from telegram import InlineKeyboardButton
+    from keyboards import StaticInlineKeyboardMarkup
+    from links import buy_link
     
     keyboard = []
     
     if platform and platform != 'all':
         # Single platform - direct link
         if product['deals'].get(platform):
-            link = get_product_link(product['name'], platform)
+            link = buy_link(product, platform)
             keyboard.append([
                 InlineKeyboardButton(
                     f"🛒 Shop on {platform.title()}", 
@@ -108,7 +193,7 @@ def create_product_link_keyboard(product, platform=None):
         # Create two buttons per row for better mobile display
         row = []
         for platform_name in available_platforms:
-            link = get_product_link(product['name'], platform_name)
+            link = buy_link(product, platform_name)
             button = InlineKeyboardButton(
                 f"🛒 {platform_name.title()}", 
                 url=link
@@ -120,13 +205,13 @@ def create_product_link_keyboard(product, platform=None):
                 keyboard.append(row)
                 row = []
     
-    return InlineKeyboardMarkup(keyboard) if keyboard else None
+    return StaticInlineKeyboardMarkup(keyboard) if keyboard else None
 
 def format_trending_deals():
     """Format trending deals message"""
-    from mock_data import get_trending_deals
+    from trending import trending_deals
     
-    trending = get_trending_deals()
+    trending = trending_deals()
     message = "🔥 **Today's Hottest Deals** 🔥\n\n"
     
     for i, deal in enumerate(trending, 1):
@@ -138,9 +223,9 @@ def format_trending_deals():
 
 def format_festival_deals():
     """Format festival deals message"""
-    from mock_data import get_festival_deals
+    from catalog import get_catalog
     
-    festivals = get_festival_deals()
+    festivals = get_catalog().get_festival_deals()
     message = "🎉 **Upcoming Sale Events** 🎉\n\n"
     
     for event, details in festivals.items():
@@ -156,9 +241,22 @@ def format_festival_deals():
     
     return message.strip() if message.strip() != "🎉 **Upcoming Sale Events** 🎉" else "No upcoming sales found."
 
+def format_festival_announcement(event, details):
+    """Format the broadcast sent when a festival sale starts"""
+    platforms_str = ", ".join([p.title() for p in details['platforms']])
+    return (
+        f"🎉 **{event} is live!** 🎉\n\n"
+        f"🏪 Platforms: {platforms_str}\n"
+        f"📝 {details['description']}\n\n"
+        f"Search for any product to see today's best prices!\n\n"
+        f"_Send /unsubscribe to stop deal broadcasts._"
+    )
+
+@lru_cache(maxsize=None)
 def create_platform_keyboard():
-    """Create inline keyboard for platform selection"""
-    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+    """Create inline keyboard for platform selection (built once and shared)"""
+    from telegram import InlineKeyboardButton
+    from keyboards import StaticInlineKeyboardMarkup
     
     keyboard = [
         [
@@ -173,11 +271,13 @@ def create_platform_keyboard():
             InlineKeyboardButton(f"{PLATFORM_EMOJIS['all']} All Platforms", callback_data='platform_all')
         ]
     ]
-    return InlineKeyboardMarkup(keyboard)
+    return StaticInlineKeyboardMarkup(keyboard)
 
+@lru_cache(maxsize=None)
 def create_category_keyboard():
-    """Create inline keyboard for category selection"""
-    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+    """Create inline keyboard for category selection (built once and shared)"""
+    from telegram import InlineKeyboardButton
+    from keyboards import StaticInlineKeyboardMarkup
     from config import CATEGORIES
     
     keyboard = []
@@ -189,22 +289,39 @@ def create_category_keyboard():
                 row.append(InlineKeyboardButton(category, callback_data=f'category_{category.lower().replace(" ", "_")}'))
         keyboard.append(row)
     
-    return InlineKeyboardMarkup(keyboard)
+    return StaticInlineKeyboardMarkup(keyboard)
 
+@lru_cache(maxsize=None)
 def create_deal_type_keyboard():
-    """Create inline keyboard for deal type selection"""
-    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+    """Create inline keyboard for deal type selection (built once and shared)"""
+    from telegram import InlineKeyboardButton
+    from keyboards import StaticInlineKeyboardMarkup
     from config import DEAL_TYPES
     
     keyboard = []
     for deal_type in DEAL_TYPES:
         keyboard.append([InlineKeyboardButton(deal_type, callback_data=f'dealtype_{deal_type.lower().replace(" ", "_")}')])
     
-    return InlineKeyboardMarkup(keyboard)
+    return StaticInlineKeyboardMarkup(keyboard)
+
+@lru_cache(maxsize=None)
+def create_category_search_keyboard(category, platform):
+    """Create inline keyboard to browse a category or pick a deal type (built once per choice)"""
+    from telegram import InlineKeyboardButton
+    from keyboards import StaticInlineKeyboardMarkup
+    
+    keyboard = [[InlineKeyboardButton(
+        f"📂 Browse all {category.title()}",
+        callback_data=category_page_callback(category, platform, 0)
+    )]]
+    keyboard.extend(create_deal_type_keyboard().inline_keyboard)
+    return StaticInlineKeyboardMarkup(keyboard)
 
+@lru_cache(maxsize=None)
 def create_main_menu_keyboard():
-    """Create main menu keyboard"""
-    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+    """Create main menu keyboard (built once and shared)"""
+    from telegram import InlineKeyboardButton
+    from keyboards import StaticInlineKeyboardMarkup
     
     keyboard = [
         [
@@ -215,8 +332,19 @@ def create_main_menu_keyboard():
             InlineKeyboardButton("🔥 Trending Deals", callback_data='trending_deals'),
             InlineKeyboardButton("🎉 Festival Sales", callback_data='festival_deals')
         ],
+        [
+            InlineKeyboardButton("🏷️ Deal Types", callback_data='deal_types'),
+            InlineKeyboardButton("🔔 Price Alerts", callback_data='price_alert')
+        ],
         [
             InlineKeyboardButton("❓ Help", callback_data='help')
         ]
     ]
-    return InlineKeyboardMarkup(keyboard)
+    return StaticInlineKeyboardMarkup(keyboard)
+
+def build_static_keyboards():
+    """Build the shared menu keyboards up front so no update pays for them"""
+    create_platform_keyboard()
+    create_category_keyboard()
+    create_deal_type_keyboard()
+    create_main_menu_keyboard()